@@ -0,0 +1,114 @@
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+
+import grpc
+import grpc.aio
+from prometheus_client import Counter, Gauge
+
+GRPC_ACTIVE_STREAMS = Gauge(
+    "grpc_pool_active_streams",
+    "Calls currently leasing a pooled gRPC channel",
+    ["target", "channel"],
+)
+GRPC_RECONNECTS = Counter(
+    "grpc_pool_reconnects", "Pooled gRPC channels replaced after failing", ["target"]
+)
+
+DEFAULT_OPTIONS = (("grpc.lb_policy_name", "round_robin"),)
+
+
+class ChannelPool:
+    """
+    A fixed set of long-lived grpc.aio channels to one target, shared by all
+    handlers of the process instead of opening a channel per request.
+
+    Leases are handed out round-robin. A background task checks every channel
+    and replaces the ones that stay in TRANSIENT_FAILURE (or were shut down)
+    for two consecutive checks.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        stub_class,
+        size: int = 4,
+        options=DEFAULT_OPTIONS,
+        health_check_interval: float = 5.0,
+    ):
+        self.target = target
+        self.stub_class = stub_class
+        self.size = size
+        self.options = options
+        self.health_check_interval = health_check_interval
+
+        self._channels = []
+        self._stubs = []
+        self._failing = []
+        self._next = itertools.cycle(range(size))
+        self._monitor = None
+
+    def _connect(self, i: int):
+        channel = grpc.aio.insecure_channel(self.target, options=self.options)
+        self._channels[i] = channel
+        self._stubs[i] = self.stub_class(channel)
+        self._failing[i] = False
+
+    async def start(self):
+        """Open all channels; must be called from the serving event loop"""
+        if self._channels:
+            return
+
+        self._channels = [None] * self.size
+        self._stubs = [None] * self.size
+        self._failing = [False] * self.size
+        for i in range(self.size):
+            self._connect(i)
+            # Kick off name resolution and the TCP/HTTP2 handshake right away
+            self._channels[i].get_state(try_to_connect=True)
+
+        self._monitor = asyncio.create_task(self._health_check())
+
+    async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+
+        await asyncio.gather(*(channel.close() for channel in self._channels))
+        self._channels = []
+
+    async def _health_check(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for i, channel in enumerate(self._channels):
+                state = channel.get_state(try_to_connect=True)
+                failing = state in (
+                    grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+                    grpc.ChannelConnectivity.SHUTDOWN,
+                )
+
+                if failing and self._failing[i]:
+                    logging.warning(
+                        "Reconnecting channel %s to %s (state %s)", i, self.target, state
+                    )
+                    self._connect(i)
+                    GRPC_RECONNECTS.labels(target=self.target).inc()
+                    # Let calls still running on the old channel finish
+                    asyncio.create_task(channel.close(grace=self.health_check_interval))
+                else:
+                    self._failing[i] = failing
+
+    @asynccontextmanager
+    async def lease(self):
+        """Borrow a stub bound to one of the pooled channels"""
+        if not self._channels:
+            await self.start()
+
+        i = next(self._next)
+        gauge = GRPC_ACTIVE_STREAMS.labels(target=self.target, channel=str(i))
+        gauge.inc()
+        try:
+            yield self._stubs[i]
+        finally:
+            gauge.dec()
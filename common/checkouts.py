@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import List, Optional
+
+import grpc
+
+from channels import DEFAULT_OPTIONS, ChannelPool
+from proto.order_pb2 import CommitCheckoutsRequest
+from proto.order_pb2_grpc import OrderServiceStub
+
+
+# A batch the order service could not take is sent again after RETRY_BASE_S,
+# doubling up to RETRY_MAX_S, until it is. The reservations are already
+# resolved, so the report is the only thing left marking the orders paid, and
+# CommitCheckouts counts every checkout once however often it is reported.
+RETRY_BASE_S = 0.05
+RETRY_MAX_S = 2.0
+
+
+def _backoff(attempt: int) -> float:
+    return min(RETRY_BASE_S * 2**attempt, RETRY_MAX_S)
+
+
+class CheckoutCommitter:
+    """
+    Reports committed checkouts to OrderService.CommitCheckouts in batches,
+    over one long-lived channel. commit() only queues the tid; a background
+    thread sends a batch as soon as max_batch tids are queued, or max_delay
+    seconds after the first one, and keeps sending it until it goes through.
+    """
+
+    def __init__(self, target: str, max_batch: int = 100, max_delay: float = 0.002):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._channel = grpc.insecure_channel(target, options=DEFAULT_OPTIONS)
+        self._stub = OrderServiceStub(self._channel)
+        self._batch: List[str] = []
+        self._ready = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def commit(self, tid: str):
+        with self._ready:
+            self._batch.append(tid)
+            self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                self._ready.wait_for(lambda: self._batch)
+                self._ready.wait_for(
+                    lambda: len(self._batch) >= self.max_batch, self.max_delay
+                )
+                batch = self._batch[: self.max_batch]
+                del self._batch[: self.max_batch]
+
+            attempt = 0
+            while True:
+                try:
+                    self._stub.CommitCheckouts(CommitCheckoutsRequest(tids=batch))
+                    break
+                except grpc.RpcError:
+                    logging.exception(
+                        "Failed to commit orders of transactions %s", batch
+                    )
+                time.sleep(_backoff(attempt))
+                attempt += 1
+
+
+class AsyncCheckoutCommitter:
+    """
+    CheckoutCommitter for asyncio processors: commit() returns once the order
+    service took the batch holding the tid, sent again until it does, so
+    callers keep their concurrency slot (and their stream entry pending)
+    until the order is marked paid.
+    """
+
+    def __init__(self, target: str, max_batch: int = 100, max_delay: float = 0.002):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.channels = ChannelPool(target, OrderServiceStub, size=1)
+        self._batch: List[str] = []
+        self._sent: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending = set()
+
+    async def commit(self, tid: str):
+        if not self._batch:
+            loop = asyncio.get_running_loop()
+            self._sent = loop.create_future()
+            self._timer = loop.call_later(self.max_delay, self._flush)
+
+        self._batch.append(tid)
+        sent = self._sent
+        if len(self._batch) >= self.max_batch:
+            self._flush()
+        await sent
+
+    def _flush(self):
+        self._timer.cancel()
+        batch, sent = self._batch, self._sent
+        self._batch = []
+        task = asyncio.create_task(self._send(batch, sent))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[str], sent: asyncio.Future):
+        attempt = 0
+        try:
+            while True:
+                try:
+                    async with self.channels.lease() as order_client:
+                        await order_client.CommitCheckouts(
+                            CommitCheckoutsRequest(tids=batch)
+                        )
+                    break
+                except grpc.RpcError:
+                    logging.exception(
+                        "Failed to commit orders of transactions %s", batch
+                    )
+                await asyncio.sleep(_backoff(attempt))
+                attempt += 1
+        except asyncio.CancelledError:
+            sent.cancel()
+            raise
+        except Exception as e:
+            # Anything but the order service refusing the batch reaches commit()
+            sent.set_exception(e)
+            return
+        sent.set_result(None)
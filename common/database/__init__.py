@@ -1,8 +1,14 @@
 from .database import DatabaseClient as DatabaseClient
 from .database import TransactionConfig as TransactionConfig
+from .database import ReserveResult as ReserveResult
 from .database import TransactionError as TransactionError
 from .database import OptimisticLockError as OptimisticLockError
+from .database import AsyncClientAdapter as AsyncClientAdapter
 
 from .redis import RedisClient as RedisClient
+from .async_redis import AsyncRedisClient as AsyncRedisClient
+from .redis_hash import RedisHashClient as RedisHashClient
+from .redis_hash import AsyncRedisHashClient as AsyncRedisHashClient
+from .sharded import ShardedRedisClient as ShardedRedisClient
+from .sharded import AsyncShardedRedisClient as AsyncShardedRedisClient
 from .ignite import IgniteClient as IgniteClient
-
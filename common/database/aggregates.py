@@ -0,0 +1,67 @@
+"""
+Recounts the running aggregates read by the Prometheus collectors from the
+models already stored, for data written before the aggregates were kept.
+
+Run from a service container (where `common` is the working directory),
+once per Redis master of the service, while nothing writes to it:
+
+    python -m database.aggregates --host redis-stock --password redis --service stock
+    python -m database.aggregates --host redis-order --password redis --service order
+
+Models are walked with SCAN (iter_models), so the master is never blocked.
+Each aggregate is then overwritten with the total of that master's models.
+"""
+
+import argparse
+import logging
+
+from models import Order, Stock, User
+
+from .redis import RedisClient
+from .redis_hash import RedisHashClient
+
+
+def order_quantity(order: Order) -> int:
+    return sum(int(item.split(":")[1]) for item in order.items)
+
+
+# Per service: aggregate name -> the model it sums and the value of one model,
+# the attribute of the same name when None. mark_paid adds an order on every
+# payment, so it counts paid times here too.
+AGGREGATES = {
+    "stock": {"stock": (Stock, None)},
+    "payment": {"credit": (User, None)},
+    "order": {
+        "revenue": (Order, lambda order: order.total_cost * order.paid),
+        "sold": (Order, lambda order: order_quantity(order) * order.paid),
+    },
+}
+
+
+def rebuild_aggregates(db: RedisClient, service: str, batch_size: int = 1000):
+    totals = {}
+    for name, (model_class, value) in AGGREGATES[service].items():
+        totals[name] = db.rebuild_aggregate(name, model_class, value, batch_size)
+        logging.info("Aggregate %s rebuilt to %s", name, totals[name])
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--db", type=int, default=0)
+    parser.add_argument("--service", choices=list(AGGREGATES), required=True)
+    parser.add_argument("--layout", choices=["keys", "hash"], default="keys")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client_class = RedisHashClient if args.layout == "hash" else RedisClient
+    db = client_class(
+        host=args.host, port=args.port, password=args.password, db=args.db
+    )
+
+    rebuild_aggregates(db, args.service, args.batch_size)
+    db.close()
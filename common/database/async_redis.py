@@ -0,0 +1,434 @@
+from typing import (
+    Callable,
+    List,
+    TypeVar,
+    Type,
+    Optional,
+    Dict,
+    Any,
+    AsyncIterator,
+    Iterable,
+    Tuple,
+)
+from contextlib import asynccontextmanager
+from itertools import islice
+from redis.asyncio.sentinel import Sentinel
+import redis
+import redis.asyncio
+import copy
+import time
+from .database import ReserveResult, TransactionConfig, TransactionError
+from .codec import codec_for
+from .redis import RedisClient
+from .scripts import AsyncFunctionRegistry
+from .stream import AsyncRedisStreamProducer
+
+
+T = TypeVar("T")
+
+
+async def batched_async(items: AsyncIterator, size: int) -> AsyncIterator[list]:
+    """Lists of up to size items of an async iterator, in order"""
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class AsyncRedisClient(RedisClient[T]):
+    """
+    asyncio flavour of RedisClient, built on redis.asyncio.
+
+    Shares the key layout and Lua scripts of RedisClient so both clients can
+    operate on the same data; every command is awaited instead of blocking
+    the event loop. Meant for the Quart handlers and the grpc.aio servicers.
+    """
+
+    script_registry_class = AsyncFunctionRegistry
+    sentinel_class = Sentinel
+    redis_class = redis.asyncio.Redis
+
+    async def replica(self):
+        """Async RedisClient.replica"""
+        if self._sentinel is None:
+            return self
+
+        now = time.monotonic()
+        if now - self._replica_checked >= self.replica_check_interval:
+            self._replica_checked = now
+            try:
+                if self._replica is None:
+                    self._replica, gone = self._pick_replica(
+                        await self._sentinel.discover_slaves(
+                            self._replica_config["master_name"]
+                        ),
+                        self.redis_class,
+                    )
+                    for client in gone:
+                        await client.aclose()
+                master_info = await self.redis.info("replication")
+                info = await self._replica.info("replication") if self._replica else {}
+                self._replica_fresh = self._replica_in_sync(
+                    now, master_info["master_repl_offset"], info
+                )
+            except redis.RedisError:
+                self._replica_fresh = False
+                info = {}
+            if info.get("master_link_status") != "up":
+                self._replica = None
+
+        return self._replica_view() if self._replica_fresh else self
+
+    async def get(self, id: str, model_class: Type[T]) -> Optional[T]:
+        codec = codec_for(model_class)
+        values = await self._get_client().mget(self._get_model_keys(id, codec))
+
+        if any(v is None for v in values):
+            return None
+
+        return codec.decode(id, values)
+
+    async def save(self, model: T) -> None:
+        if not hasattr(model, "id"):
+            raise ValueError("Model must have an id attribute")
+
+        self._prepare_for_changes()
+        codec = codec_for(type(model))
+        keys = self._get_model_keys(model.id, codec)
+
+        await self._mset(self._get_client(), dict(zip(keys, codec.encode(model))))
+
+    async def get_all(
+        self, ids: List[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> List[Optional[T]]:
+        """Load many models with a single pipelined round trip of chunked MGETs"""
+        ids = list(ids)
+        if not ids:
+            return []
+
+        codec = codec_for(model_class)
+        chunks = [ids[i: i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+        if self.pipeline is None:
+            pipeline = self.redis.pipeline(transaction=False)
+            for chunk in chunks:
+                pipeline.mget(self._chunk_keys(chunk, codec))
+            replies = await pipeline.execute()
+        else:
+            replies = [
+                await self.pipeline.mget(self._chunk_keys(chunk, codec))
+                for chunk in chunks
+            ]
+
+        result = []
+        for chunk, values in zip(chunks, replies):
+            result.extend(self._decode_chunk(chunk, values, codec))
+
+        return result
+
+    async def get_all_chunked(
+        self, ids: Iterable[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> AsyncIterator[List[Optional[T]]]:
+        """Yield the models for ids in order with one MGET per chunk_size ids"""
+        client = self._get_client()
+        codec = codec_for(model_class)
+        ids = iter(ids)
+        while chunk := list(islice(ids, chunk_size)):
+            values = await client.mget(self._chunk_keys(chunk, codec))
+            yield self._decode_chunk(chunk, values, codec)
+
+    async def save_all(self, models: List[T]) -> None:
+        if not models:
+            return
+
+        self._prepare_for_changes()
+        await self._mset(self._get_client(), self._encode_all(models))
+
+    async def iter_ids(
+        self, model_class: Type[T], batch: int = 1000
+    ) -> AsyncIterator[str]:
+        """Async RedisClient.iter_ids"""
+        attribute = codec_for(model_class).names[0]
+        suffix = len(attribute) + 1
+        async for key in self.redis.scan_iter(
+            match=self._get_key("*", attribute), count=batch, _type="string"
+        ):
+            yield key[len("model:"): -suffix]
+
+    async def iter_models(
+        self, model_class: Type[T], batch: int = 1000
+    ) -> AsyncIterator[T]:
+        async for ids in batched_async(self.iter_ids(model_class, batch), batch):
+            for model in await self.get_all(ids, model_class):
+                if model is not None:
+                    yield model
+
+    async def keys(self, match: str = "*") -> List[str]:
+        return await self._get_client().keys(match)
+
+    async def delete(self, obj: T) -> bool:
+        keys = self._record_keys(obj.id, type(obj))
+        await self._del(self._get_client(), keys)
+        return True
+
+    async def expire(self, id: str, ttl_ms: int, model_class: Type[T]) -> None:
+        self._prepare_for_changes()
+        await self._expire_script(
+            keys=self._record_keys(id, model_class),
+            args=[ttl_ms],
+            client=self._get_client(),
+        )
+
+    async def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
+        value = await self._get_client().get(self._get_key(id, attribute))
+        return codec_for(model_class).decode_attr(attribute, value)
+
+    async def set_attr(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> None:
+        self._prepare_for_changes()
+
+        key = self._get_key(id, attribute)
+        value = codec_for(model_class).encode_attr(attribute, value)
+        await self._mset(self._get_client(), {key: value})
+
+    async def set_attr_if_absent(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> bool:
+        self._prepare_for_changes()
+        return bool(
+            await self._get_client().set(
+                self._get_key(id, attribute),
+                codec_for(model_class).encode_attr(attribute, value),
+                nx=True,
+            )
+        )
+
+    async def delete_attr(self, id: str, attribute: str) -> None:
+        self._prepare_for_changes()
+        await self._del(self._get_client(), [self._get_key(id, attribute)])
+
+    async def m_get_attr(self, ids: List[str], attribute: str, model_class: Type[T]):
+        keys = [self._get_key(id, attribute) for id in ids]
+        values = await self._get_client().mget(keys)
+
+        # A missing value means one of the models does not exist
+        if any(v is None for v in values):
+            return None
+
+        decode = codec_for(model_class).decode_attr
+        return {id: decode(attribute, value) for id, value in zip(ids, values)}
+
+    async def m_set_attr(
+        self, values: Dict[str, Any], attribute: str, model_class: Type[T]
+    ):
+        encode = codec_for(model_class).encode_attr
+        writes = {
+            self._get_key(id, attribute): encode(attribute, value)
+            for id, value in values.items()
+        }
+
+        await self._mset(self._get_client(), writes)
+
+    async def lte_decrement(
+        self, id: str, attribute: str, amount: int, tid: str
+    ) -> bool:
+        self._prepare_for_changes()
+        key = self._get_key(id, attribute)
+        tidk = self._get_key(tid, "status")
+
+        result = await self._gte_decrement(
+            keys=[tidk, key, self._aggregate_key(attribute)],
+            args=[amount],
+            client=self._get_client(),
+        )
+        return result != -1
+
+    async def m_gte_decrement(
+        self, changes: Dict[str, int], attribute: str, tid: str
+    ) -> bool:
+        if not changes:
+            return False
+
+        self._prepare_for_changes()
+        tidk = self._get_key(tid, "status")
+        keys = [self._get_key(k, attribute) for k in changes]
+
+        result = await self._m_gte_decrement(
+            keys=[tidk, self._aggregate_key(attribute)] + keys,
+            args=list(changes.values()),
+            client=self._get_client(),
+        )
+        return result != -1
+
+    async def increment(self, id: str, attribute: str, amount: int = 1) -> int:
+        self._prepare_for_changes()
+        client = self._get_client()
+        try:
+            result = await self._incrby(client, id, attribute, amount)
+            if self.pipeline is None:
+                return int(result)
+
+            return result
+
+        except redis.ResponseError:
+            raise ValueError(f"Attribute {attribute} is not numeric")
+
+    async def decrement(self, id: str, attribute: str, amount: int = 1) -> int:
+        return await self.increment(id, attribute, -amount)
+
+    async def compare_and_set(
+        self, id: str, attribute: str, expected_value: Any, new_value: Any
+    ) -> bool:
+        key = self._get_key(id, attribute)
+        expected_str = str(expected_value)
+        new_str = str(new_value)
+
+        result = await self._compare_and_set_script(
+            keys=[key], args=[expected_str, new_str], client=self._get_client()
+        )
+        return result == 1
+
+    async def append_and_increment(
+        self,
+        id: str,
+        attribute: str,
+        value: Any,
+        counter: str,
+        amount: int,
+        model_class: Type[T],
+    ) -> Optional[int]:
+        """Async RedisClient.append_and_increment"""
+        self._prepare_for_changes()
+        keys, args = self._append_args(id, attribute, value, counter, amount)
+        return await self._append_script(
+            keys=keys, args=args, client=self._get_client()
+        )
+
+    async def reserve(
+        self,
+        transaction,
+        changes: Dict[str, int],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> ReserveResult:
+        """Async RedisClient.reserve"""
+        if not changes:
+            return ReserveResult.INSUFFICIENT
+
+        self._prepare_for_changes()
+        keys, args = self._reserve_args(
+            transaction, changes, attribute, stream_key, outcome_key
+        )
+        result = await self._reserve_script(
+            keys=keys, args=args, client=self._get_client()
+        )
+
+        if self.pipeline is not None:
+            return result
+
+        return ReserveResult(result)
+
+    async def resolve(
+        self, transaction, changes: Dict[str, int], attribute: str
+    ) -> bool:
+        """Async RedisClient.resolve"""
+        self._prepare_for_changes()
+        keys, args = self._resolve_args(transaction, changes, attribute)
+        result = await self._resolve_script(
+            keys=keys, args=args, client=self._get_client()
+        )
+        return result if self.pipeline is not None else result == 1
+
+    async def reserve_all(
+        self,
+        reservations: List[Tuple[Any, Dict[str, int]]],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> List[ReserveResult]:
+        """Async RedisClient.reserve_all"""
+        pipeline = self.redis.pipeline(transaction=False)
+        for transaction, changes in reservations:
+            if changes:
+                keys, args = self._reserve_args(
+                    transaction, changes, attribute, stream_key, outcome_key
+                )
+                await self._reserve_script(keys=keys, args=args, client=pipeline)
+
+        replies = iter(await pipeline.execute())
+        return [
+            ReserveResult(next(replies)) if changes else ReserveResult.INSUFFICIENT
+            for _, changes in reservations
+        ]
+
+    async def get_counter(self, id: str, attribute: str) -> Optional[int]:
+        value = await self._get_client().get(self._get_key(id, attribute))
+        return None if value is None else int(value)
+
+    async def get_aggregate(self, name: str) -> int:
+        return int(await self._get_client().get(self._aggregate_key(name)) or 0)
+
+    async def increment_aggregate(self, name: str, amount: int) -> None:
+        self._prepare_for_changes()
+        await self._get_client().incrby(self._aggregate_key(name), amount)
+
+    async def rebuild_aggregate(
+        self,
+        name: str,
+        model_class: Type[T],
+        value: Optional[Callable[[T], int]] = None,
+        batch: int = 1000,
+    ) -> int:
+        """Async RedisClient.rebuild_aggregate"""
+        value = value or (lambda model: getattr(model, name))
+        total = 0
+        async for model in self.iter_models(model_class, batch):
+            total += value(model)
+        await self.redis.set(self._aggregate_key(name), total)
+        return total
+
+    async def close(self):
+        """Close the Redis client connection"""
+        await self.redis.aclose()
+        for client in self._replica_clients.values():
+            await client.aclose()
+
+    @asynccontextmanager
+    async def transaction(self, config: TransactionConfig = TransactionConfig()):
+        pipeline = self._get_client().pipeline()
+        try:
+            for id, attr in config.begin.get("watch", []):
+                await pipeline.watch(self._get_key(id, attr))
+
+            client = copy.copy(self)
+            client.pipeline = pipeline
+
+            yield client
+            await pipeline.execute()
+            await pipeline.unwatch()
+
+        except Exception as e:
+            await pipeline.unwatch()
+            await pipeline.reset()
+            raise TransactionError(e)
+
+    def pipeline(self):
+        client = copy.copy(self)
+        client.pipeline = self._get_client().pipeline()
+
+        return client
+
+    async def execute_pipeline(self):
+        if self.pipeline is None:
+            raise ValueError("No pipeline to execute")
+
+        return await self.pipeline.execute()
+
+    def get_stream_producer(self, stream_key):
+        return AsyncRedisStreamProducer(self.redis, stream_key)
@@ -0,0 +1,112 @@
+from dataclasses import MISSING, fields
+from enum import Enum
+import json
+from typing import Any, Callable, Dict, List, Optional, Type, TypeVar, get_origin
+
+T = TypeVar("T")
+
+
+def _identity(value):
+    return value
+
+
+def _decode_bool(value: str) -> bool:
+    return value.lower() == "true"
+
+
+def _decoder_for(field_type: Type) -> Callable[[str], Any]:
+    """Same rules as DatabaseClient._deserialize_value, resolved ahead of time"""
+    if get_origin(field_type) is list or field_type is dict:
+        return json.loads
+    elif isinstance(field_type, type) and issubclass(field_type, Enum):
+        return lambda value: field_type(int(value))
+    elif field_type is int:
+        return int
+    elif field_type is float:
+        return float
+    elif field_type is bool:
+        return _decode_bool
+    return _identity
+
+
+def _encoder_for(field_type: Type) -> Callable[[Any], str]:
+    """Same rules as DatabaseClient._serialize_value, resolved ahead of time"""
+    if get_origin(field_type) is list or field_type is dict:
+        return json.dumps
+    return str
+
+
+def _default_for(field) -> Callable[[], Any]:
+    if field.default is not MISSING:
+        default = field.default
+        return lambda: default
+    elif field.default_factory is not MISSING:
+        return field.default_factory
+    return lambda: MISSING
+
+
+class ModelCodec:
+    """
+    Field names, encoders, decoders and defaults of a model dataclass,
+    computed once so the database clients do not reflect on every call.
+
+    Values are always handled as lists aligned with `names`, i.e. every
+    dataclass field except `id`, in declaration order.
+    """
+
+    def __init__(self, model_class: Type[T]):
+        annotations = model_class.__annotations__
+        model_fields = [f for f in fields(model_class) if f.name != "id"]
+
+        self.model_class = model_class
+        self.names: List[str] = [f.name for f in model_fields]
+        self.index: Dict[str, int] = {n: i for i, n in enumerate(self.names)}
+        self.decoders = [_decoder_for(annotations[n]) for n in self.names]
+        self.encoders = [_encoder_for(annotations[n]) for n in self.names]
+        self.defaults = [_default_for(f) for f in model_fields]
+        self._fields = list(zip(self.names, self.decoders, self.defaults))
+        # Attributes stored with a record that are not fields of the model
+        self.extras: List[str] = list(getattr(model_class, "record_extras", ()))
+
+    def encode(self, model: T) -> List[str]:
+        return [
+            encode(getattr(model, name))
+            for name, encode in zip(self.names, self.encoders)
+        ]
+
+    def decode(self, id: str, values: List[Optional[str]]) -> Optional[T]:
+        """Build a model, filling missing values with field defaults.
+        Returns None if a field without a default is missing."""
+        data = {
+            name: default() if value is None else decode(value)
+            for (name, decode, default), value in zip(self._fields, values)
+        }
+        if any(v is MISSING for v in data.values()):
+            return None
+
+        return self.model_class(id=id, **data)
+
+    def encode_attr(self, attribute: str, value: Any) -> str:
+        i = self.index.get(attribute)
+        return str(value) if i is None else self.encoders[i](value)
+
+    def decode_attr(self, attribute: str, value: Optional[str]) -> Any:
+        i = self.index.get(attribute)
+        if i is None:
+            return value
+        if value is None:
+            default = self.defaults[i]()
+            return None if default is MISSING else default
+
+        return self.decoders[i](value)
+
+
+_codecs: Dict[type, ModelCodec] = {}
+
+
+def codec_for(model_class: Type[T]) -> ModelCodec:
+    """Return the codec of a model class, compiling it on first use"""
+    codec = _codecs.get(model_class)
+    if codec is None:
+        codec = _codecs[model_class] = ModelCodec(model_class)
+    return codec
@@ -1,8 +1,22 @@
 from enum import Enum
+import asyncio
 import json
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, get_origin
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    TypeVar,
+    get_origin,
+)
 
 
 from .stream import RedisStreamProducer
@@ -26,6 +40,14 @@ class TransactionConfig:
         self.end = rollback or {}
 
 
+class ReserveResult(Enum):
+    """Outcome of an atomic reservation (see RedisClient.reserve)"""
+
+    OK = 1
+    INSUFFICIENT = -1
+    STALE = -2
+
+
 class TransactionError(Exception):
     pass
 
@@ -74,6 +96,28 @@ class DatabaseClient(ABC, Generic[T]):
     def get_all(self, ids: List[str], model_class: Type[T]) -> List[Optional[T]]:
         pass
 
+    def get_all_chunked(
+        self, ids: Iterable[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> Iterator[List[Optional[T]]]:
+        """Yield the models for ids in order, chunk_size at a time"""
+        ids = iter(ids)
+        while chunk := list(islice(ids, chunk_size)):
+            yield self.get_all(chunk, model_class)
+
+    @abstractmethod
+    def iter_ids(self, model_class: Type[T], batch: int = 1000) -> Iterator[str]:
+        """
+        Ids of every model_class record, walked with a cursor batch records at
+        a time instead of listing them all at once
+        """
+        pass
+
+    def iter_models(self, model_class: Type[T], batch: int = 1000) -> Iterator[T]:
+        """Every model_class record, fetched batch at a time (see iter_ids)"""
+        ids = self.iter_ids(model_class, batch)
+        for models in self.get_all_chunked(ids, model_class, batch):
+            yield from (model for model in models if model is not None)
+
     @abstractmethod
     def save_all(self, models: List[T]) -> None:
         pass
@@ -82,6 +126,11 @@ class DatabaseClient(ABC, Generic[T]):
     def delete(self, id: str) -> bool:
         pass
 
+    @abstractmethod
+    def expire(self, id: str, ttl_ms: int, model_class: Type[T]) -> None:
+        """Have the record of id deleted by the database after ttl_ms"""
+        pass
+
     @abstractmethod
     def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
         pass
@@ -130,6 +179,58 @@ class DatabaseClient(ABC, Generic[T]):
     def m_gte_decrement(self, changes: Dict[str, int], attribute: str) -> bool:
         pass
 
+    @abstractmethod
+    def append_and_increment(
+        self,
+        id: str,
+        attribute: str,
+        value: Any,
+        counter: str,
+        amount: int,
+        model_class: Type[T],
+    ) -> Optional[int]:
+        """Atomically append to a list attribute and add to a counter of id;
+        returns the new counter, None if id has no such counter"""
+        pass
+
+    def replica(self) -> "DatabaseClient":
+        """A client for reads that tolerate stale data; the primary by default"""
+        return self
+
+    def publish(self, channel: str, message: str):
+        """Announce a message on a pub/sub channel; dropped without pub/sub"""
+        pass
+
+    def shard_counter(self, id: str, attribute: str, shards: int) -> Optional[int]:
+        """Split a counter over several masters, see ShardedRedisClient"""
+        raise NotImplementedError("Sharded counters need several Redis masters")
+
+    def get_counter(self, id: str, attribute: str) -> Optional[int]:
+        """The total of a counter, whether it is sharded or not"""
+        raise NotImplementedError("Counters are only supported by Redis")
+
+    def resolve(self, transaction, changes: Dict[str, int], attribute: str) -> bool:
+        """Apply a reservation's outcome and delete it (see RedisClient.resolve)"""
+        raise NotImplementedError("Reservations are only supported by Redis")
+
+    def get_aggregate(self, name: str) -> int:
+        """A running total over every model (see RedisClient.get_aggregate)"""
+        raise NotImplementedError("Aggregates are only kept by Redis")
+
+    def increment_aggregate(self, name: str, amount: int) -> None:
+        """Add to a running total no write keeps by itself; dropped without Redis"""
+        pass
+
+    def rebuild_aggregate(
+        self,
+        name: str,
+        model_class: Type[T],
+        value: Optional[Callable[[T], int]] = None,
+        batch: int = 1000,
+    ) -> int:
+        """Recount a running total (see RedisClient.rebuild_aggregate)"""
+        raise NotImplementedError("Aggregates are only kept by Redis")
+
     @abstractmethod
     def close(self):
         """Close the database client connection"""
@@ -140,3 +241,27 @@ class DatabaseClient(ABC, Generic[T]):
 
     def initialize_stream_processor(self, processor_class):
         return processor_class(self.redis)
+
+
+class AsyncClientAdapter:
+    """
+    Exposes a synchronous DatabaseClient through awaitable methods by running
+    each call in the default executor. Used for backends without a native
+    asyncio driver (Ignite) so async handlers can treat every client alike.
+    """
+
+    def __init__(self, client: DatabaseClient):
+        self.client = client
+
+    async def replica(self):
+        return self
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        return call
@@ -1,6 +1,17 @@
 from abc import ABC, abstractmethod
 import logging
-from typing import List, TypeVar, Generic, Type, Optional, Dict, Any, cast, get_origin
+from typing import (
+    List,
+    TypeVar,
+    Generic,
+    Type,
+    Optional,
+    Dict,
+    Any,
+    Iterator,
+    cast,
+    get_origin,
+)
 from dataclasses import MISSING, asdict, fields
 from contextlib import contextmanager
 import random
@@ -139,6 +150,36 @@ class IgniteClient(DatabaseClient[T]):
         self.cache.remove_all(keys)
         return True
 
+    def iter_ids(self, model_class: Type[T], batch: int = 1000) -> Iterator[str]:
+        # A scan query pages through the cache; the records of model_class are
+        # the keys of its first field, as in RedisClient.iter_ids
+        field = next(f.name for f in fields(model_class) if f.name != "id")
+        suffix = f":{field}"
+        with self.cache.scan(page_size=batch) as cursor:
+            for key, _ in cursor:
+                if key.startswith("model:") and key.endswith(suffix):
+                    yield key[len("model:"): -len(suffix)]
+
+    def iter_models(self, model_class: Type[T], batch: int = 1000) -> Iterator[T]:
+        # get_all is not implemented, so every record is read on its own
+        for id in self.iter_ids(model_class, batch):
+            model = self.get(id, model_class)
+            if model is not None:
+                yield model
+
+    def expire(self, id: str, ttl_ms: int, model_class: Type[T]) -> None:
+        # Entries only expire when written through a cache with an expiry
+        # policy, so the record is written again through one
+        attributes = [f.name for f in fields(model_class) if f.name != "id"]
+        values = self.cache.get_all([self._get_key(id, a) for a in attributes])
+        updates = {
+            key: (values[key], self._value_hint(model_class, attribute))
+            for attribute in attributes
+            if (key := self._get_key(id, attribute)) in values
+        }
+        if updates:
+            self.cache.with_expire_policy(update=ttl_ms).put_all(updates)
+
     def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
         key = self._get_key(id, attribute)
         value = self.cache.get(key, key_hint=itypes_standard.String)
@@ -360,6 +401,45 @@ class IgniteClient(DatabaseClient[T]):
         ) as tx_client:
             return tx_client._m_gte_decrement_transaction(changes, attribute)
 
+    def _append_and_increment_transaction(
+        self,
+        id: str,
+        attribute: str,
+        value: Any,
+        counter: str,
+        amount: int,
+        model_class: Type[T],
+    ) -> Optional[int]:
+        if self.cache.get(self._get_key(id, counter)) is None:
+            return None
+
+        values = self.get_attr(id, attribute, model_class) or []
+        self.set_attr(id, attribute, list(values) + [value], model_class)
+        return self._simple_increment(id, counter, amount)
+
+    def append_and_increment(
+        self,
+        id: str,
+        attribute: str,
+        value: Any,
+        counter: str,
+        amount: int,
+        model_class: Type[T],
+    ) -> Optional[int]:
+        args = (id, attribute, value, counter, amount, model_class)
+        if self.tx is not None:
+            return self._append_and_increment_transaction(*args)
+
+        with self.transaction(
+            TransactionConfig(
+                init={
+                    "isolation": TransactionIsolation.SERIALIZABLE,
+                    "concurrency": TransactionConcurrency.PESSIMISTIC,
+                }
+            )
+        ) as tx_client:
+            return tx_client._append_and_increment_transaction(*args)
+
     @contextmanager
     def transaction(
         self,
@@ -0,0 +1,132 @@
+"""
+Migrates models between the per-attribute key layout (`model:{id}:{attr}`,
+RedisClient) and the hash-per-model layout (`model:{id}`, RedisHashClient).
+
+Run from a service container (where `common` is the working directory):
+
+    python -m database.migrate --host redis-stock --password redis --to hash
+    python -m database.migrate --host redis-stock --password redis --to keys
+
+Keys are walked with SCAN and written/deleted in pipelined batches, so the
+migration can run against a live master without blocking it. Existing
+records in the target layout are overwritten field by field.
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from typing import Dict
+
+import redis
+
+KEYS_LAYOUT_PATTERN = "model:*:*"
+HASH_LAYOUT_PATTERN = "model:*"
+
+
+def _flush_to_hash(
+    client: redis.Redis, batch: Dict[str, Dict[str, str]], delete: bool
+):
+    pipeline = client.pipeline(transaction=False)
+    for id, mapping in batch.items():
+        pipeline.hset(f"model:{id}", mapping=mapping)
+        if delete:
+            pipeline.delete(*[f"model:{id}:{attr}" for attr in mapping])
+    pipeline.execute()
+
+
+def migrate_to_hash(
+    client: redis.Redis, batch_size: int = 1000, delete: bool = True
+):
+    migrated = 0
+    keys = []
+
+    def flush(keys):
+        values = client.mget(keys)
+        batch = defaultdict(dict)
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            _, id, attr = key.split(":", 2)
+            batch[id][attr] = value
+        _flush_to_hash(client, batch, delete)
+        return len(keys)
+
+    for key in client.scan_iter(
+        match=KEYS_LAYOUT_PATTERN, count=batch_size, _type="string"
+    ):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            migrated += flush(keys)
+            keys = []
+
+    if keys:
+        migrated += flush(keys)
+
+    logging.info("Moved %s attribute keys into model hashes", migrated)
+    return migrated
+
+
+def migrate_to_keys(
+    client: redis.Redis, batch_size: int = 1000, delete: bool = True
+):
+    migrated = 0
+    keys = []
+
+    def flush(keys):
+        pipeline = client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(key)
+        hashes = pipeline.execute()
+
+        pipeline = client.pipeline(transaction=False)
+        for key, mapping in zip(keys, hashes):
+            if mapping:
+                pipeline.mset({f"{key}:{attr}": v for attr, v in mapping.items()})
+            if delete:
+                pipeline.delete(key)
+        pipeline.execute()
+        return len(keys)
+
+    for key in client.scan_iter(
+        match=HASH_LAYOUT_PATTERN, count=batch_size, _type="hash"
+    ):
+        if key.count(":") != 1:
+            continue
+        keys.append(key)
+        if len(keys) >= batch_size:
+            migrated += flush(keys)
+            keys = []
+
+    if keys:
+        migrated += flush(keys)
+
+    logging.info("Split %s model hashes into attribute keys", migrated)
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--db", type=int, default=0)
+    parser.add_argument("--to", choices=["hash", "keys"], required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--keep", action="store_true", help="Do not delete the source keys"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = redis.Redis(
+        host=args.host,
+        port=args.port,
+        password=args.password,
+        db=args.db,
+        decode_responses=True,
+    )
+
+    if args.to == "hash":
+        migrate_to_hash(client, args.batch_size, not args.keep)
+    else:
+        migrate_to_keys(client, args.batch_size, not args.keep)
@@ -1,18 +1,45 @@
-from typing import List, TypeVar, Type, Optional, Dict, Any
-from dataclasses import MISSING, asdict, fields
+from typing import (
+    Callable,
+    List,
+    TypeVar,
+    Type,
+    Optional,
+    Dict,
+    Any,
+    Iterable,
+    Iterator,
+    Tuple,
+)
+from collections import deque
 from contextlib import contextmanager
+from itertools import islice
 from redis.sentinel import Sentinel
 import redis
 import copy
+import json
+import random
+import time
 from .database import (
     DatabaseClient,
+    ReserveResult,
     TransactionConfig,
     TransactionError,
 )
+from .codec import ModelCodec, codec_for
+from .scripts import FunctionRegistry
 
 
 T = TypeVar("T")
 
+# Running sums of these attributes over every model, kept in AGGREGATE_KEY by
+# each write to them (in the same script or MULTI as the write), so reading
+# the total is O(1) however many models there are. Every Redis master keeps
+# the aggregates of the models it holds.
+AGGREGATED_ATTRIBUTES = frozenset({"stock", "credit"})
+AGGREGATE_KEY = "aggregate:{}"
+
+# KEYS[1] = transaction status, KEYS[2] = counter, KEYS[3] = its aggregate
+# ARGV[1] = amount
 LTE_DECREMENT_SCRIPT = """
 local current = tonumber(redis.call('get', KEYS[2]))
 if current == nil then
@@ -21,39 +48,68 @@ if current == nil then
 end
 if tonumber(ARGV[1]) <= current then
     redis.call('set', KEYS[1], 2)
+    redis.call('decrby', KEYS[3], ARGV[1])
     return redis.call('decrby', KEYS[2], ARGV[1])
 end
 redis.call('set', KEYS[1], 1)
 return -1
 """
 
+# KEYS[1] = transaction status, KEYS[2] = aggregate, KEYS[3..] = counters
+# ARGV[1..] = amounts
 M_GTE_DECREMENT_SCRIPT = """
-local all_valid = true
-
 -- First check all values
-for i, key in ipairs(KEYS) do
-    if i > 1 then
-        local current = tonumber(redis.call('get', key))
-        if current == nil or tonumber(ARGV[i - 1]) > current then
-            all_valid = false
-            break
-        end
+for i = 3, #KEYS do
+    local current = tonumber(redis.call('get', KEYS[i]))
+    if current == nil or tonumber(ARGV[i - 2]) > current then
+        redis.call('set', KEYS[1], 1)
+        return -1
     end
 end
 
-if all_valid then
-    for i, key in ipairs(KEYS) do
-        if i > 1 then
-            redis.call('decrby', key, ARGV[i - 1])
-        end
-    end
-    redis.call('set', KEYS[1], 2)
-    return 1
-else
-    redis.call('set', KEYS[1], 1)
+local total = 0
+for i = 3, #KEYS do
+    redis.call('decrby', KEYS[i], ARGV[i - 2])
+    total = total + tonumber(ARGV[i - 2])
 end
+redis.call('decrby', KEYS[2], total)
+redis.call('set', KEYS[1], 2)
+return 1
+"""
 
-return -1
+# INCRBY that adds the amount to the aggregate of the counter too
+# KEYS[1] = counter, KEYS[2] = its aggregate, ARGV[1] = amount
+AGGREGATED_INCREMENT_SCRIPT = """
+local value = redis.call('incrby', KEYS[1], ARGV[1])
+redis.call('incrby', KEYS[2], ARGV[1])
+return value
+"""
+
+# MSET that adds the change of every aggregated key to its aggregate
+# KEYS[1..n] = keys, the m aggregated ones first, KEYS[n+1..n+m] = aggregates
+# ARGV[1..n] = values
+AGGREGATED_SET_SCRIPT = """
+local n = #ARGV
+for i = 1, #KEYS - n do
+    local old = tonumber(redis.call('get', KEYS[i])) or 0
+    redis.call('incrby', KEYS[n + i], tonumber(ARGV[i]) - old)
+end
+for i = 1, n do
+    redis.call('set', KEYS[i], ARGV[i])
+end
+"""
+
+# DEL that takes the value of every aggregated key off its aggregate
+# KEYS[1..n] = keys, the m aggregated ones first, KEYS[n+1..n+m] = aggregates
+# ARGV[1] = m
+AGGREGATED_DELETE_SCRIPT = """
+local m = tonumber(ARGV[1])
+local n = #KEYS - m
+for i = 1, m do
+    local old = tonumber(redis.call('get', KEYS[i])) or 0
+    redis.call('decrby', KEYS[n + i], old)
+end
+return redis.call('del', unpack(KEYS, 1, n))
 """
 
 COMPARE_AND_SET_SCRIPT = """
@@ -66,8 +122,130 @@ else
 end
 """
 
+# Stale check, transaction record, stream entry and conditional decrement of
+# every item in one atomic call. ARGV[n+3] holds the reserve_flags: whether the
+# tid is pushed to the stream, and whether the final status is published to
+# the outcome stream.
+# KEYS[1..n] = transaction attribute keys (status first), KEYS[n+1] = stream,
+# KEYS[n+2] = outcome stream, KEYS[n+3] = aggregate, KEYS[n+4..] = keys to
+# decrement
+# ARGV[1] = n, ARGV[2..n+1] = transaction values, ARGV[n+2] = tid,
+# ARGV[n+3] = flags, ARGV[n+4..] = amounts
+RESERVE_SCRIPT = """
+local n = tonumber(ARGV[1])
+
+-- 3 = TransactionStatus.STALE, written by VibeCheckTransactionStatus
+if redis.call('get', KEYS[1]) == '3' then
+    return -2
+end
+
+for i = 1, n do
+    redis.call('set', KEYS[i], ARGV[i + 1])
+end
+
+-- 1 = push the tid to the transactions stream, 2 = publish the outcome
+local flags = tonumber(ARGV[n + 3])
+if flags % 2 == 1 then
+    redis.call('xadd', KEYS[n + 1], '*', 'tid', ARGV[n + 2])
+end
+
+local function finish(status)
+    redis.call('set', KEYS[1], status)
+    if flags >= 2 then
+        redis.call('xadd', KEYS[n + 2], '*', 'tid', ARGV[n + 2], 'status', status)
+    end
+end
+
+for i = n + 4, #KEYS do
+    local current = tonumber(redis.call('get', KEYS[i]))
+    if current == nil or tonumber(ARGV[i]) > current then
+        finish(1)
+        return -1
+    end
+end
+
+local total = 0
+for i = n + 4, #KEYS do
+    redis.call('decrby', KEYS[i], ARGV[i])
+    total = total + tonumber(ARGV[i])
+end
+redis.call('decrby', KEYS[n + 3], total)
+finish(2)
+return 1
+"""
+
+# Append to a JSON list attribute in place, without decoding the list, and
+# add to a counter attribute of the same model. The counter doubles as the
+# existence check.
+# KEYS[1] = list attribute, KEYS[2] = counter attribute
+# ARGV[1] = JSON encoded element, ARGV[2] = amount
+APPEND_AND_INCREMENT_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 0 then
+    return false
+end
+
+local length = redis.call('strlen', KEYS[1])
+if length <= 2 then
+    redis.call('set', KEYS[1], '[' .. ARGV[1] .. ']')
+else
+    redis.call('setrange', KEYS[1], length - 1, ', ' .. ARGV[1] .. ']')
+end
+return redis.call('incrby', KEYS[2], ARGV[2])
+"""
+
+# Give every key of a record the same time to live, in one call however many
+# keys the layout spreads it over
+# KEYS = keys of the record, ARGV[1] = time to live in milliseconds
+EXPIRE_SCRIPT = """
+for i = 1, #KEYS do
+    redis.call('pexpire', KEYS[i], ARGV[1])
+end
+"""
+
+# Resolve a reservation in one call: unless the transaction record is gone,
+# is not locked or no longer has the status it was read with, add the amounts
+# to their counters (and ARGV[4] to the aggregate, unless it is 0) and delete
+# the record.
+# KEYS[1] = status, KEYS[2] = locked, KEYS[3..n+2] = keys of the record,
+# KEYS[n+3] = aggregate, KEYS[n+4..] = counters
+# ARGV[1] = n, ARGV[2] = status, ARGV[3] = locked, ARGV[4] = aggregate amount,
+# ARGV[5..] = amounts
+RESOLVE_SCRIPT = """
+local n = tonumber(ARGV[1])
+if redis.call('get', KEYS[1]) ~= ARGV[2]
+        or redis.call('get', KEYS[2]) ~= ARGV[3] then
+    return 0
+end
+
+for i = n + 4, #KEYS do
+    redis.call('incrby', KEYS[i], ARGV[i - n + 1])
+end
+if ARGV[4] ~= '0' then
+    redis.call('incrby', KEYS[n + 3], ARGV[4])
+end
+redis.call('del', unpack(KEYS, 3, n + 2))
+return 1
+"""
+
+def reserve_flags(stream_key: Optional[str], outcome_key: Optional[str]) -> int:
+    """Which streams the reserve scripts write to"""
+    return (1 if stream_key else 0) | (2 if outcome_key else 0)
+
 
 class RedisClient(DatabaseClient[T]):
+    # Sentinel replica read by replica(), kept until a check fails, and whether
+    # it was recent enough when last checked, at most every
+    # replica_check_interval seconds
+    _sentinel = None
+    _replica = None
+    _replica_fresh = False
+    _replica_checked = 0.0
+    replica_check_interval = 1.0
+    script_registry_class = FunctionRegistry
+    # Clients of the master, through Sentinel or directly
+    sentinel_class = Sentinel
+    redis_class = redis.Redis
+
     def __init__(
         self,
         sentinel_hosts: str = None,  # e.g., "sentinel1:26379,sentinel2:26379,sentinel3:26379"
@@ -77,13 +255,24 @@ class RedisClient(DatabaseClient[T]):
         password: str = "",
         db: int = 0,
         pipeline=None,
+        replica_max_lag: Optional[float] = None,
     ):
+        self.replica_max_lag = replica_max_lag
+        # (time, master_repl_offset) of the master at the replica checks of the
+        # last replica_max_lag seconds
+        self._master_offsets = deque()
+        # (host, port) -> client of every replica picked by replica()
+        self._replica_clients = {}
+        # Installed as Redis functions whenever a connection to the master opens
+        self.scripts = self.script_registry_class()
+        self._register_scripts()
+
         if pipeline:
             self.pipeline = pipeline
 
         elif sentinel_hosts and master_name:
             # Initialize with Sentinel
-            sentinel = Sentinel(
+            sentinel = self.sentinel_class(
                 [(h.split(":")[0], int(h.split(":")[1]))
                  for h in sentinel_hosts.split(",")],
                 socket_timeout=1,
@@ -94,33 +283,132 @@ class RedisClient(DatabaseClient[T]):
                 db=db,
                 decode_responses=True,
                 retry_on_timeout=True,  # Retry if the connection times out
+                redis_connect_func=self.scripts.on_connect,
             )
-            self.pipeline: Optional[redis.client.Pipeline] = None
-            self._register_scripts()
+            if replica_max_lag is not None:
+                self._sentinel = sentinel
+                self._replica_config = dict(
+                    master_name=master_name, password=password, db=db
+                )
+            self.pipeline = None
 
         else:
-            self.redis = redis.Redis(
-                host=host, port=port, password=password, db=db, decode_responses=True
+            self.redis = self.redis_class(
+                host=host,
+                port=port,
+                password=password,
+                db=db,
+                decode_responses=True,
+                redis_connect_func=self.scripts.on_connect,
             )
-            self.pipeline: Optional[redis.client.Pipeline] = None
-
-            # Register Lua scripts when initializing the client
-            self._register_scripts()
+            self.pipeline = None
 
     def _register_scripts(self):
-        """Register all Lua scripts and store their SHA1 digests"""
-        if hasattr(self, "redis"):
-            self._gte_decrement = self.redis.register_script(
-                LTE_DECREMENT_SCRIPT)
-            self._m_gte_decrement = self.redis.register_script(
-                M_GTE_DECREMENT_SCRIPT)
-            self._compare_and_set_script = self.redis.register_script(
-                COMPARE_AND_SET_SCRIPT
-            )
+        """Register all Lua scripts with the registry loaded on connect"""
+        self._gte_decrement = self.scripts.register(LTE_DECREMENT_SCRIPT)
+        self._m_gte_decrement = self.scripts.register(M_GTE_DECREMENT_SCRIPT)
+        self._compare_and_set_script = self.scripts.register(COMPARE_AND_SET_SCRIPT)
+        self._reserve_script = self.scripts.register(RESERVE_SCRIPT)
+        self._append_script = self.scripts.register(APPEND_AND_INCREMENT_SCRIPT)
+        self._expire_script = self.scripts.register(EXPIRE_SCRIPT)
+        self._increment_script = self.scripts.register(AGGREGATED_INCREMENT_SCRIPT)
+        self._set_script = self.scripts.register(AGGREGATED_SET_SCRIPT)
+        self._delete_script = self.scripts.register(AGGREGATED_DELETE_SCRIPT)
+        self._resolve_script = self.scripts.register(RESOLVE_SCRIPT)
 
     def _get_client(self):
         return self.pipeline if self.pipeline is not None else self.redis
 
+    def _pick_replica(self, replicas: List[Tuple[str, int]], client_class):
+        """
+        A client of one of the replicas Sentinel lists, None without any, and
+        the clients of the replicas it no longer lists, for the caller to
+        close. Unlike a slave_for pool, which moves between replicas from one
+        connection to the next, reads then go to the replica that was checked.
+        A replica picked again gets the client it had before.
+        """
+        listed = {(host, int(port)) for host, port in replicas}
+        gone = [
+            self._replica_clients.pop(address)
+            for address in list(self._replica_clients)
+            if address not in listed
+        ]
+        if not listed:
+            return None, gone
+
+        address = random.choice(sorted(listed))
+        if address not in self._replica_clients:
+            self._replica_clients[address] = client_class(
+                host=address[0],
+                port=address[1],
+                password=self._replica_config["password"],
+                db=self._replica_config["db"],
+                decode_responses=True,
+                retry_on_timeout=True,
+            )
+        return self._replica_clients[address], gone
+
+    def _replica_in_sync(self, now: float, master_offset: int, info) -> bool:
+        """
+        Whether the replica applied everything the master had written
+        replica_max_lag seconds ago: its slave_repl_offset has reached the
+        master_repl_offset of a check at most that old. The lag is only known
+        to within replica_check_interval, as the master's offset is read at
+        the checks alone.
+        """
+        offsets = self._master_offsets
+        offsets.append((now, master_offset))
+        while now - offsets[0][0] > self.replica_max_lag:
+            offsets.popleft()
+
+        applied = info.get("slave_repl_offset", -1)
+        return info.get("master_link_status") == "up" and any(
+            offset <= applied for _, offset in offsets
+        )
+
+    def _replica_view(self):
+        view = copy.copy(self)
+        view.redis = self._replica
+        view.pipeline = None
+        return view
+
+    def replica(self):
+        """
+        This client with its reads served by a Sentinel replica, for read
+        paths that tolerate data up to replica_max_lag seconds old. Returns
+        the client itself when replica reads are disabled, when there is no
+        replica, or when it is unreachable or further behind its master than
+        that (see _replica_in_sync). A replica that is unreachable or lost
+        its link to the master is dropped, and another one picked at the next
+        check. Writes through the replica fail.
+        """
+        if self._sentinel is None:
+            return self
+
+        now = time.monotonic()
+        if now - self._replica_checked >= self.replica_check_interval:
+            self._replica_checked = now
+            try:
+                if self._replica is None:
+                    self._replica, gone = self._pick_replica(
+                        self._sentinel.discover_slaves(
+                            self._replica_config["master_name"]
+                        ),
+                        self.redis_class,
+                    )
+                    for client in gone:
+                        client.close()
+                master_offset = self.redis.info("replication")["master_repl_offset"]
+                info = self._replica.info("replication") if self._replica else {}
+                self._replica_fresh = self._replica_in_sync(now, master_offset, info)
+            except redis.RedisError:
+                self._replica_fresh = False
+                info = {}
+            if info.get("master_link_status") != "up":
+                self._replica = None
+
+        return self._replica_view() if self._replica_fresh else self
+
     def _get_key(self, id: str, attribute: str) -> str:
         return f"model:{id}:{attribute}"
 
@@ -133,134 +421,174 @@ class RedisClient(DatabaseClient[T]):
         elif not self.pipeline.explicit_transaction:
             self.pipeline.multi()
 
-    def get(self, id: str, model_class: Type[T]) -> Optional[T]:
-        client = self._get_client()
-
-        keys = [
-            self._get_key(id, field.name)
-            for field in fields(model_class)
-            if field.name != "id"
+    def _get_model_keys(self, id: str, codec: ModelCodec) -> List[str]:
+        prefix = f"model:{id}:"
+        return [prefix + name for name in codec.names]
+
+    def _aggregate_key(self, attribute: str) -> str:
+        return AGGREGATE_KEY.format(attribute)
+
+    def _mset(self, client, kvs: Dict[str, str]):
+        """MSET of attribute keys, through AGGREGATED_SET_SCRIPT if any is aggregated"""
+        attributes = {key: key.rsplit(":", 1)[1] for key in kvs}
+        aggregated = [k for k, a in attributes.items() if a in AGGREGATED_ATTRIBUTES]
+        if not aggregated:
+            return client.mset(kvs)
+
+        keys = aggregated + [k for k in kvs if k not in aggregated]
+        return self._set_script(
+            keys=keys + [self._aggregate_key(attributes[k]) for k in aggregated],
+            args=[kvs[k] for k in keys],
+            client=client,
+        )
+
+    def _del(self, client, keys: List[str]):
+        """DEL of keys, through AGGREGATED_DELETE_SCRIPT if any is aggregated"""
+        aggregated = [k for k in keys if k.rsplit(":", 1)[1] in AGGREGATED_ATTRIBUTES]
+        if not aggregated:
+            return client.delete(*keys)
+
+        keys = aggregated + [k for k in keys if k not in aggregated]
+        return self._delete_script(
+            keys=keys + [self._aggregate_key(k.rsplit(":", 1)[1]) for k in aggregated],
+            args=[len(aggregated)],
+            client=client,
+        )
+
+    def _incrby(self, client, id: str, attribute: str, amount: int):
+        key = self._get_key(id, attribute)
+        if attribute not in AGGREGATED_ATTRIBUTES:
+            return client.incrby(key, amount)
+        return self._increment_script(
+            keys=[key, self._aggregate_key(attribute)], args=[amount], client=client
+        )
+
+    def _record_keys(self, id: str, model_class: Type[T]) -> List[str]:
+        """Every key of the record of id, its extras (ModelCodec.extras) too"""
+        codec = codec_for(model_class)
+        return self._get_model_keys(id, codec) + [
+            self._get_key(id, extra) for extra in codec.extras
         ]
-        if not keys:
-            return None
 
-        values = client.mget(keys)
-        attributes = {key.split(":")[-1]: value for key,
-                      value in zip(keys, values)}
+    def _scan_ids(self, attribute: str, count: int) -> Iterator[str]:
+        """Ids of the models with attribute, found with SCAN (see retention.py)"""
+        suffix = len(attribute) + 1
+        for key in self.redis.scan_iter(
+            match=self._get_key("*", attribute), count=count, _type="string"
+        ):
+            yield key[len("model:"): -suffix]
 
-        converted_data = {"id": id}
-        annotations = model_class.__annotations__
+    def _queue_get_attrs(self, pipeline, id: str, attributes: List[str]):
+        """Queue the read of some raw attributes of id, as one list reply"""
+        pipeline.mget([self._get_key(id, attribute) for attribute in attributes])
+
+    def get(self, id: str, model_class: Type[T]) -> Optional[T]:
+        codec = codec_for(model_class)
+        values = self._get_client().mget(self._get_model_keys(id, codec))
 
         if any(v is None for v in values):
             return None
 
-        for field in fields(model_class):
-            field_name = field.name
-            if field_name == "id":
-                continue
-
-            value = attributes.get(field_name)
-            if value is None:
-                if field.default is not MISSING:
-                    converted_data[field_name] = field.default
-                elif field.default_factory is not MISSING:
-                    converted_data[field_name] = field.default_factory()
-                continue
-
-            converted_data[field_name] = self._deserialize_value(
-                value, annotations[field_name]
-            )
-
-        return model_class(**converted_data)
+        return codec.decode(id, values)
 
     def save(self, model: T) -> None:
         if not hasattr(model, "id"):
             raise ValueError("Model must have an id attribute")
 
         self._prepare_for_changes()
+        codec = codec_for(type(model))
+        keys = self._get_model_keys(model.id, codec)
 
-        client = self._get_client()
-        model_dict = asdict(model)
+        self._mset(self._get_client(), dict(zip(keys, codec.encode(model))))
 
-        # Get model class to check types
-        model_class = type(model)
+    def _decode_chunk(
+        self, ids: List[str], values: List[Optional[str]], codec: ModelCodec
+    ) -> List[Optional[T]]:
+        n = len(codec.names)
+        result = []
+        for i, id in enumerate(ids):
+            model_values = values[i * n: (i + 1) * n]
+            if all(v is None for v in model_values):
+                result.append(None)
+            else:
+                result.append(codec.decode(id, model_values))
+        return result
 
-        client = client if self.pipeline is None else self.pipeline
+    def _chunk_keys(self, ids: List[str], codec: ModelCodec) -> List[str]:
+        return [key for id in ids for key in self._get_model_keys(id, codec)]
 
-        kvs = {}
+    def get_all(
+        self, ids: List[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> List[Optional[T]]:
+        """Load many models with a single pipelined round trip of chunked MGETs"""
+        ids = list(ids)
+        if not ids:
+            return []
 
-        for attr, value in model_dict.items():
-            if attr != "id":
-                field_type = model_class.__annotations__[attr]
-                serialized_value = self._serialize_value(value, field_type)
-                kvs[self._get_key(model.id, attr)] = serialized_value
+        codec = codec_for(model_class)
+        chunks = [ids[i: i + chunk_size] for i in range(0, len(ids), chunk_size)]
 
-        client.mset(kvs)
-
-    def get_all(self, ids: List[str], model_class: Type[T]) -> List[Optional[T]]:
-        client = self._get_client()
+        if self.pipeline is None:
+            pipeline = self.redis.pipeline(transaction=False)
+            for chunk in chunks:
+                pipeline.mget(self._chunk_keys(chunk, codec))
+            replies = pipeline.execute()
+        else:
+            replies = [
+                self.pipeline.mget(self._chunk_keys(chunk, codec)) for chunk in chunks
+            ]
 
         result = []
-        annotations = model_class.__annotations__
+        for chunk, values in zip(chunks, replies):
+            result.extend(self._decode_chunk(chunk, values, codec))
 
-        for id in ids:
-            keys = [self._get_key(id, field.name)
-                    for field in fields(model_class)]
-            values = client.mget(keys)
+        return result
 
-            if all(v is None for v in values):
-                result.append(None)
-                continue
-
-            attributes = {
-                key.split(":")[-1]: value for key, value in zip(keys, values)}
-            converted_data = {"id": id}
-
-            for field in fields(model_class):
-                field_name = field.name
-                if field_name == "id":
-                    continue
-
-                value = attributes.get(field_name)
-                if value is None:
-                    if field.default is not MISSING:
-                        converted_data[field_name] = field.default
-                    elif field.default_factory is not MISSING:
-                        converted_data[field_name] = field.default_factory()
-                    continue
-
-                converted_data[field_name] = self._deserialize_value(
-                    value, annotations[field_name]
-                )
+    def get_all_chunked(
+        self, ids: Iterable[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> Iterator[List[Optional[T]]]:
+        """Yield the models for ids in order with one MGET per chunk_size ids"""
+        client = self._get_client()
+        codec = codec_for(model_class)
+        ids = iter(ids)
+        while chunk := list(islice(ids, chunk_size)):
+            values = client.mget(self._chunk_keys(chunk, codec))
+            yield self._decode_chunk(chunk, values, codec)
 
-            result.append(model_class(**converted_data))
+    def _encode_all(self, models: List[T]) -> Dict[str, str]:
+        kvs = {}
+        for model in models:
+            if not hasattr(model, "id"):
+                raise ValueError("Each model must have an id attribute")
 
-        return result
+            codec = codec_for(type(model))
+            kvs.update(
+                zip(self._get_model_keys(model.id, codec), codec.encode(model))
+            )
+        return kvs
 
     def save_all(self, models: List[T]) -> None:
         if not models:
             return
 
         self._prepare_for_changes()
-        client = self._get_client()
-        kvs = {}
-
-        for model in models:
-            if not hasattr(model, "id"):
-                raise ValueError("Each model must have an id attribute")
-
-            model_dict = asdict(model)
-            model_class = type(model)
+        self._mset(self._get_client(), self._encode_all(models))
 
-            for attr, value in model_dict.items():
-                if attr != "id":
-                    field_type = model_class.__annotations__[attr]
-                    serialized_value = self._serialize_value(value, field_type)
-                    kvs[self._get_key(model.id, attr)] = serialized_value
+    def publish(self, channel: str, message: str):
+        return self.redis.publish(channel, message)
 
-        client.mset(kvs)
+    def iter_ids(self, model_class: Type[T], batch: int = 1000) -> Iterator[str]:
+        """
+        Ids of every model_class record, found with SCAN batch keys at a time
+        so the walk never stalls other clients the way keys() (KEYS) does.
+        A record is found by the first field of its model, which no two
+        models of a database share. Records written or deleted during the
+        walk may or may not be returned, and SCAN can return an id twice.
+        """
+        return self._scan_ids(codec_for(model_class).names[0], batch)
 
     def keys(self, match: str = "*") -> List[str]:
+        """Every key matching match, with KEYS; walks the whole keyspace at once"""
         client = self._get_client()
 
         keys = client.keys(match)
@@ -269,103 +597,85 @@ class RedisClient(DatabaseClient[T]):
 
     def delete(self, obj: T) -> bool:
         client = self._get_client()
+        keys = self._record_keys(obj.id, type(obj))
 
-        id = obj.id
-
-        keys = [self._get_key(id, field.name) for field in fields(type(obj))]
-
-        client.delete(*keys)
+        self._del(client, keys)
         return True
 
-    def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
-        client = self._get_client()
-        key = self._get_key(id, attribute)
-        value = client.get(key)
-
-        if value is None:
-            field = next((f for f in fields(model_class)
-                         if f.name == attribute), None)
-            if field is not None:
-                if field.default is not MISSING:
-                    return field.default
-                elif field.default_factory is not MISSING:
-                    return field.default_factory()
-            return None
+    def expire(self, id: str, ttl_ms: int, model_class: Type[T]) -> None:
+        """
+        Have the record of id deleted by Redis in ttl_ms, e.g. a Transaction
+        that reached its final status. Attributes that are neither fields nor
+        extras of model_class are not covered.
+        """
+        self._prepare_for_changes()
+        self._expire_script(
+            keys=self._record_keys(id, model_class),
+            args=[ttl_ms],
+            client=self._get_client(),
+        )
 
-        field_type = model_class.__annotations__.get(attribute)
-        return self._deserialize_value(value, field_type)
+    def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
+        value = self._get_client().get(self._get_key(id, attribute))
+        return codec_for(model_class).decode_attr(attribute, value)
 
     def set_attr(
         self, id: str, attribute: str, value: Any, model_class: Type[T]
     ) -> None:
         self._prepare_for_changes()
 
-        client = self._get_client()
         key = self._get_key(id, attribute)
-        field_type = model_class.__annotations__.get(attribute)
+        value = codec_for(model_class).encode_attr(attribute, value)
+        self._mset(self._get_client(), {key: value})
 
-        field_type = model_class.__annotations__.get(attribute)
-        serialized_value = self._serialize_value(value, field_type)
+    def set_attr_if_absent(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> bool:
+        """Set an attribute unless it already has a value; True if it was set"""
+        self._prepare_for_changes()
+        return bool(
+            self._get_client().set(
+                self._get_key(id, attribute),
+                codec_for(model_class).encode_attr(attribute, value),
+                nx=True,
+            )
+        )
 
-        client.set(key, serialized_value)
+    def delete_attr(self, id: str, attribute: str) -> None:
+        self._prepare_for_changes()
+        self._del(self._get_client(), [self._get_key(id, attribute)])
 
     def m_get_attr(self, ids: List[str], attribute: str, model_class: Type[T]):
-        client = self._get_client()
         keys = [self._get_key(id, attribute) for id in ids]
+        values = self._get_client().mget(keys)
 
-        values = client.mget(keys)
-
-        result = {}
-
-        for i, id in enumerate(ids):
-            value = values[i]
-            if value is None:
-                field = next(
-                    (f for f in fields(model_class) if f.name == attribute), None
-                )
-                if field is not None:
-                    if field.default is not MISSING:
-                        result[id] = field.default
-                    elif field.default_factory is not MISSING:
-                        result[id] = field.default_factory()
-                return None
-
-            field_type = model_class.__annotations__.get(attribute)
-            result[id] = self._deserialize_value(value, field_type)
+        # A missing value means one of the models does not exist
+        if any(v is None for v in values):
+            return None
 
-        return result
+        decode = codec_for(model_class).decode_attr
+        return {id: decode(attribute, value) for id, value in zip(ids, values)}
 
     def m_set_attr(self, values: Dict[str, Any], attribute: str, model_class: Type[T]):
         client = self._get_client()
-        field_type = model_class.__annotations__.get(attribute)
+        encode = codec_for(model_class).encode_attr
         writes = {
-            self._get_key(id, attribute): self._serialize_value(value, field_type)
+            self._get_key(id, attribute): encode(attribute, value)
             for id, value in values.items()
         }
 
-        client.mset(writes)
+        self._mset(client, writes)
 
-    # Not sure if lua scripts work with EVALSHA in pipelines. For now fall back to EVAL
     def lte_decrement(self, id: str, attribute: str, amount: int, tid: str) -> bool:
         self._prepare_for_changes()
-        client = self._get_client()
         key = self._get_key(id, attribute)
         tidk = self._get_key(tid, "status")
 
-        try:
-            if self.pipeline is None:
-                result = self._gte_decrement(keys=[tidk, key], args=[amount])
-            else:
-                result = client.eval(
-                    self.LTE_DECREMENT_SCRIPT, 2, tidk, key, amount)
-        except redis.exceptions.NoScriptError:
-            if self.pipeline is None:
-                self._register_scripts()
-                result = self._gte_decrement(keys=[tidk, key], args=[amount])
-            else:
-                result = client.eval(
-                    self.LTE_DECREMENT_SCRIPT, 2, tidk, key, amount)
-
+        result = self._gte_decrement(
+            keys=[tidk, key, self._aggregate_key(attribute)],
+            args=[amount],
+            client=self._get_client(),
+        )
         return result != -1
 
     def m_gte_decrement(
@@ -375,46 +685,21 @@ class RedisClient(DatabaseClient[T]):
             return False
 
         self._prepare_for_changes()
-        client = self._get_client()
-
         tidk = self._get_key(tid, "status")
+        keys = [self._get_key(k, attribute) for k in changes]
 
-        keys = []
-        values = []
-
-        for k, v in changes.items():
-            keys.append(self._get_key(k, attribute))
-            values.append(v)
-
-        try:
-            if self.pipeline is None:
-                result = self._m_gte_decrement(keys=[tidk] + keys, args=values)
-            else:
-                # For pipelines, we need to use the original script
-                result = client.eval(
-                    self.M_GTE_DECREMENT_SCRIPT,
-                    len(keys) + 1,
-                    tidk,
-                    *(keys + values),
-                )
-        except redis.exceptions.NoScriptError:
-            # If script is not found (e.g., Redis was restarted), reload and try again
-            if self.pipeline is None:
-                self._register_scripts()
-                result = self._m_gte_decrement(keys=[tidk] + keys, args=values)
-            else:
-                result = client.eval(
-                    self.M_GTE_DECREMENT_SCRIPT, len(
-                        keys) + 1, tidk, *(keys + values)
-                )
-
+        result = self._m_gte_decrement(
+            keys=[tidk, self._aggregate_key(attribute)] + keys,
+            args=list(changes.values()),
+            client=self._get_client(),
+        )
         return result != -1
 
     def increment(self, id: str, attribute: str, amount: int = 1) -> int:
         self._prepare_for_changes()
         client = self._get_client()
         try:
-            result = client.incrby(self._get_key(id, attribute), amount)
+            result = self._incrby(client, id, attribute, amount)
             if self.pipeline is None:
                 return int(result)
 
@@ -436,31 +721,202 @@ class RedisClient(DatabaseClient[T]):
         expected_str = str(expected_value)
         new_str = str(new_value)
 
-        try:
-            if self.pipeline is None:
-                result = self._compare_and_set_script(
-                    keys=[key], args=[expected_str, new_str]
-                )
-            else:
-                result = client.eval(
-                    COMPARE_AND_SET_SCRIPT, 1, key, expected_str, new_str
-                )
-        except redis.exceptions.NoScriptError:
-            if self.pipeline is None:
-                self._register_scripts()
-                result = self._compare_and_set_script(
-                    keys=[key], args=[expected_str, new_str]
-                )
-            else:
-                result = client.eval(
-                    COMPARE_AND_SET_SCRIPT, 1, key, expected_str, new_str
-                )
+        result = self._compare_and_set_script(
+            keys=[key], args=[expected_str, new_str], client=client
+        )
 
         return result == 1
 
+    def _reserve_args(
+        self,
+        transaction,
+        changes: Dict[str, int],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ):
+        codec = codec_for(type(transaction))
+        tx_keys = self._get_model_keys(transaction.id, codec)
+        # Streams that are not written still need a key in their slot
+        keys = (
+            tx_keys
+            + [stream_key or tx_keys[0], outcome_key or tx_keys[0]]
+            + [self._aggregate_key(attribute)]
+            + [self._get_key(k, attribute) for k in changes]
+        )
+        args = (
+            [len(tx_keys)]
+            + codec.encode(transaction)
+            + [transaction.id, reserve_flags(stream_key, outcome_key)]
+            + list(changes.values())
+        )
+        return keys, args
+
+    def reserve(
+        self,
+        transaction,
+        changes: Dict[str, int],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> ReserveResult:
+        """
+        Atomically record a PENDING transaction, push its id to stream_key
+        unless it is None, and decrement attribute of every id in changes by
+        the given amount, unless the transaction was already marked STALE or
+        any value would drop below zero. The transaction status ends up
+        SUCCESS or FAILURE accordingly, and is pushed along with the id to
+        outcome_key if one is given.
+        """
+        if not changes:
+            return ReserveResult.INSUFFICIENT
+
+        self._prepare_for_changes()
+        keys, args = self._reserve_args(
+            transaction, changes, attribute, stream_key, outcome_key
+        )
+        result = self._reserve_script(keys=keys, args=args, client=self._get_client())
+
+        if self.pipeline is not None:
+            return result
+
+        return ReserveResult(result)
+
+    def reserve_all(
+        self,
+        reservations: List[Tuple[Any, Dict[str, int]]],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> List[ReserveResult]:
+        """
+        RedisClient.reserve for many (transaction, changes) pairs in a single
+        pipelined round trip. Every reservation is still atomic on its own, so
+        one of them failing does not affect the others.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for transaction, changes in reservations:
+            if changes:
+                keys, args = self._reserve_args(
+                    transaction, changes, attribute, stream_key, outcome_key
+                )
+                self._reserve_script(keys=keys, args=args, client=pipeline)
+
+        replies = iter(pipeline.execute())
+        return [
+            ReserveResult(next(replies)) if changes else ReserveResult.INSUFFICIENT
+            for _, changes in reservations
+        ]
+
+    def _resolve_args(self, transaction, changes: Dict[str, int], attribute: str):
+        codec = codec_for(type(transaction))
+        tid = transaction.id
+        record = self._record_keys(tid, type(transaction))
+        keys = (
+            [self._get_key(tid, "status"), self._get_key(tid, "locked")]
+            + record
+            + [self._aggregate_key(attribute)]
+            + [self._get_key(k, attribute) for k in changes]
+        )
+        aggregated = attribute in AGGREGATED_ATTRIBUTES
+        args = [
+            len(record),
+            codec.encode_attr("status", transaction.status),
+            codec.encode_attr("locked", True),
+            sum(changes.values()) if aggregated else 0,
+        ] + list(changes.values())
+        return keys, args
+
+    def resolve(self, transaction, changes: Dict[str, int], attribute: str) -> bool:
+        """
+        Atomically add the amounts in changes to attribute of their ids and
+        delete the transaction record, the last step of a reservation: the
+        amounts leave committed_{attribute} on commit, and go back to
+        attribute on rollback. Nothing happens unless the record is still
+        there, locked by the caller (compare_and_set of `locked`), and has the
+        status it was read with, so a crash leaves either the record or the
+        whole outcome, and resolving again is a no-op.
+
+        Returns:
+            bool: Whether this call resolved the transaction.
+        """
+        self._prepare_for_changes()
+        keys, args = self._resolve_args(transaction, changes, attribute)
+        result = self._resolve_script(keys=keys, args=args, client=self._get_client())
+        return result if self.pipeline is not None else result == 1
+
+    def _append_args(
+        self, id: str, attribute: str, value: Any, counter: str, amount: int
+    ):
+        keys = [self._get_key(id, attribute), self._get_key(id, counter)]
+        return keys, [json.dumps(value), amount]
+
+    def append_and_increment(
+        self,
+        id: str,
+        attribute: str,
+        value: Any,
+        counter: str,
+        amount: int,
+        model_class: Type[T],
+    ) -> Optional[int]:
+        """
+        Atomically append value to the list attribute of id and add amount to
+        its counter attribute. The list is extended in place, so the cost does
+        not grow with its length and concurrent appends need no retries.
+
+        Returns:
+            The new value of the counter, None if id has no such counter.
+        """
+        self._prepare_for_changes()
+        keys, args = self._append_args(id, attribute, value, counter, amount)
+        return self._append_script(keys=keys, args=args, client=self._get_client())
+
+    def get_counter(self, id: str, attribute: str) -> Optional[int]:
+        """The counter attribute of id, None if id has none"""
+        value = self._get_client().get(self._get_key(id, attribute))
+        return None if value is None else int(value)
+
+    def get_aggregate(self, name: str) -> int:
+        """
+        The running total `name`: the sum of an attribute in
+        AGGREGATED_ATTRIBUTES over every model, which the writes to it keep
+        up to date, or a total kept with increment_aggregate. 0 if nothing
+        was ever added.
+        """
+        return int(self._get_client().get(self._aggregate_key(name)) or 0)
+
+    def increment_aggregate(self, name: str, amount: int) -> None:
+        self._prepare_for_changes()
+        self._get_client().incrby(self._aggregate_key(name), amount)
+
+    def rebuild_aggregate(
+        self,
+        name: str,
+        model_class: Type[T],
+        value: Optional[Callable[[T], int]] = None,
+        batch: int = 1000,
+    ) -> int:
+        """
+        Set the running total `name` to the sum of value(model) over every
+        model_class record, by default their attribute `name`, for data
+        written before the aggregates were kept (see database/aggregates.py).
+        Writes made during the walk may be counted twice or not at all, so
+        run it while nothing writes to the models.
+
+        Returns:
+            The new total.
+        """
+        value = value or (lambda model: getattr(model, name))
+        total = sum(value(model) for model in self.iter_models(model_class, batch))
+        self.redis.set(self._aggregate_key(name), total)
+        return total
+
     def close(self):
         """Close the Redis client connection"""
         self.redis.close()
+        for client in self._replica_clients.values():
+            client.close()
 
     @contextmanager
     def transaction(self, config: TransactionConfig = TransactionConfig()):
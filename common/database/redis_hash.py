@@ -0,0 +1,689 @@
+from typing import (
+    List,
+    TypeVar,
+    Type,
+    Optional,
+    Dict,
+    Any,
+    AsyncIterator,
+    Iterable,
+    Iterator,
+)
+from itertools import islice
+import json
+import redis
+from .codec import codec_for
+from .redis import AGGREGATED_ATTRIBUTES, EXPIRE_SCRIPT, RedisClient, reserve_flags
+from .async_redis import AsyncRedisClient, batched_async
+
+
+T = TypeVar("T")
+
+# KEYS[1] = transaction hash, KEYS[2] = model hash, KEYS[3] = aggregate
+# ARGV[1] = attribute, ARGV[2] = amount
+HASH_LTE_DECREMENT_SCRIPT = """
+local current = tonumber(redis.call('hget', KEYS[2], ARGV[1]))
+if current == nil or tonumber(ARGV[2]) > current then
+    redis.call('hset', KEYS[1], 'status', 1)
+    return -1
+end
+redis.call('hset', KEYS[1], 'status', 2)
+redis.call('decrby', KEYS[3], ARGV[2])
+return redis.call('hincrby', KEYS[2], ARGV[1], -tonumber(ARGV[2]))
+"""
+
+# KEYS[1] = transaction hash, KEYS[2] = aggregate, KEYS[3..] = model hashes
+# ARGV[1] = attribute, ARGV[2..] = amounts
+HASH_M_GTE_DECREMENT_SCRIPT = """
+for i = 3, #KEYS do
+    local current = tonumber(redis.call('hget', KEYS[i], ARGV[1]))
+    if current == nil or tonumber(ARGV[i - 1]) > current then
+        redis.call('hset', KEYS[1], 'status', 1)
+        return -1
+    end
+end
+
+local total = 0
+for i = 3, #KEYS do
+    redis.call('hincrby', KEYS[i], ARGV[1], -tonumber(ARGV[i - 1]))
+    total = total + tonumber(ARGV[i - 1])
+end
+redis.call('decrby', KEYS[2], total)
+redis.call('hset', KEYS[1], 'status', 2)
+return 1
+"""
+
+# HINCRBY that adds the amount to the aggregate of the field too
+# KEYS[1] = model hash, KEYS[2] = aggregate, ARGV[1] = field, ARGV[2] = amount
+HASH_AGGREGATED_INCREMENT_SCRIPT = """
+local value = redis.call('hincrby', KEYS[1], ARGV[1], ARGV[2])
+redis.call('incrby', KEYS[2], ARGV[2])
+return value
+"""
+
+# HSET that adds the change of every aggregated field to its aggregate
+# KEYS[1] = model hash, KEYS[2..m+1] = aggregates of the first m fields
+# ARGV = field/value pairs, the aggregated fields first
+HASH_AGGREGATED_SET_SCRIPT = """
+for i = 2, #KEYS do
+    local field, value = ARGV[2 * i - 3], tonumber(ARGV[2 * i - 2])
+    local old = tonumber(redis.call('hget', KEYS[1], field)) or 0
+    redis.call('incrby', KEYS[i], value - old)
+end
+redis.call('hset', KEYS[1], unpack(ARGV))
+"""
+
+# HDEL of fields, or DEL of the whole hash if ARGV[1] is 1, that takes the
+# value of every deleted aggregated field off its aggregate
+# KEYS[1] = model hash, KEYS[2..m+1] = aggregates of the first m fields
+# ARGV[1] = whole hash flag, ARGV[2..] = fields, the aggregated ones first
+HASH_AGGREGATED_DELETE_SCRIPT = """
+for i = 2, #KEYS do
+    local old = tonumber(redis.call('hget', KEYS[1], ARGV[i])) or 0
+    redis.call('decrby', KEYS[i], old)
+end
+if ARGV[1] == '1' then
+    return redis.call('del', KEYS[1])
+end
+return redis.call('hdel', KEYS[1], unpack(ARGV, 2))
+"""
+
+# KEYS[1] = model hash
+# ARGV[1] = attribute, ARGV[2] = expected value, ARGV[3] = new value
+HASH_COMPARE_AND_SET_SCRIPT = """
+if redis.call('hget', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('hset', KEYS[1], ARGV[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+# KEYS[1] = transaction hash, KEYS[2] = stream, KEYS[3] = outcome stream,
+# KEYS[4] = aggregate, KEYS[5..] = model hashes
+# ARGV[1] = attribute, ARGV[2] = tid, ARGV[3] = m transaction fields,
+# ARGV[4] = publish flag, ARGV[5..4+2m] = transaction field/value pairs,
+# ARGV[5+2m..] = amounts
+HASH_RESERVE_SCRIPT = """
+-- 3 = TransactionStatus.STALE, written by VibeCheckTransactionStatus
+if redis.call('hget', KEYS[1], 'status') == '3' then
+    return -2
+end
+
+local m = tonumber(ARGV[3])
+redis.call('hset', KEYS[1], unpack(ARGV, 5, 4 + 2 * m))
+
+-- 1 = push the tid to the transactions stream, 2 = publish the outcome
+local flags = tonumber(ARGV[4])
+if flags % 2 == 1 then
+    redis.call('xadd', KEYS[2], '*', 'tid', ARGV[2])
+end
+
+local function finish(status)
+    redis.call('hset', KEYS[1], 'status', status)
+    if flags >= 2 then
+        redis.call('xadd', KEYS[3], '*', 'tid', ARGV[2], 'status', status)
+    end
+end
+
+local offset = 2 * m
+for i = 5, #KEYS do
+    local current = tonumber(redis.call('hget', KEYS[i], ARGV[1]))
+    if current == nil or tonumber(ARGV[i + offset]) > current then
+        finish(1)
+        return -1
+    end
+end
+
+local total = 0
+for i = 5, #KEYS do
+    redis.call('hincrby', KEYS[i], ARGV[1], -tonumber(ARGV[i + offset]))
+    total = total + tonumber(ARGV[i + offset])
+end
+redis.call('decrby', KEYS[4], total)
+finish(2)
+return 1
+"""
+
+# RESOLVE_SCRIPT of the hash layout
+# KEYS[1] = transaction hash, KEYS[2] = aggregate, KEYS[3..] = model hashes
+# ARGV[1] = attribute, ARGV[2] = status, ARGV[3] = locked,
+# ARGV[4] = aggregate amount, ARGV[5..] = amounts
+HASH_RESOLVE_SCRIPT = """
+local record = redis.call('hmget', KEYS[1], 'status', 'locked')
+if record[1] ~= ARGV[2] or record[2] ~= ARGV[3] then
+    return 0
+end
+
+for i = 3, #KEYS do
+    redis.call('hincrby', KEYS[i], ARGV[1], ARGV[i + 2])
+end
+if ARGV[4] ~= '0' then
+    redis.call('incrby', KEYS[2], ARGV[4])
+end
+redis.call('del', KEYS[1])
+return 1
+"""
+
+# KEYS[1] = model hash
+# ARGV[1] = list attribute, ARGV[2] = counter attribute,
+# ARGV[3] = JSON encoded element, ARGV[4] = amount
+HASH_APPEND_AND_INCREMENT_SCRIPT = """
+if redis.call('hexists', KEYS[1], ARGV[2]) == 0 then
+    return false
+end
+
+-- A hash field cannot be extended in place: the list is copied into a new
+-- string, without decoding it, so an add costs O(length of the list)
+local list = redis.call('hget', KEYS[1], ARGV[1])
+if not list or string.len(list) <= 2 then
+    list = '[' .. ARGV[3] .. ']'
+else
+    list = string.sub(list, 1, -2) .. ', ' .. ARGV[3] .. ']'
+end
+redis.call('hset', KEYS[1], ARGV[1], list)
+return redis.call('hincrby', KEYS[1], ARGV[2], ARGV[4])
+"""
+
+
+class HashLayoutMixin:
+    """
+    Stores every model as a single Redis hash `model:{id}` holding one field
+    per dataclass attribute, instead of one string key per attribute.
+
+    Only key naming, (de)serialization and the Lua scripts live here; the
+    commands themselves are issued by the sync and async clients below.
+    """
+
+    def _register_scripts(self):
+        self._gte_decrement = self.scripts.register(HASH_LTE_DECREMENT_SCRIPT)
+        self._m_gte_decrement = self.scripts.register(HASH_M_GTE_DECREMENT_SCRIPT)
+        self._compare_and_set_script = self.scripts.register(
+            HASH_COMPARE_AND_SET_SCRIPT
+        )
+        self._reserve_script = self.scripts.register(HASH_RESERVE_SCRIPT)
+        self._append_script = self.scripts.register(HASH_APPEND_AND_INCREMENT_SCRIPT)
+        self._expire_script = self.scripts.register(EXPIRE_SCRIPT)
+        self._increment_script = self.scripts.register(
+            HASH_AGGREGATED_INCREMENT_SCRIPT
+        )
+        self._set_script = self.scripts.register(HASH_AGGREGATED_SET_SCRIPT)
+        self._delete_script = self.scripts.register(HASH_AGGREGATED_DELETE_SCRIPT)
+        self._resolve_script = self.scripts.register(HASH_RESOLVE_SCRIPT)
+
+    def _get_key(self, id: str, attribute: str = None) -> str:
+        # The attribute is a hash field, so every attribute maps to the same key
+        return f"model:{id}"
+
+    def _get_model_keys_pattern(self, id: str) -> str:
+        return f"model:{id}"
+
+    def _record_keys(self, id: str, model_class: Type[T]) -> List[str]:
+        return [self._get_key(id)]
+
+    def _scan_ids(self, attribute: str, count: int) -> Iterator[str]:
+        # Every model is a hash, those without attribute are told apart on read
+        for key in self.redis.scan_iter(match="model:*", count=count, _type="hash"):
+            yield key[len("model:"):]
+
+    def _queue_get_attrs(self, pipeline, id: str, attributes: List[str]):
+        pipeline.hmget(self._get_key(id), attributes)
+
+    def _queue_having_field(self, ids: List[str], field: str):
+        """A pipeline checking which of the hashes of ids hold field"""
+        pipeline = self.redis.pipeline(transaction=False)
+        for id in ids:
+            pipeline.hexists(self._get_key(id), field)
+        return pipeline
+
+    def _hset(self, client, id: str, mapping: Dict[str, str]):
+        """HSET of fields, through HASH_AGGREGATED_SET_SCRIPT if any is aggregated"""
+        aggregated = [f for f in mapping if f in AGGREGATED_ATTRIBUTES]
+        if not aggregated:
+            return client.hset(self._get_key(id), mapping=mapping)
+
+        fields = aggregated + [f for f in mapping if f not in AGGREGATED_ATTRIBUTES]
+        args = []
+        for field in fields:
+            args += [field, mapping[field]]
+        return self._set_script(
+            keys=[self._get_key(id)] + [self._aggregate_key(f) for f in aggregated],
+            args=args,
+            client=client,
+        )
+
+    def _hdel(self, client, id: str, fields: List[str], record: bool = False):
+        """
+        HDEL of fields, or DEL of the record when record is set, through
+        HASH_AGGREGATED_DELETE_SCRIPT if any of fields is aggregated
+        """
+        aggregated = [f for f in fields if f in AGGREGATED_ATTRIBUTES]
+        if not aggregated:
+            if record:
+                return client.delete(self._get_key(id))
+            return client.hdel(self._get_key(id), *fields)
+
+        fields = aggregated + [f for f in fields if f not in AGGREGATED_ATTRIBUTES]
+        return self._delete_script(
+            keys=[self._get_key(id)] + [self._aggregate_key(f) for f in aggregated],
+            args=[1 if record else 0] + fields,
+            client=client,
+        )
+
+    def _incrby(self, client, id: str, attribute: str, amount: int):
+        if attribute not in AGGREGATED_ATTRIBUTES:
+            return client.hincrby(self._get_key(id), attribute, amount)
+        return self._increment_script(
+            keys=[self._get_key(id), self._aggregate_key(attribute)],
+            args=[attribute, amount],
+            client=client,
+        )
+
+    def _encode_model(self, model: T) -> Dict[str, str]:
+        if not hasattr(model, "id"):
+            raise ValueError("Model must have an id attribute")
+
+        codec = codec_for(type(model))
+        return dict(zip(codec.names, codec.encode(model)))
+
+    def _decode_model(
+        self, id: str, data: Dict[str, str], model_class: Type[T]
+    ) -> Optional[T]:
+        if not data:
+            return None
+
+        codec = codec_for(model_class)
+        return codec.decode(id, [data.get(name) for name in codec.names])
+
+    def _decode_attr(self, value: Optional[str], attribute: str, model_class: Type[T]):
+        return codec_for(model_class).decode_attr(attribute, value)
+
+    def _append_args(
+        self, id: str, attribute: str, value: Any, counter: str, amount: int
+    ):
+        return [self._get_key(id)], [attribute, counter, json.dumps(value), amount]
+
+    def _resolve_args(self, transaction, changes: Dict[str, int], attribute: str):
+        codec = codec_for(type(transaction))
+        keys = [self._get_key(transaction.id), self._aggregate_key(attribute)] + [
+            self._get_key(k) for k in changes
+        ]
+        aggregated = attribute in AGGREGATED_ATTRIBUTES
+        args = [
+            attribute,
+            codec.encode_attr("status", transaction.status),
+            codec.encode_attr("locked", True),
+            sum(changes.values()) if aggregated else 0,
+        ] + list(changes.values())
+        return keys, args
+
+    def _reserve_args(
+        self,
+        transaction,
+        changes: Dict[str, int],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ):
+        mapping = self._encode_model(transaction)
+        tx_key = self._get_key(transaction.id)
+        keys = [
+            tx_key,
+            stream_key or tx_key,
+            outcome_key or tx_key,
+            self._aggregate_key(attribute),
+        ] + [self._get_key(k) for k in changes]
+        flags = reserve_flags(stream_key, outcome_key)
+        args = [attribute, transaction.id, len(mapping), flags]
+        for field, value in mapping.items():
+            args += [field, value]
+        return keys, args + list(changes.values())
+
+
+class RedisHashClient(HashLayoutMixin, RedisClient[T]):
+    def iter_ids(self, model_class: Type[T], batch: int = 1000) -> Iterator[str]:
+        # SCAN finds every hash, those of model_class hold its first field
+        field = codec_for(model_class).names[0]
+        ids = self._scan_ids(field, batch)
+        while chunk := list(islice(ids, batch)):
+            found = self._queue_having_field(chunk, field).execute()
+            yield from (id for id, exists in zip(chunk, found) if exists)
+
+    def get(self, id: str, model_class: Type[T]) -> Optional[T]:
+        data = self._get_client().hgetall(self._get_key(id))
+        return self._decode_model(id, data, model_class)
+
+    def save(self, model: T) -> None:
+        mapping = self._encode_model(model)
+        self._prepare_for_changes()
+        self._hset(self._get_client(), model.id, mapping)
+
+    def get_all(
+        self, ids: List[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> List[Optional[T]]:
+        ids = list(ids)
+        if self.pipeline is None:
+            pipeline = self.redis.pipeline(transaction=False)
+            for id in ids:
+                pipeline.hgetall(self._get_key(id))
+            replies = pipeline.execute()
+        else:
+            # Read on the connection of the transaction, e.g. under its WATCH
+            replies = [self.pipeline.hgetall(self._get_key(id)) for id in ids]
+
+        return [
+            self._decode_model(id, data, model_class)
+            for id, data in zip(ids, replies)
+        ]
+
+    def get_all_chunked(
+        self, ids: Iterable[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> Iterator[List[Optional[T]]]:
+        ids = iter(ids)
+        while chunk := list(islice(ids, chunk_size)):
+            yield self.get_all(chunk, model_class)
+
+    def save_all(self, models: List[T]) -> None:
+        if not models:
+            return
+
+        self._prepare_for_changes()
+        client = self._get_client()
+        pipeline = client if self.pipeline is not None else client.pipeline(
+            transaction=False
+        )
+
+        for model in models:
+            self._hset(pipeline, model.id, self._encode_model(model))
+
+        if self.pipeline is None:
+            pipeline.execute()
+
+    def delete(self, obj: T) -> bool:
+        fields = codec_for(type(obj)).names
+        self._hdel(self._get_client(), obj.id, fields, record=True)
+        return True
+
+    def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
+        value = self._get_client().hget(self._get_key(id), attribute)
+        return self._decode_attr(value, attribute, model_class)
+
+    def get_counter(self, id: str, attribute: str) -> Optional[int]:
+        value = self._get_client().hget(self._get_key(id), attribute)
+        return None if value is None else int(value)
+
+    def set_attr(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> None:
+        self._prepare_for_changes()
+        value = codec_for(model_class).encode_attr(attribute, value)
+        self._hset(self._get_client(), id, {attribute: value})
+
+    def set_attr_if_absent(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> bool:
+        self._prepare_for_changes()
+        return bool(
+            self._get_client().hsetnx(
+                self._get_key(id),
+                attribute,
+                codec_for(model_class).encode_attr(attribute, value),
+            )
+        )
+
+    def delete_attr(self, id: str, attribute: str) -> None:
+        self._prepare_for_changes()
+        self._hdel(self._get_client(), id, [attribute])
+
+    def m_get_attr(self, ids: List[str], attribute: str, model_class: Type[T]):
+        if self.pipeline is None:
+            pipeline = self.redis.pipeline(transaction=False)
+            for id in ids:
+                pipeline.hget(self._get_key(id), attribute)
+            values = pipeline.execute()
+        else:
+            values = [self.pipeline.hget(self._get_key(id), attribute) for id in ids]
+
+        return {
+            id: self._decode_attr(value, attribute, model_class)
+            for id, value in zip(ids, values)
+        }
+
+    def m_set_attr(self, values: Dict[str, Any], attribute: str, model_class: Type[T]):
+        encode = codec_for(model_class).encode_attr
+        client = self._get_client()
+        pipeline = client if self.pipeline is not None else client.pipeline(
+            transaction=False
+        )
+
+        for id, value in values.items():
+            self._hset(pipeline, id, {attribute: encode(attribute, value)})
+
+        if self.pipeline is None:
+            pipeline.execute()
+
+    def lte_decrement(self, id: str, attribute: str, amount: int, tid: str) -> bool:
+        self._prepare_for_changes()
+        keys = [self._get_key(tid), self._get_key(id), self._aggregate_key(attribute)]
+        args = [attribute, amount]
+
+        result = self._gte_decrement(keys=keys, args=args, client=self._get_client())
+        return result != -1
+
+    def m_gte_decrement(
+        self, changes: Dict[str, int], attribute: str, tid: str
+    ) -> bool:
+        if not changes:
+            return False
+
+        self._prepare_for_changes()
+        keys = [self._get_key(tid), self._aggregate_key(attribute)]
+        keys += [self._get_key(k) for k in changes]
+        args = [attribute] + list(changes.values())
+
+        result = self._m_gte_decrement(keys=keys, args=args, client=self._get_client())
+        return result != -1
+
+    def increment(self, id: str, attribute: str, amount: int = 1) -> int:
+        self._prepare_for_changes()
+        try:
+            result = self._incrby(self._get_client(), id, attribute, amount)
+            if self.pipeline is None:
+                return int(result)
+
+            return result
+
+        except redis.ResponseError:
+            raise ValueError(f"Attribute {attribute} is not numeric")
+
+    def compare_and_set(
+        self, id: str, attribute: str, expected_value: Any, new_value: Any
+    ) -> bool:
+        keys = [self._get_key(id)]
+        args = [attribute, str(expected_value), str(new_value)]
+
+        result = self._compare_and_set_script(
+            keys=keys, args=args, client=self._get_client()
+        )
+        return result == 1
+
+
+class AsyncRedisHashClient(HashLayoutMixin, AsyncRedisClient[T]):
+    async def iter_ids(
+        self, model_class: Type[T], batch: int = 1000
+    ) -> AsyncIterator[str]:
+        field = codec_for(model_class).names[0]
+        keys = self.redis.scan_iter(match="model:*", count=batch, _type="hash")
+        async for chunk in batched_async(keys, batch):
+            ids = [key[len("model:"):] for key in chunk]
+            found = await self._queue_having_field(ids, field).execute()
+            for id, exists in zip(ids, found):
+                if exists:
+                    yield id
+
+    async def get(self, id: str, model_class: Type[T]) -> Optional[T]:
+        data = await self._get_client().hgetall(self._get_key(id))
+        return self._decode_model(id, data, model_class)
+
+    async def save(self, model: T) -> None:
+        mapping = self._encode_model(model)
+        self._prepare_for_changes()
+        await self._hset(self._get_client(), model.id, mapping)
+
+    async def get_all(
+        self, ids: List[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> List[Optional[T]]:
+        ids = list(ids)
+        if self.pipeline is None:
+            pipeline = self.redis.pipeline(transaction=False)
+            for id in ids:
+                pipeline.hgetall(self._get_key(id))
+            replies = await pipeline.execute()
+        else:
+            replies = [await self.pipeline.hgetall(self._get_key(id)) for id in ids]
+
+        return [
+            self._decode_model(id, data, model_class)
+            for id, data in zip(ids, replies)
+        ]
+
+    async def get_all_chunked(
+        self, ids: Iterable[str], model_class: Type[T], chunk_size: int = 1000
+    ) -> AsyncIterator[List[Optional[T]]]:
+        ids = iter(ids)
+        while chunk := list(islice(ids, chunk_size)):
+            yield await self.get_all(chunk, model_class)
+
+    async def save_all(self, models: List[T]) -> None:
+        if not models:
+            return
+
+        self._prepare_for_changes()
+        client = self._get_client()
+        pipeline = client if self.pipeline is not None else client.pipeline(
+            transaction=False
+        )
+
+        for model in models:
+            await self._hset(pipeline, model.id, self._encode_model(model))
+
+        if self.pipeline is None:
+            await pipeline.execute()
+
+    async def delete(self, obj: T) -> bool:
+        fields = codec_for(type(obj)).names
+        await self._hdel(self._get_client(), obj.id, fields, record=True)
+        return True
+
+    async def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
+        value = await self._get_client().hget(self._get_key(id), attribute)
+        return self._decode_attr(value, attribute, model_class)
+
+    async def get_counter(self, id: str, attribute: str) -> Optional[int]:
+        value = await self._get_client().hget(self._get_key(id), attribute)
+        return None if value is None else int(value)
+
+    async def set_attr(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> None:
+        self._prepare_for_changes()
+        value = codec_for(model_class).encode_attr(attribute, value)
+        await self._hset(self._get_client(), id, {attribute: value})
+
+    async def set_attr_if_absent(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> bool:
+        self._prepare_for_changes()
+        return bool(
+            await self._get_client().hsetnx(
+                self._get_key(id),
+                attribute,
+                codec_for(model_class).encode_attr(attribute, value),
+            )
+        )
+
+    async def delete_attr(self, id: str, attribute: str) -> None:
+        self._prepare_for_changes()
+        await self._hdel(self._get_client(), id, [attribute])
+
+    async def m_get_attr(self, ids: List[str], attribute: str, model_class: Type[T]):
+        if self.pipeline is None:
+            pipeline = self.redis.pipeline(transaction=False)
+            for id in ids:
+                pipeline.hget(self._get_key(id), attribute)
+            values = await pipeline.execute()
+        else:
+            values = [
+                await self.pipeline.hget(self._get_key(id), attribute) for id in ids
+            ]
+
+        return {
+            id: self._decode_attr(value, attribute, model_class)
+            for id, value in zip(ids, values)
+        }
+
+    async def m_set_attr(
+        self, values: Dict[str, Any], attribute: str, model_class: Type[T]
+    ):
+        encode = codec_for(model_class).encode_attr
+        client = self._get_client()
+        pipeline = client if self.pipeline is not None else client.pipeline(
+            transaction=False
+        )
+
+        for id, value in values.items():
+            await self._hset(pipeline, id, {attribute: encode(attribute, value)})
+
+        if self.pipeline is None:
+            await pipeline.execute()
+
+    async def lte_decrement(
+        self, id: str, attribute: str, amount: int, tid: str
+    ) -> bool:
+        self._prepare_for_changes()
+        keys = [self._get_key(tid), self._get_key(id), self._aggregate_key(attribute)]
+        args = [attribute, amount]
+
+        result = await self._gte_decrement(
+            keys=keys, args=args, client=self._get_client()
+        )
+        return result != -1
+
+    async def m_gte_decrement(
+        self, changes: Dict[str, int], attribute: str, tid: str
+    ) -> bool:
+        if not changes:
+            return False
+
+        self._prepare_for_changes()
+        keys = [self._get_key(tid), self._aggregate_key(attribute)]
+        keys += [self._get_key(k) for k in changes]
+        args = [attribute] + list(changes.values())
+
+        result = await self._m_gte_decrement(
+            keys=keys, args=args, client=self._get_client()
+        )
+        return result != -1
+
+    async def increment(self, id: str, attribute: str, amount: int = 1) -> int:
+        self._prepare_for_changes()
+        try:
+            result = await self._incrby(self._get_client(), id, attribute, amount)
+            if self.pipeline is None:
+                return int(result)
+
+            return result
+
+        except redis.ResponseError:
+            raise ValueError(f"Attribute {attribute} is not numeric")
+
+    async def compare_and_set(
+        self, id: str, attribute: str, expected_value: Any, new_value: Any
+    ) -> bool:
+        keys = [self._get_key(id)]
+        args = [attribute, str(expected_value), str(new_value)]
+
+        result = await self._compare_and_set_script(
+            keys=keys, args=args, client=self._get_client()
+        )
+        return result == 1
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from prometheus_client import Counter, Gauge
+
+RETAINED_RECORDS = Gauge(
+    "retained_records",
+    "Records of a model with a retention policy, as of the last sweep",
+    ["model"],
+)
+RECLAIMED_RECORDS = Counter(
+    "retention_reclaimed_records",
+    "Orphaned records deleted by the retention sweeper, or given a TTL",
+    ["model", "action"],
+)
+UNRESOLVED_RECORDS = Counter(
+    "retention_unresolved_records",
+    "Orphaned records not yet final, handed back to their resolver or kept",
+    ["model", "action"],
+)
+RECLAIMED_BYTES = Counter(
+    "retention_reclaimed_bytes",
+    "Memory of the orphaned records deleted by the retention sweeper",
+    ["model"],
+)
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    How long the records of a model are kept. Models without a policy (orders,
+    items, users) are kept until they are deleted.
+
+    The code that brings a record to its final state gives it ttl_ms through
+    DatabaseClient.expire. Records left without a TTL, because that never
+    happened or the process died before it could, are orphans: the sweeper
+    deletes those created more than orphan_age_s ago, and gives ttl_ms to
+    those without a creation time.
+
+    An orphan is only deleted if its marker is one of `final`, when given:
+    a reservation that still holds stock or credit must be resolved, not
+    forgotten. The other orphans are passed to `unresolved`, by id with the
+    raw marker they were seen with, which hands them to whatever resolves
+    them, or kept as they are without it. Either way they are looked at
+    again on the next sweep.
+    """
+
+    model_class: Type
+    # Attribute every record of the model has, and no other model does
+    marker: str
+    ttl_ms: int
+    orphan_age_s: float
+    # Attribute holding the creation time of a record, in seconds
+    created_at: str = "created_at"
+    # Raw marker values of the records that may be deleted, None for any
+    final: Optional[Tuple[str, ...]] = None
+    unresolved: Optional[Callable[[Dict[str, str]], None]] = None
+
+
+class RetentionSweeper:
+    """
+    Walks the records of every policy with SCAN, a batch at a time, on each
+    master of a Redis client (the shards of a ShardedRedisClient), so it
+    never blocks the checkouts the way KEYS would. Runs in a daemon thread
+    of its own, on the synchronous client.
+    """
+
+    def __init__(
+        self,
+        db,
+        policies: List[RetentionPolicy],
+        interval: float = 300.0,
+        batch_size: int = 1000,
+    ):
+        self.db = db
+        self.policies = policies
+        self.interval = interval
+        self.batch_size = batch_size
+
+    def _sweep_batch(self, client, policy: RetentionPolicy, ids: List[str]) -> int:
+        pipeline = client.redis.pipeline(transaction=False)
+        for id in ids:
+            client._queue_get_attrs(pipeline, id, [policy.marker, policy.created_at])
+            pipeline.pttl(client._get_key(id, policy.marker))
+        replies = pipeline.execute()
+
+        live, orphans, undated, unresolved = 0, [], [], {}
+        cutoff = time.time() - policy.orphan_age_s
+        for id, (marker, created_at), ttl in zip(ids, replies[::2], replies[1::2]):
+            if marker is None:
+                continue
+            live += 1
+            # -1: the key has no TTL, -2: it is already gone
+            if ttl != -1:
+                continue
+            if created_at is None:
+                undated.append(id)
+            elif int(created_at) >= cutoff:
+                continue
+            elif policy.final is None or marker in policy.final:
+                orphans.append(id)
+            else:
+                unresolved[id] = marker
+
+        model = policy.model_class.__name__
+        if unresolved:
+            action = "kept"
+            if policy.unresolved is not None:
+                policy.unresolved(unresolved)
+                action = "handed_over"
+            UNRESOLVED_RECORDS.labels(model=model, action=action).inc(len(unresolved))
+            logging.warning(
+                "%s orphaned %s records are not final (%s)",
+                len(unresolved),
+                model,
+                action,
+            )
+
+        if undated:
+            for id in undated:
+                client.expire(id, policy.ttl_ms, policy.model_class)
+            RECLAIMED_RECORDS.labels(model=model, action="expired").inc(len(undated))
+
+        if orphans:
+            pipeline = client.redis.pipeline(transaction=False)
+            model_class = policy.model_class
+            record_keys = [client._record_keys(id, model_class) for id in orphans]
+            for keys in record_keys:
+                for key in keys:
+                    pipeline.memory_usage(key)
+                pipeline.delete(*keys)
+            replies = iter(pipeline.execute())
+
+            deleted = reclaimed = 0
+            for keys in record_keys:
+                usage = [next(replies) for _ in keys]
+                # Only count what this sweep deleted, not a concurrent one
+                if next(replies):
+                    deleted += 1
+                    reclaimed += sum(u for u in usage if u is not None)
+            RECLAIMED_RECORDS.labels(model=model, action="deleted").inc(deleted)
+            RECLAIMED_BYTES.labels(model=model).inc(reclaimed)
+            logging.warning("Deleted %s orphaned %s records", deleted, model)
+
+        return live
+
+    def sweep(self):
+        """One pass over the records of every policy"""
+        for policy in self.policies:
+            live = 0
+            for client in getattr(self.db, "shards", [self.db]):
+                ids = client._scan_ids(policy.marker, self.batch_size)
+                while batch := list(islice(ids, self.batch_size)):
+                    live += self._sweep_batch(client, policy, batch)
+            RETAINED_RECORDS.labels(model=policy.model_class.__name__).set(live)
+
+    def run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception("Error sweeping orphaned records")
+            time.sleep(self.interval)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
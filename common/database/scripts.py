@@ -0,0 +1,212 @@
+import hashlib
+from typing import Any, Dict, List, Optional
+
+import redis
+import redis.asyncio
+
+
+class Script:
+    """A script of a ScriptRegistry, called like a redis-py Script"""
+
+    def __init__(self, registry: "ScriptRegistry", source: str, read_only: bool):
+        self.registry = registry
+        self.source = source
+        self.read_only = read_only
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    def __call__(self, keys: List[str] = [], args: List[Any] = [], client=None):
+        return self.registry.call(self, keys, args, client)
+
+
+class ScriptRegistry:
+    """
+    The Lua scripts of a client, SCRIPT LOADed on every connection it opens
+    (see on_connect), so they are always called with EVALSHA and the script
+    bodies never travel with a command.
+
+    Connections are opened at startup and again whenever the old ones broke,
+    which includes a restart or a Sentinel failover of the master. The
+    scripts are therefore loaded on every server the client talks to,
+    before the first command reaches it. Pipelines and MULTI blocks can
+    then use EVALSHA as well, without the SCRIPT EXISTS round trip that
+    redis-py's Script adds to every pipeline.
+
+    Only a SCRIPT FLUSH on a live connection can still make the server
+    forget a script. A call outside of a pipeline then loads the scripts
+    again and retries. In a pipeline the NOSCRIPT error is raised on
+    execute, since the other commands may have been applied, and the next
+    call outside of a pipeline loads the scripts again.
+
+    The clients use FunctionRegistry below; this EVALSHA flavour is for
+    servers older than Redis 7.
+    """
+
+    pipeline_class = redis.client.Pipeline
+
+    def __init__(self):
+        self.scripts: Dict[str, Script] = {}
+
+    def register(self, source: str, read_only: bool = False) -> Script:
+        """
+        Add a script, to be loaded on the next connection. Scripts that only
+        read can be marked read_only, so they also run on replicas.
+        """
+        script = Script(self, source, read_only)
+        self.scripts[script.sha] = script
+        return script
+
+    def _load_commands(self):
+        return [("SCRIPT", "LOAD", s.source) for s in self.scripts.values()]
+
+    def _check_loaded(self, reply):
+        """Raise the error reply of a load command, unless it is harmless"""
+        if isinstance(reply, redis.ResponseError):
+            raise reply
+
+    def _missing(self, error: redis.ResponseError) -> bool:
+        return isinstance(error, redis.exceptions.NoScriptError)
+
+    def _call(self, script: Script, keys: List[str], args: List[Any], client):
+        return client.evalsha(script.sha, len(keys), *keys, *args)
+
+    def on_connect(self, connection):
+        """
+        The redis_connect_func of the client: the usual handshake of the
+        connection, then every script loaded in one round trip
+        """
+        connection.on_connect()
+        commands = self._load_commands()
+        if not commands:
+            return
+
+        connection.send_packed_command(
+            connection.pack_commands(commands), check_health=False
+        )
+        for _ in commands:
+            try:
+                connection.read_response()
+            except redis.ResponseError as e:
+                self._check_loaded(e)
+
+    def load(self, client):
+        pipeline = client.pipeline(transaction=False)
+        for command in self._load_commands():
+            pipeline.execute_command(*command)
+        for reply in pipeline.execute(raise_on_error=False):
+            self._check_loaded(reply)
+
+    def call(self, script: Script, keys: List[str], args: List[Any], client):
+        if isinstance(client, self.pipeline_class):
+            return self._call(script, keys, args, client)
+
+        try:
+            return self._call(script, keys, args, client)
+        except redis.ResponseError as e:
+            if not self._missing(e):
+                raise
+            self.load(client)
+            return self._call(script, keys, args, client)
+
+
+class AsyncScriptRegistry(ScriptRegistry):
+    """ScriptRegistry of the redis.asyncio clients"""
+
+    pipeline_class = redis.asyncio.client.Pipeline
+
+    async def on_connect(self, connection):
+        await connection.on_connect()
+        commands = self._load_commands()
+        if not commands:
+            return
+
+        await connection.send_packed_command(
+            connection.pack_commands(commands), check_health=False
+        )
+        for _ in commands:
+            try:
+                await connection.read_response()
+            except redis.ResponseError as e:
+                self._check_loaded(e)
+
+    async def load(self, client):
+        pipeline = client.pipeline(transaction=False)
+        for command in self._load_commands():
+            pipeline.execute_command(*command)
+        for reply in await pipeline.execute(raise_on_error=False):
+            self._check_loaded(reply)
+
+    async def call(self, script: Script, keys: List[str], args: List[Any], client):
+        if isinstance(client, self.pipeline_class):
+            return await self._call(script, keys, args, client)
+
+        try:
+            return await self._call(script, keys, args, client)
+        except redis.ResponseError as e:
+            if not self._missing(e):
+                raise
+            await self.load(client)
+            return await self._call(script, keys, args, client)
+
+
+class FunctionsMixin:
+    """
+    Installs every script as a Redis 7 function in a library of its own,
+    named after the hash of its source, and calls it with FCALL.
+
+    Functions are part of the dataset: they are persisted and replicated
+    like keys, so a promoted replica can serve them the moment it becomes
+    master. Loading them on connect is then a cheap no-op ("already
+    exists"), kept for a master that lost its data, and a library never
+    has to be replaced since a changed script gets a new name.
+    """
+
+    FUNCTION_PREFIX = "dds_"
+
+    def _function(self, script: Script) -> str:
+        return self.FUNCTION_PREFIX + script.sha
+
+    def _library(self, script: Script) -> str:
+        # KEYS and ARGV as the callback parameters keep the script bodies as
+        # they are
+        name = self._function(script)
+        flags = ", flags={'no-writes'}" if script.read_only else ""
+        return (
+            f"#!lua name={name}\n"
+            f"redis.register_function{{function_name='{name}', "
+            f"callback=function(KEYS, ARGV)\n{script.source}\nend{flags}}}\n"
+        )
+
+    def _load_commands(self):
+        return [
+            ("FUNCTION", "LOAD", self._library(s)) for s in self.scripts.values()
+        ]
+
+    def _check_loaded(self, reply):
+        if isinstance(reply, redis.ResponseError) and "already exists" not in str(
+            reply
+        ):
+            raise reply
+
+    def _missing(self, error: redis.ResponseError) -> bool:
+        return "Function not found" in str(error)
+
+    def _call(self, script: Script, keys: List[str], args: List[Any], client):
+        return client.fcall(self._function(script), len(keys), *keys, *args)
+
+
+class FunctionRegistry(FunctionsMixin, ScriptRegistry):
+    pass
+
+
+class AsyncFunctionRegistry(FunctionsMixin, AsyncScriptRegistry):
+    pass
+
+
+def registry_of(client) -> Optional[ScriptRegistry]:
+    """
+    The registry loaded on the connections of a redis-py client, i.e. the one
+    of the RedisClient that opened it, None for a client opened elsewhere
+    """
+    connect = client.connection_pool.connection_kwargs.get("redis_connect_func")
+    registry = getattr(connect, "__self__", None)
+    return registry if isinstance(registry, ScriptRegistry) else None
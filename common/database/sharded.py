@@ -0,0 +1,1342 @@
+import asyncio
+import bisect
+import copy
+import hashlib
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from .database import DatabaseClient, ReserveResult, TransactionConfig, TransactionError
+from .codec import codec_for
+from .redis import AGGREGATED_ATTRIBUTES, RedisClient, reserve_flags
+
+T = TypeVar("T")
+
+# Every shard keeps the items it holds for a tid in HOLD_KEY, a hash of
+# counter key -> amount, and the tids it holds anything for in HOLDS_KEY,
+# scored by the time of the hold in ms.
+HOLD_KEY = "hold:{}"
+HOLDS_KEY = "holds"
+# On the shard of the tid: whether a multi-shard reservation committed or was
+# given up by release_orphaned_holds. Whichever is written first wins.
+DECISION_KEY = "decision:{}"
+# On the shards of the items of a tid: that resolve already applied their part
+# of its outcome
+RESOLVED_KEY = "resolved:{}"
+# TransactionStatus.SUCCESS and FAILURE, as stored
+COMMITTED = "2"
+ABORTED = "1"
+# On the first shard: the counters of an attribute split with shard_counter,
+# a hash of id -> number of sub-counters
+COUNTERS_KEY = "counters:{}"
+# Sub-counter k > 0 of the counter attribute of id. Sub-counter 0 is the
+# counter's own key.
+SUB_COUNTER_KEY = "counter:{}:{}:{}"
+
+# Conditional decrement of every counter of one shard for a tid, recording
+# what was taken so it can be given back. A negative amount is only recorded,
+# and added to its counter once the tid commits (see rebalance_counter).
+# KEYS[1] = hold, KEYS[2] = holds, KEYS[3] = aggregate, KEYS[4..] = counters
+# ARGV[1] = tid, ARGV[2..] = amounts
+HOLD_SCRIPT = """
+for i = 4, #KEYS do
+    local amount = tonumber(ARGV[i - 2])
+    local current = tonumber(redis.call('get', KEYS[i]))
+    if amount > 0 and (current == nil or amount > current) then
+        return -1
+    end
+end
+
+local total = 0
+for i = 4, #KEYS do
+    local amount = tonumber(ARGV[i - 2])
+    if amount > 0 then
+        redis.call('decrby', KEYS[i], amount)
+        total = total + amount
+    end
+    redis.call('hincrby', KEYS[1], KEYS[i], amount)
+end
+redis.call('decrby', KEYS[3], total)
+
+local now = redis.call('time')
+redis.call('zadd', KEYS[2], now[1] * 1000 + math.floor(now[2] / 1000), ARGV[1])
+return 1
+"""
+
+# Forget the hold of a tid. Of the counters in KEYS, those it took from get
+# their amounts back when ARGV[2] is '1', and those it credits get theirs
+# otherwise, the aggregate following. Settling a hold twice is a no-op.
+# KEYS[1] = hold, KEYS[2] = holds, KEYS[3] = aggregate, KEYS[4..] = counters
+# ARGV[1] = tid, ARGV[2] = release flag
+SETTLE_SCRIPT = """
+local release = ARGV[2] == '1'
+local total = 0
+for i = 4, #KEYS do
+    local amount = tonumber(redis.call('hget', KEYS[1], KEYS[i]))
+    if amount and (amount > 0) == release then
+        redis.call('incrby', KEYS[i], math.abs(amount))
+        total = total + math.abs(amount)
+    end
+end
+if total > 0 then
+    redis.call('incrby', KEYS[3], total)
+end
+redis.call('del', KEYS[1])
+redis.call('zrem', KEYS[2], ARGV[1])
+"""
+
+# The tids held for longer than ARGV[1] ms, at most ARGV[2] of them
+# KEYS[1] = holds
+ORPHANED_HOLDS_SCRIPT = """
+local now = redis.call('time')
+local cutoff = now[1] * 1000 + math.floor(now[2] / 1000) - tonumber(ARGV[1])
+return redis.call('zrangebyscore', KEYS[1], '-inf', cutoff, 'LIMIT', 0, ARGV[2])
+"""
+
+# The RESERVE_SCRIPT of a reservation whose items were held on other shards:
+# refuses a STALE tid or one given up by release_orphaned_holds, otherwise
+# writes the transaction with its final status and the streams as
+# RESERVE_SCRIPT does, and records the decision if it committed.
+# KEYS[1..n] = transaction attribute keys (status first), KEYS[n+1] = stream,
+# KEYS[n+2] = outcome stream, KEYS[n+3] = decision
+# ARGV[1] = n, ARGV[2..n+1] = transaction values, ARGV[n+2] = tid,
+# ARGV[n+3] = flags, ARGV[n+4] = final status, ARGV[n+5] = decision ttl in ms
+FINISH_SCRIPT = """
+local n = tonumber(ARGV[1])
+
+if redis.call('get', KEYS[1]) == '3' or redis.call('exists', KEYS[n + 3]) == 1 then
+    return -2
+end
+
+for i = 1, n do
+    redis.call('set', KEYS[i], ARGV[i + 1])
+end
+
+local status = ARGV[n + 4]
+redis.call('set', KEYS[1], status)
+
+local flags = tonumber(ARGV[n + 3])
+if flags % 2 == 1 then
+    redis.call('xadd', KEYS[n + 1], '*', 'tid', ARGV[n + 2])
+end
+if flags >= 2 then
+    redis.call('xadd', KEYS[n + 2], '*', 'tid', ARGV[n + 2], 'status', status)
+end
+
+if status == '2' then
+    redis.call('set', KEYS[n + 3], status, 'PX', ARGV[n + 5])
+    return 1
+end
+return -1
+"""
+
+
+# Add the amounts to the counters of one shard for a tid, and ARGV[2] to the
+# aggregate unless it is 0, at most once while the marker lives.
+# KEYS[1] = marker, KEYS[2] = aggregate, KEYS[3..] = counters
+# ARGV[1] = marker ttl in ms, ARGV[2] = aggregate amount, ARGV[3..] = amounts
+APPLY_ONCE_SCRIPT = """
+if not redis.call('set', KEYS[1], 1, 'NX', 'PX', ARGV[1]) then
+    return 0
+end
+
+for i = 3, #KEYS do
+    redis.call('incrby', KEYS[i], ARGV[i])
+end
+if ARGV[2] ~= '0' then
+    redis.call('incrby', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+
+class HashRing:
+    """Consistent hashing of ids onto nodes, with `points` virtual nodes each"""
+
+    def __init__(self, nodes: List[str], points: int = 160):
+        ring = sorted(
+            (self._hash(f"{node}#{point}"), index)
+            for index, node in enumerate(nodes)
+            for point in range(points)
+        )
+        self._hashes = [h for h, _ in ring]
+        self._nodes = [index for _, index in ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def node(self, id: str) -> int:
+        """Index of the node owning id"""
+        i = bisect.bisect(self._hashes, self._hash(id)) % len(self._hashes)
+        return self._nodes[i]
+
+    def nodes(self, id: str, n: int) -> List[int]:
+        """The first n distinct nodes met walking the ring from id, its owner first"""
+        i = bisect.bisect(self._hashes, self._hash(id))
+        found = []
+        for j in range(len(self._nodes)):
+            node = self._nodes[(i + j) % len(self._nodes)]
+            if node not in found:
+                found.append(node)
+                if len(found) == n:
+                    break
+        return found
+
+
+def shard_configs(shards: str, redis_config: Dict[str, Any]) -> Dict[str, dict]:
+    """
+    Client configs of the REDIS_SHARDS setting: comma separated Sentinel
+    master names when redis_config uses Sentinel, host[:port] otherwise.
+    """
+    configs = {}
+    for shard in shards.split(","):
+        if redis_config.get("sentinel_hosts"):
+            configs[shard] = dict(redis_config, master_name=shard)
+        else:
+            host, _, port = shard.partition(":")
+            configs[shard] = dict(
+                redis_config, host=host, port=int(port or redis_config["port"])
+            )
+    return configs
+
+
+class ShardedStreamProducer:
+    """A stream on every shard; entries go to the shard of their tid"""
+
+    def __init__(self, db, stream_key):
+        self.db = db
+        self.producers = [shard.get_stream_producer(stream_key) for shard in db.shards]
+
+    def push(self, id="*", **data):
+        index = self.db.shard_index(data.get("tid", ""))
+        return self.producers[index].push(id, **data)
+
+    def size(self):
+        return sum(producer.size() for producer in self.producers)
+
+
+class AsyncShardedStreamProducer(ShardedStreamProducer):
+    async def size(self):
+        sizes = await asyncio.gather(*(p.size() for p in self.producers))
+        return sum(sizes)
+
+
+class ShardedStreamProcessor:
+    """
+    One StreamProcessor per shard, consuming the stream of that shard, run
+    together with the sweeper of orphaned holds.
+    """
+
+    def __init__(self, db, processors):
+        self.db = db
+        self.processors = processors
+
+    def start_worker(self, consumer_group: str, consumer_name: str):
+        for processor in self.processors[1:]:
+            threading.Thread(
+                target=processor.start_worker,
+                args=(consumer_group, consumer_name),
+                daemon=True,
+            ).start()
+        threading.Thread(target=self.db.run_hold_sweeper, daemon=True).start()
+        self.processors[0].start_worker(consumer_group, consumer_name)
+
+
+class AsyncShardedStreamProcessor(ShardedStreamProcessor):
+    async def start_worker(self, consumer_group: str, consumer_name: str):
+        await asyncio.gather(
+            *(p.start_worker(consumer_group, consumer_name) for p in self.processors),
+            self.db.run_hold_sweeper(),
+        )
+
+
+class ShardedRedisClient(DatabaseClient[T]):
+    """
+    RedisClient spread over several independent masters, each its own
+    Sentinel service. Every model lives on the shard its id maps to on a
+    consistent-hash ring, so operations on one model go straight to one
+    master, and adding a shard only moves about 1/N of the ids.
+
+    A reservation whose transaction and items all map to one shard is that
+    shard's atomic reserve. Otherwise the items are first held on their
+    shards (a conditional decrement that records what it took), and the
+    transaction is then finished on its own shard, which still refuses a
+    STALE tid. The holds are dropped once the transaction committed and
+    given back otherwise. Holds left behind by a caller that died half way
+    are settled by release_orphaned_holds, according to the decision the
+    finish recorded, or by recording an abort first.
+
+    The counter of a hot item can be split over several shards with
+    shard_counter, so its reservations are spread over them too.
+
+    Only the keys layout is supported. Streams exist once per shard, each
+    entry on the shard of its tid.
+    """
+
+    producer_class = ShardedStreamProducer
+    processor_class = ShardedStreamProcessor
+    # How long the split counters read from COUNTERS_KEY are used before they
+    # are read again, and the least time between two rebalances of a counter
+    counter_check_interval = 1.0
+
+    def __init__(
+        self,
+        shards: Dict[str, RedisClient],
+        hold_timeout_ms: int = 60000,
+        decision_ttl_ms: int = 3600000,
+    ):
+        self.names = list(shards)
+        self.shards = list(shards.values())
+        self.ring = HashRing(self.names)
+        self.hold_timeout_ms = hold_timeout_ms
+        self.decision_ttl_ms = decision_ttl_ms
+        # attribute -> (time read, id -> number of sub-counters)
+        self._counters = {}
+        # (id, attribute) -> time of the last rebalance of a sub-counter that ran dry
+        self._rebalanced = {}
+        self._register_scripts()
+
+    def _register_scripts(self):
+        # Added to the registries of the shards, so their connections load them
+        self._hold_scripts = [s.scripts.register(HOLD_SCRIPT) for s in self.shards]
+        self._settle_scripts = [s.scripts.register(SETTLE_SCRIPT) for s in self.shards]
+        self._orphaned_scripts = [
+            s.scripts.register(ORPHANED_HOLDS_SCRIPT) for s in self.shards
+        ]
+        self._finish_scripts = [s.scripts.register(FINISH_SCRIPT) for s in self.shards]
+        self._apply_once_scripts = [
+            s.scripts.register(APPLY_ONCE_SCRIPT) for s in self.shards
+        ]
+
+    def shard_index(self, id: str) -> int:
+        return self.ring.node(id)
+
+    def shard_for(self, id: str) -> RedisClient:
+        return self.shards[self.ring.node(id)]
+
+    def _positions(self, ids: List[str]) -> Dict[int, List[int]]:
+        positions = defaultdict(list)
+        for position, id in enumerate(ids):
+            positions[self.shard_index(id)].append(position)
+        return positions
+
+    def _split(self, values: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        groups = defaultdict(dict)
+        for id, value in values.items():
+            groups[self.shard_index(id)][id] = value
+        return groups
+
+    def _sub_counters(self, id: str, attribute: str, n: int) -> List[Tuple[int, str]]:
+        """
+        (shard, key) of the n sub-counters of the counter attribute of id, on
+        the first n distinct shards of the ring from id, its own shard first
+        """
+        return [
+            (
+                index,
+                SUB_COUNTER_KEY.format(id, k, attribute)
+                if k
+                else self.shards[index]._get_key(id, attribute),
+            )
+            for k, index in enumerate(self.ring.nodes(id, n))
+        ]
+
+    @staticmethod
+    def _sharded(changes: Dict[str, int], counters: Dict[str, int]) -> Dict[str, int]:
+        """The ids of changes whose counter is split, with their sub-counter count"""
+        return {id: counters[id] for id in changes if id in counters}
+
+    def _place(
+        self,
+        changes: Dict[str, int],
+        attribute: str,
+        sharded: Dict[str, int],
+        values: Optional[Dict[str, List[int]]] = None,
+    ) -> Dict[int, Dict[str, int]]:
+        """
+        The counter keys to take changes from, by shard. The amount of a
+        sharded id comes from a random sub-counter, or, given the values of
+        its sub-counters, from as few of them as cover it, largest first.
+        """
+        groups = defaultdict(dict)
+        for id, amount in changes.items():
+            subs = self._sub_counters(id, attribute, sharded.get(id, 1))
+            if values is None or id not in values or sum(values[id]) < amount:
+                index, key = random.choice(subs)
+                groups[index][key] = amount
+                continue
+
+            for (index, key), value in sorted(
+                zip(subs, values[id]), key=lambda sub: -sub[1]
+            ):
+                if amount <= 0:
+                    break
+                groups[index][key] = min(amount, value)
+                amount -= value
+        return groups
+
+    @staticmethod
+    def _even_out(
+        subs: List[Tuple[int, str]], values: List[int]
+    ) -> Dict[int, Dict[str, int]]:
+        """
+        What to take from (> 0) or add to (< 0) each sub-counter, by shard, for
+        them all to hold an even share of their total
+        """
+        share, rest = divmod(sum(values), len(values))
+        moves = defaultdict(dict)
+        for k, ((index, key), value) in enumerate(zip(subs, values)):
+            excess = value - share - (1 if k < rest else 0)
+            if excess:
+                moves[index][key] = excess
+        return moves
+
+    def _due_rebalances(self, sharded: Dict[str, int], attribute: str):
+        """The sharded counters not rebalanced for counter_check_interval seconds"""
+        now = time.monotonic()
+        due = {}
+        for id, n in sharded.items():
+            if now - self._rebalanced.get((id, attribute), 0.0) >= (
+                self.counter_check_interval
+            ):
+                self._rebalanced[(id, attribute)] = now
+                due[id] = n
+        return due
+
+    @staticmethod
+    def _check_split(shards: int, current: int, available: int):
+        if not 1 <= shards <= available:
+            raise ValueError(f"A counter can be split over 1 to {available} shards")
+        if shards < current:
+            raise ValueError(f"The counter is split over {current} shards already")
+
+    def _counter_shards(self, attribute: str) -> Dict[str, int]:
+        """
+        The counters of attribute split with shard_counter, id -> number of
+        sub-counters, read from the first shard at most every
+        counter_check_interval seconds. Until a client reads a new split, it
+        keeps taking from sub-counter 0 only, which is just as safe.
+        """
+        checked, counters = self._counters.get(attribute, (None, {}))
+        now = time.monotonic()
+        if checked is None or now - checked >= self.counter_check_interval:
+            counters = self.shards[0].redis.hgetall(COUNTERS_KEY.format(attribute))
+            counters = {id: int(n) for id, n in counters.items()}
+            self._counters[attribute] = (now, counters)
+        return counters
+
+    def _sub_counter_values(
+        self, sharded: Dict[str, int], attribute: str
+    ) -> Dict[str, List[int]]:
+        return {
+            id: [
+                int(self.shards[index].redis.get(key) or 0)
+                for index, key in self._sub_counters(id, attribute, n)
+            ]
+            for id, n in sharded.items()
+        }
+
+    # Operations on a single model run on its shard. On the async client the
+    # shard returns the coroutine, which the caller awaits.
+
+    def get(self, id: str, model_class: Type[T]) -> Optional[T]:
+        return self.shard_for(id).get(id, model_class)
+
+    def save(self, model: T) -> None:
+        return self.shard_for(model.id).save(model)
+
+    def delete(self, obj: T) -> bool:
+        return self.shard_for(obj.id).delete(obj)
+
+    def get_attr(self, id: str, attribute: str, model_class: Type[T]) -> Any:
+        return self.shard_for(id).get_attr(id, attribute, model_class)
+
+    def set_attr(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> None:
+        return self.shard_for(id).set_attr(id, attribute, value, model_class)
+
+    def set_attr_if_absent(
+        self, id: str, attribute: str, value: Any, model_class: Type[T]
+    ) -> bool:
+        return self.shard_for(id).set_attr_if_absent(id, attribute, value, model_class)
+
+    def delete_attr(self, id: str, attribute: str) -> None:
+        return self.shard_for(id).delete_attr(id, attribute)
+
+    def expire(self, id: str, ttl_ms: int, model_class: Type[T]) -> None:
+        return self.shard_for(id).expire(id, ttl_ms, model_class)
+
+    def increment(self, id: str, attribute: str, amount: int = 1) -> int:
+        return self.shard_for(id).increment(id, attribute, amount)
+
+    def decrement(self, id: str, attribute: str, amount: int = 1) -> int:
+        return self.shard_for(id).decrement(id, attribute, amount)
+
+    def append_and_increment(
+        self,
+        id: str,
+        attribute: str,
+        value: Any,
+        counter: str,
+        amount: int,
+        model_class: Type[T],
+    ) -> Optional[int]:
+        return self.shard_for(id).append_and_increment(
+            id, attribute, value, counter, amount, model_class
+        )
+
+    def compare_and_set(
+        self, id: str, attribute: str, expected_value: Any, new_value: Any
+    ) -> bool:
+        return self.shard_for(id).compare_and_set(
+            id, attribute, expected_value, new_value
+        )
+
+    def transaction(self, config: TransactionConfig = TransactionConfig()):
+        """The transaction of the one shard holding every watched id"""
+        shards = {self.shard_index(id) for id, _ in config.begin.get("watch", [])}
+        if len(shards) != 1:
+            raise TransactionError("A transaction must watch ids of a single shard")
+        return self.shards[shards.pop()].transaction(config)
+
+    def replica(self):
+        """This client reading every shard from its replica (RedisClient.replica)"""
+        view = copy.copy(self)
+        view.shards = [shard.replica() for shard in self.shards]
+        return view
+
+    def get_stream_producer(self, stream_key):
+        return self.producer_class(self, stream_key)
+
+    def initialize_stream_processor(self, processor_class):
+        processors = [
+            shard.initialize_stream_processor(processor_class) for shard in self.shards
+        ]
+        return self.processor_class(self, processors)
+
+    def _hold(self, index: int, tid: str, counters: Dict[str, int], attribute: str):
+        shard = self.shards[index]
+        return self._hold_scripts[index](
+            keys=[HOLD_KEY.format(tid), HOLDS_KEY, shard._aggregate_key(attribute)]
+            + list(counters),
+            args=[tid] + list(counters.values()),
+            client=shard.redis,
+        )
+
+    def _settle(self, index: int, tid: str, release: bool, counters: List[str]):
+        """
+        Run SETTLE_SCRIPT for the hold of tid on a shard, giving back what it
+        holds of counters (keys of one attribute) when release is set
+        """
+        shard = self.shards[index]
+        keys = [HOLD_KEY.format(tid), HOLDS_KEY]
+        if counters:
+            attribute = counters[0].rsplit(":", 1)[1]
+            keys += [shard._aggregate_key(attribute)] + counters
+        return self._settle_scripts[index](
+            keys=keys, args=[tid, int(release)], client=shard.redis
+        )
+
+    def _orphaned_keys(self, index: int, tid: str) -> List[str]:
+        """The counters held for tid on a shard, read before settling its hold"""
+        return self.shards[index].redis.hkeys(HOLD_KEY.format(tid))
+
+    def _finish(
+        self,
+        tid: str,
+        keys: List[str],
+        values: List[Any],
+        status: str,
+        stream_key: Optional[str] = None,
+        outcome_key: Optional[str] = None,
+    ):
+        """Run FINISH_SCRIPT for the transaction attribute keys of tid"""
+        flags = reserve_flags(stream_key, outcome_key)
+        index = self.shard_index(tid)
+        return self._finish_scripts[index](
+            keys=keys
+            + [stream_key or keys[0], outcome_key or keys[0], DECISION_KEY.format(tid)],
+            args=[len(keys)] + values + [tid, flags, status, self.decision_ttl_ms],
+            client=self.shards[index].redis,
+        )
+
+    def _transaction_keys(self, transaction) -> Tuple[List[str], List[Any]]:
+        codec = codec_for(type(transaction))
+        shard = self.shard_for(transaction.id)
+        return shard._get_model_keys(transaction.id, codec), codec.encode(transaction)
+
+    def _status_keys(self, tid: str) -> Tuple[List[str], List[Any]]:
+        return [self.shard_for(tid)._get_key(tid, "status")], [0]
+
+    def _hold_all(self, tid: str, groups: Dict[int, Dict[str, int]], attribute: str):
+        """Hold every group on its shard; the shards held, stopping at a failure"""
+        held = []
+        for index, changes in groups.items():
+            if self._hold(index, tid, changes, attribute) != 1:
+                break
+            held.append(index)
+        return held
+
+    def _settle_all(
+        self,
+        tid: str,
+        groups: Dict[int, Dict[str, int]],
+        held: List[int],
+        release: bool,
+    ):
+        for index in held:
+            self._settle(index, tid, release, list(groups[index]))
+
+    def _reserve_across(
+        self,
+        tid: str,
+        changes: Dict[str, int],
+        sharded: Dict[str, int],
+        attribute: str,
+        keys: List[str],
+        values: List[Any],
+        stream_key: Optional[str] = None,
+        outcome_key: Optional[str] = None,
+    ) -> ReserveResult:
+        groups = self._place(changes, attribute, sharded)
+        held = self._hold_all(tid, groups, attribute)
+        dry = len(held) < len(groups) and sharded
+        if dry:
+            # The sub-counters picked may have run dry while others still
+            # have enough: hold again from those
+            self._settle_all(tid, groups, held, release=True)
+            groups = self._place(
+                changes,
+                attribute,
+                sharded,
+                self._sub_counter_values(sharded, attribute),
+            )
+            held = self._hold_all(tid, groups, attribute)
+
+        status = COMMITTED if len(held) == len(groups) else ABORTED
+        result = ReserveResult(
+            self._finish(tid, keys, values, status, stream_key, outcome_key)
+        )
+        self._settle_all(tid, groups, held, release=result != ReserveResult.OK)
+        if dry:
+            for id, n in self._due_rebalances(sharded, attribute).items():
+                self.rebalance_counter(id, attribute, n)
+        return result
+
+    def reserve(
+        self,
+        transaction,
+        changes: Dict[str, int],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> ReserveResult:
+        """
+        RedisClient.reserve, across shards when the ids are spread over them
+        or any of their counters is split
+        """
+        if not changes:
+            return ReserveResult.INSUFFICIENT
+
+        home = self.shard_index(transaction.id)
+        sharded = self._sharded(changes, self._counter_shards(attribute))
+        if not sharded and list(self._split(changes)) == [home]:
+            return self.shards[home].reserve(
+                transaction, changes, attribute, stream_key, outcome_key
+            )
+
+        keys, values = self._transaction_keys(transaction)
+        return self._reserve_across(
+            transaction.id,
+            changes,
+            sharded,
+            attribute,
+            keys,
+            values,
+            stream_key,
+            outcome_key,
+        )
+
+    def _local_reservations(
+        self, reservations, counters: Dict[str, int]
+    ) -> Dict[int, List[int]]:
+        """
+        Positions of the reservations that each fit on one shard, by shard,
+        leaving out those taking from a split counter
+        """
+        local = defaultdict(list)
+        for position, (transaction, changes) in enumerate(reservations):
+            home = self.shard_index(transaction.id)
+            if changes and all(
+                self.shard_index(id) == home and id not in counters for id in changes
+            ):
+                local[home].append(position)
+        return local
+
+    def reserve_all(
+        self,
+        reservations: List[Tuple[Any, Dict[str, int]]],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> List[ReserveResult]:
+        """
+        RedisClient.reserve_all, with the reservations that fit on one shard
+        pipelined per shard and the others reserved one by one.
+        """
+        results = [None] * len(reservations)
+        local = self._local_reservations(reservations, self._counter_shards(attribute))
+        for index, positions in local.items():
+            replies = self.shards[index].reserve_all(
+                [reservations[p] for p in positions], attribute, stream_key, outcome_key
+            )
+            for position, result in zip(positions, replies):
+                results[position] = result
+
+        for position, (transaction, changes) in enumerate(reservations):
+            if results[position] is None:
+                results[position] = self.reserve(
+                    transaction, changes, attribute, stream_key, outcome_key
+                )
+        return results
+
+    def m_gte_decrement(
+        self, changes: Dict[str, int], attribute: str, tid: str
+    ) -> bool:
+        """RedisClient.m_gte_decrement, holding the ids of every shard first"""
+        if not changes:
+            return False
+
+        home = self.shard_index(tid)
+        sharded = self._sharded(changes, self._counter_shards(attribute))
+        if not sharded and list(self._split(changes)) == [home]:
+            return self.shards[home].m_gte_decrement(changes, attribute, tid)
+
+        keys, values = self._status_keys(tid)
+        result = self._reserve_across(tid, changes, sharded, attribute, keys, values)
+        return result == ReserveResult.OK
+
+    def lte_decrement(self, id: str, attribute: str, amount: int, tid: str) -> bool:
+        if self.shard_index(id) == self.shard_index(tid) and id not in (
+            self._counter_shards(attribute)
+        ):
+            return self.shard_for(id).lte_decrement(id, attribute, amount, tid)
+        return self.m_gte_decrement({id: amount}, attribute, tid)
+
+    def shard_counter(self, id: str, attribute: str, shards: int) -> Optional[int]:
+        """
+        Split the counter attribute of id over `shards` sub-counters with an
+        even share each, on as many shards: the next ones on the ring from id,
+        its own shard keeping the counter's key as sub-counter 0. Reservations
+        then take from a random sub-counter, so a hot item no longer sends
+        them all to one key of one master. When the one picked runs dry, the
+        reservation takes from those that still cover it and the sub-counters
+        are evened out again (rebalance_counter). Every sub-counter is only
+        ever decremented conditionally, so none, and neither their total,
+        goes below zero. Calling it again with the same count rebalances.
+
+        Only reservations, decrements and get_counter see the sub-counters.
+        Other reads and writes of the attribute use sub-counter 0.
+
+        Returns:
+            The total of the counter, None if id has no such attribute.
+
+        Raises:
+            ValueError: For more sub-counters than shards, or fewer than the
+                counter already has, as a split counter is not merged back.
+        """
+        key = COUNTERS_KEY.format(attribute)
+        current = int(self.shards[0].redis.hget(key, id) or 1)
+        self._check_split(shards, current, len(self.shards))
+        if self.shard_for(id).get_counter(id, attribute) is None:
+            return None
+
+        if shards > 1:
+            self.shards[0].redis.hset(key, id, shards)
+            self._counters.pop(attribute, None)
+        # Evening out fails when a reservation changes a sub-counter meanwhile
+        for _ in range(3):
+            if self.rebalance_counter(id, attribute, shards):
+                break
+        return self.get_counter(id, attribute)
+
+    def get_counter(self, id: str, attribute: str) -> Optional[int]:
+        """The total of the counter attribute of id over its sub-counters"""
+        n = self._counter_shards(attribute).get(id, 1)
+        values = [
+            self.shards[index].redis.get(key)
+            for index, key in self._sub_counters(id, attribute, n)
+        ]
+        if values[0] is None:
+            return None
+        return sum(int(value or 0) for value in values)
+
+    def rebalance_counter(self, id: str, attribute: str, n: int) -> bool:
+        """
+        Even out the n sub-counters of the counter attribute of id. The move
+        runs under a tid of its own, like a reservation across shards: what
+        it takes is held, what it adds is held as a credit, and both are
+        settled once the move is decided. A crash half way is completed or
+        undone by release_orphaned_holds. A move that finds a sub-counter
+        lower than read, as a reservation took from it, is given up.
+
+        Returns:
+            bool: Whether the sub-counters were evened out.
+        """
+        subs = self._sub_counters(id, attribute, n)
+        moves = self._even_out(subs, self._sub_counter_values({id: n}, attribute)[id])
+        if not moves:
+            return True
+
+        tid = str(uuid.uuid4())
+        held = self._hold_all(tid, moves, attribute)
+        committed = len(held) == len(moves) and self._decide(tid, COMMITTED)
+        self._settle_all(tid, moves, held, release=not committed)
+        return committed
+
+    def _apply_once(
+        self, index: int, tid: str, changes: Dict[str, int], attribute: str
+    ):
+        shard = self.shards[index]
+        aggregated = attribute in AGGREGATED_ATTRIBUTES
+        return self._apply_once_scripts[index](
+            keys=[RESOLVED_KEY.format(tid), shard._aggregate_key(attribute)]
+            + [shard._get_key(k, attribute) for k in changes],
+            args=[self.decision_ttl_ms, sum(changes.values()) if aggregated else 0]
+            + list(changes.values()),
+            client=shard.redis,
+        )
+
+    def _split_resolution(self, transaction, changes: Dict[str, int]):
+        """The changes on the shard of the transaction, and those on the others"""
+        home = self.shard_index(transaction.id)
+        groups = self._split(changes)
+        return home, groups.pop(home, {}), groups
+
+    @staticmethod
+    def _resolvable(transaction, current) -> bool:
+        return (
+            current is not None
+            and current.status == transaction.status
+            and current.locked
+        )
+
+    def resolve(self, transaction, changes: Dict[str, int], attribute: str) -> bool:
+        """
+        RedisClient.resolve. The amounts of ids on other shards are added
+        there first, once per tid (RESOLVED_KEY, for decision_ttl_ms), and
+        the resolve on the shard of the transaction then adds its own and
+        deletes the record, so resolving again after a crash in between
+        completes the outcome without applying any part of it twice.
+        """
+        home, local, remote = self._split_resolution(transaction, changes)
+        if remote:
+            current = self.shards[home].get(transaction.id, type(transaction))
+            if not self._resolvable(transaction, current):
+                return False
+            for index, group in remote.items():
+                self._apply_once(index, transaction.id, group, attribute)
+        return self.shards[home].resolve(transaction, local, attribute)
+
+    def _decide(self, tid: str, decision: str) -> bool:
+        """Record decision for tid unless one was made first; whether it committed"""
+        home = self.shard_for(tid).redis
+        key = DECISION_KEY.format(tid)
+        home.set(key, decision, nx=True, px=self.decision_ttl_ms)
+        return home.get(key) == COMMITTED
+
+    def release_orphaned_holds(self, count: int = 100) -> int:
+        """
+        Settle holds older than hold_timeout_ms, which the caller that placed
+        them did not live to settle: dropped if their reservation committed,
+        given back otherwise, after recording the abort so that a finish still
+        on its way is refused. The credits of a rebalance_counter move are
+        added if it committed and dropped otherwise.
+
+        Returns:
+            int: The number of holds settled.
+        """
+        settled = 0
+        for index, orphaned in enumerate(self._orphaned_scripts):
+            tids = orphaned(
+                keys=[HOLDS_KEY],
+                args=[self.hold_timeout_ms, count],
+                client=self.shards[index].redis,
+            )
+            for tid in tids:
+                committed = self._decide(tid, ABORTED)
+                counters = self._orphaned_keys(index, tid)
+                self._settle(index, tid, not committed, counters)
+                settled += 1
+        return settled
+
+    def run_hold_sweeper(self, interval: float = 5.0):
+        while True:
+            try:
+                if self.release_orphaned_holds():
+                    logging.warning("Settled orphaned holds of reservations")
+            except Exception:
+                logging.exception("Error settling orphaned holds")
+            time.sleep(interval)
+
+    def get_all(self, ids: List[str], model_class: Type[T]) -> List[Optional[T]]:
+        ids = list(ids)
+        result = [None] * len(ids)
+        for index, positions in self._positions(ids).items():
+            group = [ids[p] for p in positions]
+            models = self.shards[index].get_all(group, model_class)
+            for position, model in zip(positions, models):
+                result[position] = model
+        return result
+
+    def save_all(self, models: List[T]) -> None:
+        groups = defaultdict(list)
+        for model in models:
+            groups[self.shard_index(model.id)].append(model)
+        for index, group in groups.items():
+            self.shards[index].save_all(group)
+
+    def m_get_attr(self, ids: List[str], attribute: str, model_class: Type[T]):
+        result = {}
+        for index, positions in self._positions(ids).items():
+            values = self.shards[index].m_get_attr(
+                [ids[p] for p in positions], attribute, model_class
+            )
+            if values is None:
+                return None
+            result.update(values)
+        return result
+
+    def m_set_attr(self, values: Dict[str, Any], attribute: str, model_class: Type[T]):
+        for index, group in self._split(values).items():
+            self.shards[index].m_set_attr(group, attribute, model_class)
+
+    def keys(self, match: str = "*") -> List[str]:
+        return [key for shard in self.shards for key in shard.keys(match)]
+
+    def iter_ids(self, model_class: Type[T], batch: int = 1000) -> Iterator[str]:
+        """RedisClient.iter_ids, one shard after the other"""
+        for shard in self.shards:
+            yield from shard.iter_ids(model_class, batch)
+
+    def iter_models(self, model_class: Type[T], batch: int = 1000) -> Iterator[T]:
+        for shard in self.shards:
+            yield from shard.iter_models(model_class, batch)
+
+    def get_aggregate(self, name: str) -> int:
+        """The sum of the aggregate over the shards, each keeping its own"""
+        return sum(shard.get_aggregate(name) for shard in self.shards)
+
+    def increment_aggregate(self, name: str, amount: int) -> None:
+        # Only the sum matters, so any shard will do
+        return self.shards[0].increment_aggregate(name, amount)
+
+    def rebuild_aggregate(
+        self,
+        name: str,
+        model_class: Type[T],
+        value: Optional[Callable[[T], int]] = None,
+        batch: int = 1000,
+    ) -> int:
+        """RedisClient.rebuild_aggregate on every shard, over its own models"""
+        return sum(
+            shard.rebuild_aggregate(name, model_class, value, batch)
+            for shard in self.shards
+        )
+
+    def publish(self, channel: str, message: str):
+        # Subscribers listen on the first shard only
+        return self.shards[0].publish(channel, message)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+class AsyncShardedRedisClient(ShardedRedisClient[T]):
+    """
+    ShardedRedisClient over AsyncRedisClient shards. The holds of a
+    reservation are placed on all of their shards at once.
+    """
+
+    producer_class = AsyncShardedStreamProducer
+    processor_class = AsyncShardedStreamProcessor
+
+    async def replica(self):
+        view = copy.copy(self)
+        view.shards = await asyncio.gather(*(shard.replica() for shard in self.shards))
+        return view
+
+    async def _counter_shards(self, attribute: str) -> Dict[str, int]:
+        checked, counters = self._counters.get(attribute, (None, {}))
+        now = time.monotonic()
+        if checked is None or now - checked >= self.counter_check_interval:
+            # Concurrent callers keep the counters read last meanwhile
+            self._counters[attribute] = (now, counters)
+            counters = await self.shards[0].redis.hgetall(
+                COUNTERS_KEY.format(attribute)
+            )
+            counters = {id: int(n) for id, n in counters.items()}
+            self._counters[attribute] = (now, counters)
+        return counters
+
+    async def _sub_counter_values(
+        self, sharded: Dict[str, int], attribute: str
+    ) -> Dict[str, List[int]]:
+        subs = {id: self._sub_counters(id, attribute, n) for id, n in sharded.items()}
+        replies = await asyncio.gather(
+            *(
+                self.shards[index].redis.get(key)
+                for id in subs
+                for index, key in subs[id]
+            )
+        )
+        replies = iter(replies)
+        return {id: [int(next(replies) or 0) for _ in subs[id]] for id in subs}
+
+    async def _hold_all(
+        self, tid: str, groups: Dict[int, Dict[str, int]], attribute: str
+    ) -> List[int]:
+        """Hold every group on its shard at once; the shards held"""
+        holds = await asyncio.gather(
+            *(
+                self._hold(index, tid, changes, attribute)
+                for index, changes in groups.items()
+            )
+        )
+        return [index for index, hold in zip(groups, holds) if hold == 1]
+
+    async def _settle_all(
+        self,
+        tid: str,
+        groups: Dict[int, Dict[str, int]],
+        held: List[int],
+        release: bool,
+    ):
+        await asyncio.gather(
+            *(self._settle(index, tid, release, list(groups[index])) for index in held)
+        )
+
+    async def _reserve_across(
+        self,
+        tid: str,
+        changes: Dict[str, int],
+        sharded: Dict[str, int],
+        attribute: str,
+        keys: List[str],
+        values: List[Any],
+        stream_key: Optional[str] = None,
+        outcome_key: Optional[str] = None,
+    ) -> ReserveResult:
+        groups = self._place(changes, attribute, sharded)
+        held = await self._hold_all(tid, groups, attribute)
+        dry = len(held) < len(groups) and sharded
+        if dry:
+            await self._settle_all(tid, groups, held, release=True)
+            groups = self._place(
+                changes,
+                attribute,
+                sharded,
+                await self._sub_counter_values(sharded, attribute),
+            )
+            held = await self._hold_all(tid, groups, attribute)
+
+        status = COMMITTED if len(held) == len(groups) else ABORTED
+        result = ReserveResult(
+            await self._finish(tid, keys, values, status, stream_key, outcome_key)
+        )
+        await self._settle_all(tid, groups, held, release=result != ReserveResult.OK)
+        if dry:
+            for id, n in self._due_rebalances(sharded, attribute).items():
+                await self.rebalance_counter(id, attribute, n)
+        return result
+
+    async def reserve(
+        self,
+        transaction,
+        changes: Dict[str, int],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> ReserveResult:
+        if not changes:
+            return ReserveResult.INSUFFICIENT
+
+        home = self.shard_index(transaction.id)
+        sharded = self._sharded(changes, await self._counter_shards(attribute))
+        if not sharded and list(self._split(changes)) == [home]:
+            return await self.shards[home].reserve(
+                transaction, changes, attribute, stream_key, outcome_key
+            )
+
+        keys, values = self._transaction_keys(transaction)
+        return await self._reserve_across(
+            transaction.id,
+            changes,
+            sharded,
+            attribute,
+            keys,
+            values,
+            stream_key,
+            outcome_key,
+        )
+
+    async def reserve_all(
+        self,
+        reservations: List[Tuple[Any, Dict[str, int]]],
+        attribute: str,
+        stream_key: Optional[str],
+        outcome_key: Optional[str] = None,
+    ) -> List[ReserveResult]:
+        local = self._local_reservations(
+            reservations, await self._counter_shards(attribute)
+        )
+        pipelined = {p for positions in local.values() for p in positions}
+        across = [p for p in range(len(reservations)) if p not in pipelined]
+        replies = await asyncio.gather(
+            *(
+                self.shards[index].reserve_all(
+                    [reservations[p] for p in positions],
+                    attribute,
+                    stream_key,
+                    outcome_key,
+                )
+                for index, positions in local.items()
+            ),
+            *(
+                self.reserve(*reservations[p], attribute, stream_key, outcome_key)
+                for p in across
+            ),
+        )
+
+        results = [None] * len(reservations)
+        for positions, batch in zip(local.values(), replies):
+            for position, result in zip(positions, batch):
+                results[position] = result
+        for position, result in zip(across, replies[len(local):]):
+            results[position] = result
+        return results
+
+    async def m_gte_decrement(
+        self, changes: Dict[str, int], attribute: str, tid: str
+    ) -> bool:
+        if not changes:
+            return False
+
+        home = self.shard_index(tid)
+        sharded = self._sharded(changes, await self._counter_shards(attribute))
+        if not sharded and list(self._split(changes)) == [home]:
+            return await self.shards[home].m_gte_decrement(changes, attribute, tid)
+
+        keys, values = self._status_keys(tid)
+        result = await self._reserve_across(
+            tid, changes, sharded, attribute, keys, values
+        )
+        return result == ReserveResult.OK
+
+    async def lte_decrement(
+        self, id: str, attribute: str, amount: int, tid: str
+    ) -> bool:
+        if self.shard_index(id) == self.shard_index(tid) and id not in (
+            await self._counter_shards(attribute)
+        ):
+            return await self.shard_for(id).lte_decrement(id, attribute, amount, tid)
+        return await self.m_gte_decrement({id: amount}, attribute, tid)
+
+    async def shard_counter(
+        self, id: str, attribute: str, shards: int
+    ) -> Optional[int]:
+        """Async ShardedRedisClient.shard_counter"""
+        key = COUNTERS_KEY.format(attribute)
+        current = int(await self.shards[0].redis.hget(key, id) or 1)
+        self._check_split(shards, current, len(self.shards))
+        if await self.shard_for(id).get_counter(id, attribute) is None:
+            return None
+
+        if shards > 1:
+            await self.shards[0].redis.hset(key, id, shards)
+            self._counters.pop(attribute, None)
+        for _ in range(3):
+            if await self.rebalance_counter(id, attribute, shards):
+                break
+        return await self.get_counter(id, attribute)
+
+    async def get_counter(self, id: str, attribute: str) -> Optional[int]:
+        n = (await self._counter_shards(attribute)).get(id, 1)
+        values = await asyncio.gather(
+            *(
+                self.shards[index].redis.get(key)
+                for index, key in self._sub_counters(id, attribute, n)
+            )
+        )
+        if values[0] is None:
+            return None
+        return sum(int(value or 0) for value in values)
+
+    async def rebalance_counter(self, id: str, attribute: str, n: int) -> bool:
+        subs = self._sub_counters(id, attribute, n)
+        values = await self._sub_counter_values({id: n}, attribute)
+        moves = self._even_out(subs, values[id])
+        if not moves:
+            return True
+
+        tid = str(uuid.uuid4())
+        held = await self._hold_all(tid, moves, attribute)
+        committed = len(held) == len(moves) and await self._decide(tid, COMMITTED)
+        await self._settle_all(tid, moves, held, release=not committed)
+        return committed
+
+    async def resolve(
+        self, transaction, changes: Dict[str, int], attribute: str
+    ) -> bool:
+        home, local, remote = self._split_resolution(transaction, changes)
+        if remote:
+            current = await self.shards[home].get(transaction.id, type(transaction))
+            if not self._resolvable(transaction, current):
+                return False
+            await asyncio.gather(
+                *(
+                    self._apply_once(index, transaction.id, group, attribute)
+                    for index, group in remote.items()
+                )
+            )
+        return await self.shards[home].resolve(transaction, local, attribute)
+
+    async def _orphaned_keys(self, index: int, tid: str) -> List[str]:
+        return await self.shards[index].redis.hkeys(HOLD_KEY.format(tid))
+
+    async def _decide(self, tid: str, decision: str) -> bool:
+        home = self.shard_for(tid).redis
+        key = DECISION_KEY.format(tid)
+        await home.set(key, decision, nx=True, px=self.decision_ttl_ms)
+        return await home.get(key) == COMMITTED
+
+    async def release_orphaned_holds(self, count: int = 100) -> int:
+        settled = 0
+        for index, orphaned in enumerate(self._orphaned_scripts):
+            tids = await orphaned(
+                keys=[HOLDS_KEY],
+                args=[self.hold_timeout_ms, count],
+                client=self.shards[index].redis,
+            )
+            for tid in tids:
+                committed = await self._decide(tid, ABORTED)
+                counters = await self._orphaned_keys(index, tid)
+                await self._settle(index, tid, not committed, counters)
+                settled += 1
+        return settled
+
+    async def run_hold_sweeper(self, interval: float = 5.0):
+        while True:
+            try:
+                if await self.release_orphaned_holds():
+                    logging.warning("Settled orphaned holds of reservations")
+            except Exception:
+                logging.exception("Error settling orphaned holds")
+            await asyncio.sleep(interval)
+
+    async def get_all(self, ids: List[str], model_class: Type[T]) -> List[Optional[T]]:
+        ids = list(ids)
+        positions = self._positions(ids)
+        replies = await asyncio.gather(
+            *(
+                self.shards[index].get_all([ids[p] for p in group], model_class)
+                for index, group in positions.items()
+            )
+        )
+
+        result = [None] * len(ids)
+        for group, models in zip(positions.values(), replies):
+            for position, model in zip(group, models):
+                result[position] = model
+        return result
+
+    async def save_all(self, models: List[T]) -> None:
+        groups = defaultdict(list)
+        for model in models:
+            groups[self.shard_index(model.id)].append(model)
+        await asyncio.gather(
+            *(self.shards[index].save_all(group) for index, group in groups.items())
+        )
+
+    async def m_get_attr(self, ids: List[str], attribute: str, model_class: Type[T]):
+        replies = await asyncio.gather(
+            *(
+                self.shards[index].m_get_attr(
+                    [ids[p] for p in positions], attribute, model_class
+                )
+                for index, positions in self._positions(ids).items()
+            )
+        )
+        if any(values is None for values in replies):
+            return None
+        return {id: value for values in replies for id, value in values.items()}
+
+    async def m_set_attr(
+        self, values: Dict[str, Any], attribute: str, model_class: Type[T]
+    ):
+        await asyncio.gather(
+            *(
+                self.shards[index].m_set_attr(group, attribute, model_class)
+                for index, group in self._split(values).items()
+            )
+        )
+
+    async def keys(self, match: str = "*") -> List[str]:
+        replies = await asyncio.gather(*(shard.keys(match) for shard in self.shards))
+        return [key for keys in replies for key in keys]
+
+    async def iter_ids(
+        self, model_class: Type[T], batch: int = 1000
+    ) -> AsyncIterator[str]:
+        for shard in self.shards:
+            async for id in shard.iter_ids(model_class, batch):
+                yield id
+
+    async def iter_models(
+        self, model_class: Type[T], batch: int = 1000
+    ) -> AsyncIterator[T]:
+        for shard in self.shards:
+            async for model in shard.iter_models(model_class, batch):
+                yield model
+
+    async def get_aggregate(self, name: str) -> int:
+        replies = await asyncio.gather(
+            *(shard.get_aggregate(name) for shard in self.shards)
+        )
+        return sum(replies)
+
+    async def rebuild_aggregate(
+        self,
+        name: str,
+        model_class: Type[T],
+        value: Optional[Callable[[T], int]] = None,
+        batch: int = 1000,
+    ) -> int:
+        replies = await asyncio.gather(
+            *(
+                shard.rebuild_aggregate(name, model_class, value, batch)
+                for shard in self.shards
+            )
+        )
+        return sum(replies)
+
+    async def close(self):
+        await asyncio.gather(*(shard.close() for shard in self.shards))
@@ -1,8 +1,39 @@
+import asyncio
+import json
+import os
 import redis
 import logging
+import random
+import socket
 import threading
 import time
-from typing import Callable
+from typing import Callable, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from .scripts import AsyncFunctionRegistry, FunctionRegistry, registry_of
+
+STREAM_RECLAIMED = Counter(
+    "stream_reclaimed_entries",
+    "Pending stream entries claimed from idle consumers",
+    ["stream"],
+)
+STREAM_RECLAIMED_IDLE = Histogram(
+    "stream_reclaimed_idle_seconds",
+    "How long pending stream entries were idle when they were reclaimed",
+    ["stream"],
+    buckets=(30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600),
+)
+STREAM_CONSUMERS_REMOVED = Counter(
+    "stream_consumers_removed",
+    "Idle consumers without pending entries removed from the group",
+    ["stream"],
+)
+
+
+def consumer_identity(prefix: str) -> str:
+    """A consumer name unique to this replica and process."""
+    return f"{prefix}_{socket.gethostname()}_{os.getpid()}"
 
 
 class RedisStreamProducer:
@@ -39,14 +70,294 @@ class RedisStreamProducer:
         return self.redis_client.xlen(self.stream_key)
 
 
-class RedisStreamConsumer:
+class AsyncRedisStreamProducer(RedisStreamProducer):
+    """RedisStreamProducer for a redis.asyncio client."""
+
+    async def push(self, id="*", **data):
+        await self.redis_client.xadd(self.stream_key, data, id=id)
+
+    async def size(self):
+        return await self.redis_client.xlen(self.stream_key)
+
+
+# Bump the attempt counter of an entry and schedule it after an exponential
+# backoff, scaled by a jitter factor drawn by the caller.
+# KEYS[1] = retry zset, KEYS[2] = attempt counter
+# ARGV = member, now (ms), base delay (ms), max delay (ms), jitter in [0, 1),
+#        counter ttl (ms)
+SCHEDULE_RETRY_SCRIPT = """
+local attempt = redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[6])
+local delay = math.min(tonumber(ARGV[4]), tonumber(ARGV[3]) * 2 ^ (attempt - 1))
+delay = delay * (0.5 + 0.5 * tonumber(ARGV[5]))
+redis.call('ZADD', KEYS[1], tonumber(ARGV[2]) + delay, ARGV[1])
+return attempt
+"""
+
+# Lease up to ARGV[2] entries due at ARGV[1] (ms) until ARGV[3] (ms), by
+# scoring them with the end of the lease, and return the score of the next
+# scheduled entry (or false) followed by the leased members.
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for i = 1, #due do
+    redis.call('ZADD', KEYS[1], ARGV[3], due[i])
+end
+local next = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+table.insert(due, 1, next[2] or false)
+return due
+"""
+
+# Drop a leased entry and its attempt counter, unless it was scheduled again
+# since it was leased (its score is no longer the end of the lease)
+# KEYS[1] = retry zset, KEYS[2] = attempt counter, ARGV = member, lease end (ms)
+ACK_SCRIPT = """
+if tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1])) == tonumber(ARGV[2]) then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('DEL', KEYS[2])
+end
+"""
+
+
+class DelayedRetryQueue:
+    """
+    Entries of a stream that have to be processed again later, kept in a
+    sorted set scored by due time instead of being pushed back onto the
+    stream. Each entry is retried after base_ms * 2^(attempt - 1) (capped at
+    max_ms) scaled by a random factor in [0.5, 1); attempt counters expire on
+    their own once an entry stops being retried.
+
+    Due entries are leased rather than removed: pop_due pushes them lease_ms
+    into the future, and ack drops them once they were processed. An entry
+    whose consumer died is due again when its lease runs out, since its
+    stream entry was acknowledged when it was first scheduled.
+
+    The scripts join the registry of the RedisClient that opened
+    redis_client, so they are installed as functions on every connection
+    like the others. A registry of its own installs them on first use
+    otherwise.
+    """
+
+    script_registry_class = FunctionRegistry
+
+    def __init__(
+        self,
+        redis_client,
+        stream_key: str,
+        base_ms: int = 50,
+        max_ms: int = 5000,
+        lease_ms: int = 60000,
+    ):
+        self.redis_client = redis_client
+        self.key = f"{stream_key}:retry"
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.lease_ms = lease_ms
+        self.scripts = registry_of(redis_client) or self.script_registry_class()
+        self._schedule_script = self.scripts.register(SCHEDULE_RETRY_SCRIPT)
+        self._pop_due_script = self.scripts.register(POP_DUE_SCRIPT)
+        self._ack_script = self.scripts.register(ACK_SCRIPT)
+
+    def _member(self, data: dict) -> Tuple[str, str]:
+        """Sorted set member of an entry, and the key of its attempt counter"""
+        member = json.dumps(data, sort_keys=True)
+        return member, f"{self.key}:attempts:{member}"
+
+    def _schedule_args(self, data: dict):
+        member, attempts_key = self._member(data)
+        keys = [self.key, attempts_key]
+        args = [
+            member,
+            int(time.time() * 1000),
+            self.base_ms,
+            self.max_ms,
+            random.random(),
+            self.max_ms * 10,
+        ]
+        return keys, args
+
+    def _pop_due_args(self, count: int) -> Tuple[List, int]:
+        now = int(time.time() * 1000)
+        return [now, count, now + self.lease_ms], now + self.lease_ms
+
+    def _parse_due(self, result) -> Tuple[List[dict], Optional[float]]:
+        next_due = float(result[0]) if result[0] else None
+        return [json.loads(member) for member in result[1:]], next_due
+
+    def _ack_args(self, lease: int, data: dict):
+        member, attempts_key = self._member(data)
+        return [self.key, attempts_key], [member, lease]
+
+    def schedule(self, **data) -> int:
+        """
+        Schedule the entry `data` for another attempt.
+
+        Returns:
+            int: The number of times the entry has been scheduled.
+        """
+        keys, args = self._schedule_args(data)
+        return self._schedule_script(keys=keys, args=args, client=self.redis_client)
+
+    def pop_due(self, count: int) -> Tuple[List[dict], Optional[float], int]:
+        """
+        Lease up to `count` entries that are due. Each one has to be passed
+        to ack once it is processed, or scheduled again; otherwise it is due
+        again when the lease ends.
+
+        Returns:
+            The entries, the due time (ms) of the next scheduled one, and the
+            end of the lease (ms).
+        """
+        args, lease = self._pop_due_args(count)
+        result = self._pop_due_script(
+            keys=[self.key], args=args, client=self.redis_client
+        )
+        return (*self._parse_due(result), lease)
+
+    def ack(self, leased: List[Tuple[int, dict]]) -> None:
+        """Drop processed (lease, entry) pairs that were not scheduled again"""
+        if not leased:
+            return
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for lease, data in leased:
+            keys, args = self._ack_args(lease, data)
+            self._ack_script(keys=keys, args=args, client=pipeline)
+        pipeline.execute()
+
+    def discard(self, **data) -> None:
+        """Drop the entry `data` and its attempt counter, if it is scheduled."""
+        member, attempts_key = self._member(data)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zrem(self.key, member)
+        pipe.delete(attempts_key)
+        pipe.execute()
+
+    def size(self) -> int:
+        return self.redis_client.zcard(self.key)
+
+
+class AsyncDelayedRetryQueue(DelayedRetryQueue):
+    """DelayedRetryQueue for a redis.asyncio client."""
+
+    script_registry_class = AsyncFunctionRegistry
+
+    async def schedule(self, **data) -> int:
+        keys, args = self._schedule_args(data)
+        return await self._schedule_script(
+            keys=keys, args=args, client=self.redis_client
+        )
+
+    async def pop_due(self, count: int) -> Tuple[List[dict], Optional[float], int]:
+        args, lease = self._pop_due_args(count)
+        result = await self._pop_due_script(
+            keys=[self.key], args=args, client=self.redis_client
+        )
+        return (*self._parse_due(result), lease)
+
+    async def ack(self, leased: List[Tuple[int, dict]]) -> None:
+        if not leased:
+            return
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for lease, data in leased:
+            keys, args = self._ack_args(lease, data)
+            await self._ack_script(keys=keys, args=args, client=pipeline)
+        await pipeline.execute()
+
+    async def discard(self, **data) -> None:
+        member, attempts_key = self._member(data)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zrem(self.key, member)
+        pipe.delete(attempts_key)
+        await pipe.execute()
+
+    async def size(self) -> int:
+        return await self.redis_client.zcard(self.key)
+
+
+def _block_until(block_ms: Optional[int], next_due: Optional[float]) -> Optional[int]:
+    """Shorten an XREADGROUP wait so it ends when the next retry is due."""
+    if next_due is None:
+        return block_ms
+    wait = max(1, int(next_due - time.time() * 1000))
+    return wait if block_ms is None else min(block_ms, wait)
+
+
+class _Reclaimer:
+    """
+    Periodic recovery of entries delivered to consumers that died before
+    acknowledging them. Every claim_interval seconds the entries pending for
+    longer than claim_idle_ms, whichever consumer they belong to, are taken
+    over with XAUTOCLAIM and processed again. Consumers without pending entries
+    that have been idle for ten times that long are removed from the group,
+    since every replica start registers a new consumer name.
+    """
+
+    def _init_reclaimer(self, claim_idle_ms: int, claim_interval: float):
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+        self._next_claim = time.monotonic() + (claim_interval or 0)
+
+    def _claim_due(self) -> bool:
+        if self.claim_interval is None or time.monotonic() < self._next_claim:
+            return False
+        self._next_claim = time.monotonic() + self.claim_interval
+        return True
+
+    def _observe_pending(self, pending: List[dict]):
+        for entry in pending:
+            STREAM_RECLAIMED_IDLE.labels(stream=self.stream_key).observe(
+                entry["time_since_delivered"] / 1000
+            )
+
+    def _claimed(self, response) -> list:
+        # Entries deleted from the stream come back without an id (Redis 6.2)
+        messages = [(id, data) for id, data in response[1] if id is not None]
+        STREAM_RECLAIMED.labels(stream=self.stream_key).inc(len(messages))
+        return messages
+
+    def _dead_consumers(self, consumers: List[dict]) -> List[str]:
+        return [
+            c["name"]
+            for c in consumers
+            if c["name"] != self.consumer_name
+            and c["pending"] == 0
+            and c["idle"] > self.claim_idle_ms * 10
+        ]
+
+
+class RedisStreamConsumer(_Reclaimer):
     def __init__(
-        self, redis_client, stream_key: str, consumer_group: str, consumer_name: str
+        self,
+        redis_client,
+        stream_key: str,
+        consumer_group: str,
+        consumer_name: str,
+        batch_size: int = 1,
+        block_ms: Optional[int] = None,
+        retry_queue: Optional[DelayedRetryQueue] = None,
+        claim_idle_ms: int = 60000,
+        claim_interval: Optional[float] = 15,
     ):
+        """
+        Args:
+            batch_size (int): Maximum entries read by one XREADGROUP.
+            block_ms (int): How long XREADGROUP waits for new entries when the
+                stream is drained, None to return immediately.
+            retry_queue (DelayedRetryQueue): Delayed entries to pass to the
+                callback (with a message id of None) once they are due.
+            claim_idle_ms (int): Idle time after which a pending entry is
+                considered abandoned and reclaimed; must exceed the longest
+                callback.
+            claim_interval (float): Seconds between reclaims, None to disable.
+        """
         self.redis_client = redis_client
         self.stream_key = stream_key
         self.consumer_group = consumer_group
         self.consumer_name = consumer_name
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.retry_queue = retry_queue
+        self._next_due = None
+        self._init_reclaimer(claim_idle_ms, claim_interval)
         self._ensure_consumer_group_exists()
 
     def _ensure_consumer_group_exists(self):
@@ -59,48 +370,343 @@ class RedisStreamConsumer:
             if "BUSYGROUP" not in str(e):
                 raise
 
+    def _acknowledge(self, message_ids: List[str]):
+        """XACK and XDEL a batch of processed entries in one round trip."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xack(self.stream_key, self.consumer_group, *message_ids)
+        pipe.xdel(self.stream_key, *message_ids)
+        pipe.execute()
+
+    def _consume_retries(self, callback: Callable) -> int:
+        if self.retry_queue is None:
+            return 0
+
+        due, self._next_due, lease = self.retry_queue.pop_due(self.batch_size)
+        done = []
+        for data in due:
+            try:
+                callback(None, **data)
+                done.append((lease, data))
+            except Exception:
+                logging.exception("Error processing retried message")
+                self.retry_queue.schedule(**data)
+        self.retry_queue.ack(done)
+        return len(due)
+
+    def _process(self, callback: Callable, message_list: list) -> int:
+        done = []
+        for message_id, data in message_list:
+            try:
+                # Pass the data as kwargs to the callback
+                callback(message_id, **data)
+                done.append(message_id)
+            except Exception:
+                logging.exception("Error processing message")
+
+        if done:
+            self._acknowledge(done)
+        return len(message_list)
+
+    def reclaim(self, callback: Callable) -> int:
+        """
+        Claim up to batch_size abandoned entries and process them.
+
+        Returns:
+            int: The number of entries reclaimed.
+        """
+        pending = self.redis_client.xpending_range(
+            self.stream_key,
+            self.consumer_group,
+            min="-",
+            max="+",
+            count=self.batch_size,
+            idle=self.claim_idle_ms,
+        )
+        if pending:
+            self._observe_pending(pending)
+            response = self.redis_client.xautoclaim(
+                self.stream_key,
+                self.consumer_group,
+                self.consumer_name,
+                self.claim_idle_ms,
+                count=self.batch_size,
+            )
+            self._process(callback, self._claimed(response))
+
+        consumers = self.redis_client.xinfo_consumers(
+            self.stream_key, self.consumer_group
+        )
+        for name in self._dead_consumers(consumers):
+            self.redis_client.xgroup_delconsumer(
+                self.stream_key, self.consumer_group, name
+            )
+            STREAM_CONSUMERS_REMOVED.labels(stream=self.stream_key).inc()
+        return len(pending)
+
+    def consume_batch(self, callback: Callable) -> int:
+        """
+        Process the due retries and, periodically, abandoned entries of other
+        consumers, then read up to batch_size new entries, pass each one to
+        the callback and acknowledge the successful ones together. Entries
+        whose callback raised stay in the pending entries list until they are
+        reclaimed.
+
+        Returns:
+            int: The number of entries read, retries included.
+        """
+        read = self._consume_retries(callback)
+        if self._claim_due():
+            read += self.reclaim(callback)
+
+        messages = self.redis_client.xreadgroup(
+            self.consumer_group,
+            self.consumer_name,
+            {self.stream_key: ">"},
+            count=self.batch_size,
+            block=None if read else _block_until(self.block_ms, self._next_due),
+        )
+
+        for stream, message_list in messages or ():
+            read += self._process(callback, message_list)
+        return read
+
     def consume(self, callback: Callable):
         """Continuously consume messages from the stream and pass them to the callback."""
         logging.error(
-            "Starting consumer %s on stream key %s", self.consumer_name, self.stream_key
+            "Starting consumer %s on stream key %s (batch %s, block %s ms)",
+            self.consumer_name,
+            self.stream_key,
+            self.batch_size,
+            self.block_ms,
         )
         while True:
             try:
-                # Read messages from the stream
-                messages = self.redis_client.xreadgroup(
-                    self.consumer_group,
-                    self.consumer_name,
-                    {self.stream_key: ">"},
-                    count=1
-                )
-
-                if messages:
-                    for stream, message_list in messages:
-                        for message_id, data in message_list:
-                            # Parse the message value as JSON
-                            try:
-                                # Pass the data as kwargs to the callback
-                                callback(message_id, **data)
-                                # Acknowledge the message
-                                self.redis_client.xack(
-                                    self.stream_key, self.consumer_group, message_id
-                                )
-                                self.redis_client.xdel(self.stream_key, message_id)
-                            except Exception as e:
-                                logging.exception("Error processing message")
+                self.consume_batch(callback)
             except Exception as e:
                 logging.error(f"[REDIS:] {self.redis_client.ping()}")
                 logging.exception("Error reading from strem")
                 time.sleep(5)  # Wait before retrying
 
 
+class AsyncRedisStreamConsumer(_Reclaimer):
+    """
+    RedisStreamConsumer for a redis.asyncio client that keeps up to
+    `concurrency` callbacks in flight. New entries are only read while there
+    are free slots, and finished entries are acknowledged in pipelined batches.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        stream_key: str,
+        consumer_group: str,
+        consumer_name: str,
+        batch_size: int = 1,
+        block_ms: Optional[int] = None,
+        concurrency: int = 1,
+        retry_queue: Optional[AsyncDelayedRetryQueue] = None,
+        claim_idle_ms: int = 60000,
+        claim_interval: Optional[float] = 15,
+    ):
+        self.redis_client = redis_client
+        self.stream_key = stream_key
+        self.consumer_group = consumer_group
+        self.consumer_name = consumer_name
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.concurrency = concurrency
+        self.retry_queue = retry_queue
+        self._next_due = None
+        self._init_reclaimer(claim_idle_ms, claim_interval)
+        self._in_flight = set()
+        self._running = set()
+        self._done = []
+        # (lease, data) of the retries processed since the last _acknowledge
+        self._retries_done = []
+
+    async def _ensure_consumer_group_exists(self):
+        try:
+            await self.redis_client.xgroup_create(
+                self.stream_key, self.consumer_group, id="0", mkstream=True
+            )
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _acknowledge(self):
+        if self._retries_done:
+            leased, self._retries_done = self._retries_done, []
+            await self.retry_queue.ack(leased)
+        if not self._done:
+            return
+        message_ids, self._done = self._done, []
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xack(self.stream_key, self.consumer_group, *message_ids)
+        pipe.xdel(self.stream_key, *message_ids)
+        await pipe.execute()
+
+    async def _process(
+        self,
+        callback: Callable,
+        message_id: str,
+        data: dict,
+        lease: Optional[int] = None,
+    ):
+        try:
+            await callback(message_id, **data)
+            if message_id is not None:
+                self._done.append(message_id)
+            else:
+                self._retries_done.append((lease, data))
+        except Exception:
+            logging.exception("Error processing message")
+            if message_id is None:
+                await self.retry_queue.schedule(**data)
+        finally:
+            self._running.discard(message_id)
+
+    def _start(
+        self,
+        callback: Callable,
+        message_id: Optional[str],
+        data: dict,
+        lease: Optional[int] = None,
+    ):
+        if message_id is not None:
+            if message_id in self._running:
+                # Reclaimed while its callback is still running here
+                return
+            self._running.add(message_id)
+        task = asyncio.create_task(self._process(callback, message_id, data, lease))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _wait_for_slot(self):
+        if len(self._in_flight) >= self.concurrency:
+            await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+        return self.concurrency - len(self._in_flight)
+
+    async def reclaim(self, callback: Callable) -> int:
+        """
+        Claim as many abandoned entries as there are free slots (at most
+        batch_size) and start their callbacks.
+
+        Returns:
+            int: The number of entries reclaimed.
+        """
+        count = min(self.batch_size, await self._wait_for_slot())
+        pending = await self.redis_client.xpending_range(
+            self.stream_key,
+            self.consumer_group,
+            min="-",
+            max="+",
+            count=count,
+            idle=self.claim_idle_ms,
+        )
+        if pending:
+            self._observe_pending(pending)
+            response = await self.redis_client.xautoclaim(
+                self.stream_key,
+                self.consumer_group,
+                self.consumer_name,
+                self.claim_idle_ms,
+                count=count,
+            )
+            for message_id, data in self._claimed(response):
+                self._start(callback, message_id, data)
+
+        consumers = await self.redis_client.xinfo_consumers(
+            self.stream_key, self.consumer_group
+        )
+        for name in self._dead_consumers(consumers):
+            await self.redis_client.xgroup_delconsumer(
+                self.stream_key, self.consumer_group, name
+            )
+            STREAM_CONSUMERS_REMOVED.labels(stream=self.stream_key).inc()
+        return len(pending)
+
+    async def consume_batch(self, callback: Callable) -> int:
+        """
+        Wait for a free slot, take up to that many due retries and new entries
+        (at most batch_size each) and start their callbacks without waiting
+        for them; abandoned entries of other consumers are reclaimed
+        periodically. Acknowledges every entry finished since the previous
+        call.
+
+        Returns:
+            int: The number of entries read, retries included.
+        """
+        read = 0
+        if self.retry_queue is not None:
+            due, self._next_due, lease = await self.retry_queue.pop_due(
+                min(self.batch_size, await self._wait_for_slot())
+            )
+            for data in due:
+                self._start(callback, None, data, lease)
+            read = len(due)
+
+        if self._claim_due():
+            read += await self.reclaim(callback)
+
+        messages = await self.redis_client.xreadgroup(
+            self.consumer_group,
+            self.consumer_name,
+            {self.stream_key: ">"},
+            count=min(self.batch_size, await self._wait_for_slot()),
+            block=None if read else _block_until(self.block_ms, self._next_due),
+        )
+
+        for stream, message_list in messages or ():
+            read += len(message_list)
+            for message_id, data in message_list:
+                self._start(callback, message_id, data)
+
+        await self._acknowledge()
+        return read
+
+    async def drain(self):
+        """Wait for the callbacks in flight and acknowledge them."""
+        if self._in_flight:
+            await asyncio.wait(self._in_flight)
+        await self._acknowledge()
+
+    async def consume(self, callback: Callable):
+        """Continuously consume messages from the stream and pass them to the callback."""
+        await self._ensure_consumer_group_exists()
+        logging.error(
+            "Starting async consumer %s on stream key %s (batch %s, concurrency %s)",
+            self.consumer_name,
+            self.stream_key,
+            self.batch_size,
+            self.concurrency,
+        )
+        while True:
+            try:
+                await self.consume_batch(callback)
+            except Exception:
+                logging.exception("Error reading from strem")
+                await asyncio.sleep(5)  # Wait before retrying
+
+
 class StreamProcessor:
     stream_key = None
+    # Entries read and acknowledged per round trip, and the XREADGROUP wait
+    batch_size = 1
+    block_ms = None
+    # Pending entries idle for longer than this are taken over from dead consumers
+    claim_idle_ms = 60000
+    claim_interval = 15
+    retry_queue_class = DelayedRetryQueue
 
     def __init__(self, redis_client):
         ## TODO BS
         self.redis_client = redis_client
         assert self.stream_key is not None
+        # Callbacks call self.retry_queue.schedule(**data) to see an entry again;
+        # a retry whose consumer died is due again after claim_idle_ms
+        self.retry_queue = self.retry_queue_class(
+            redis_client, self.stream_key, lease_ms=self.claim_idle_ms
+        )
 
     def callback(self, *args, **kwargs):
         raise NotImplementedError()
@@ -108,14 +714,22 @@ class StreamProcessor:
     def start_worker(self, consumer_group: str, consumer_name: str):
         """Start a worker to consume messages from a specific stream."""
         consumer = RedisStreamConsumer(
-            self.redis_client, self.stream_key, consumer_group, consumer_name
+            self.redis_client,
+            self.stream_key,
+            consumer_group,
+            consumer_name,
+            batch_size=self.batch_size,
+            block_ms=self.block_ms,
+            retry_queue=self.retry_queue,
+            claim_idle_ms=self.claim_idle_ms,
+            claim_interval=self.claim_interval,
         )
         consumer.consume(self.callback)
 
     def start_workers(self, consumer_group: str, num_workers: int = 1):
         """Start multiple workers for a specific stream."""
         for i in range(num_workers):
-            consumer_name = f"consumer_{i+1}"
+            consumer_name = consumer_identity(f"consumer_{i+1}")
             print("Starting worker", consumer_name)
             thread = threading.Thread(
                 target=self.start_worker,
@@ -123,3 +737,40 @@ class StreamProcessor:
                 daemon=True,
             )
             thread.start()
+
+
+class AsyncStreamProcessor(StreamProcessor):
+    """
+    StreamProcessor whose callback is a coroutine. Every worker is an asyncio
+    task running up to `concurrency` callbacks at once, so waiting on the
+    database or a peer service does not hold up the rest of the stream.
+    """
+
+    concurrency = 1
+    retry_queue_class = AsyncDelayedRetryQueue
+
+    async def callback(self, *args, **kwargs):
+        raise NotImplementedError()
+
+    async def start_worker(self, consumer_group: str, consumer_name: str):
+        consumer = AsyncRedisStreamConsumer(
+            self.redis_client,
+            self.stream_key,
+            consumer_group,
+            consumer_name,
+            batch_size=self.batch_size,
+            block_ms=self.block_ms,
+            concurrency=self.concurrency,
+            retry_queue=self.retry_queue,
+            claim_idle_ms=self.claim_idle_ms,
+            claim_interval=self.claim_interval,
+        )
+        await consumer.consume(self.callback)
+
+    async def start_workers(self, consumer_group: str, num_workers: int = 1):
+        await asyncio.gather(
+            *(
+                self.start_worker(consumer_group, consumer_identity(f"consumer_{i+1}"))
+                for i in range(num_workers)
+            )
+        )
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 import enum
-from typing import List, Tuple
+from typing import ClassVar, List, Tuple
 from proto import order_pb2, stock_pb2, payment_pb2, common_pb2
 import time
 
@@ -90,6 +90,11 @@ class Transaction:
     created_at: int = field(default_factory=lambda: int(time.time()))
     locked: bool = False
 
+    # Kept on the record next to the fields, through set_attr and increment,
+    # and deleted or expired with it: the VibeChecker's count of pending
+    # checks and the peer's outcome (common/saga.py)
+    record_extras: ClassVar[Tuple[str, ...]] = ("pending_count", "peer_status")
+
     def to_proto(self) -> common_pb2.TransactionStatus:
         return common_pb2.TransactionStatus(
             tid=self.id, success=self.status == TransactionStatus.SUCCESS
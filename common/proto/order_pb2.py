@@ -22,16 +22,21 @@ _runtime_version.ValidateProtobufRuntimeVersion(
 _sym_db = _symbol_database.Default()
 
 
+from proto import common_pb2 as proto_dot_common__pb2
 from proto import stock_pb2 as proto_dot_stock__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11proto/order.proto\x12\x05order\x1a\x11proto/stock.proto\"b\n\x05Order\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04paid\x18\x02 \x01(\x05\x12\x1a\n\x05items\x18\x03 \x03(\x0b\x32\x0b.stock.Item\x12\x0f\n\x07user_id\x18\x04 \x01(\t\x12\x12\n\ntotal_cost\x18\x05 \x01(\x05\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11proto/order.proto\x12\x05order\x1a\x12proto/common.proto\x1a\x11proto/stock.proto\"b\n\x05Order\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04paid\x18\x02 \x01(\x05\x12\x1a\n\x05items\x18\x03 \x03(\x0b\x32\x0b.stock.Item\x12\x0f\n\x07user_id\x18\x04 \x01(\t\x12\x12\n\ntotal_cost\x18\x05 \x01(\x05\"&\n\x16\x43ommitCheckoutsRequest\x12\x0c\n\x04tids\x18\x01 \x03(\t2[\n\x0cOrderService\x12K\n\x0f\x43ommitCheckouts\x12\x1d.order.CommitCheckoutsRequest\x1a\x19.common.OperationResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'proto.order_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_ORDER']._serialized_start=47
-  _globals['_ORDER']._serialized_end=145
+  _globals['_ORDER']._serialized_start=67
+  _globals['_ORDER']._serialized_end=165
+  _globals['_COMMITCHECKOUTSREQUEST']._serialized_start=167
+  _globals['_COMMITCHECKOUTSREQUEST']._serialized_end=205
+  _globals['_ORDERSERVICE']._serialized_start=207
+  _globals['_ORDERSERVICE']._serialized_end=298
 # @@protoc_insertion_point(module_scope)
@@ -3,6 +3,8 @@
 import grpc
 import warnings
 
+from proto import common_pb2 as proto_dot_common__pb2
+from proto import order_pb2 as proto_dot_order__pb2
 
 GRPC_GENERATED_VERSION = '1.70.0'
 GRPC_VERSION = grpc.__version__
@@ -22,3 +24,76 @@ if _version_not_supported:
         + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
         + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
     )
+
+
+class OrderServiceStub(object):
+    """Missing associated documentation comment in .proto file."""
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.CommitCheckouts = channel.unary_unary(
+                '/order.OrderService/CommitCheckouts',
+                request_serializer=proto_dot_order__pb2.CommitCheckoutsRequest.SerializeToString,
+                response_deserializer=proto_dot_common__pb2.OperationResponse.FromString,
+                _registered_method=True)
+
+
+class OrderServiceServicer(object):
+    """Missing associated documentation comment in .proto file."""
+
+    def CommitCheckouts(self, request, context):
+        """Mark the orders of committed checkouts paid, one call per batch of tids.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_OrderServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'CommitCheckouts': grpc.unary_unary_rpc_method_handler(
+                    servicer.CommitCheckouts,
+                    request_deserializer=proto_dot_order__pb2.CommitCheckoutsRequest.FromString,
+                    response_serializer=proto_dot_common__pb2.OperationResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'order.OrderService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('order.OrderService', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class OrderService(object):
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def CommitCheckouts(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/order.OrderService/CommitCheckouts',
+            proto_dot_order__pb2.CommitCheckoutsRequest.SerializeToString,
+            proto_dot_common__pb2.OperationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -25,7 +25,7 @@ _sym_db = _symbol_database.Default()
 from proto import common_pb2 as proto_dot_common__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x13proto/payment.proto\x12\x07payment\x1a\x12proto/common.proto\"\"\n\x04User\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0e\n\x06\x63redit\x18\x02 \x01(\x05\"2\n\x0f\x41\x64\x64\x46undsRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x05\">\n\x0ePaymentRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x05\x12\x0b\n\x03tid\x18\x03 \x01(\t\"1\n\x0fPaymentResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05\x65rror\x18\x02 \x01(\t\"\"\n\x0f\x46indUserRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\"/\n\x10\x46indUserResponse\x12\x1b\n\x04user\x18\x01 \x01(\x0b\x32\r.payment.User2\xab\x02\n\x0ePaymentService\x12?\n\x08\x41\x64\x64\x46unds\x12\x18.payment.AddFundsRequest\x1a\x19.common.OperationResponse\x12\x43\n\x0eProcessPayment\x12\x17.payment.PaymentRequest\x1a\x18.payment.PaymentResponse\x12?\n\x08\x46indUser\x12\x18.payment.FindUserRequest\x1a\x19.payment.FindUserResponse\x12R\n\x1aVibeCheckTransactionStatus\x12\x19.common.TransactionStatus\x1a\x19.common.TransactionStatusb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x13proto/payment.proto\x12\x07payment\x1a\x12proto/common.proto\"\"\n\x04User\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0e\n\x06\x63redit\x18\x02 \x01(\x05\"2\n\x0f\x41\x64\x64\x46undsRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x05\">\n\x0ePaymentRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x05\x12\x0b\n\x03tid\x18\x03 \x01(\t\"1\n\x0fPaymentResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05\x65rror\x18\x02 \x01(\t\"@\n\x13PaymentBatchRequest\x12)\n\x08payments\x18\x01 \x03(\x0b\x32\x17.payment.PaymentRequest\"A\n\x14PaymentBatchResponse\x12)\n\x07results\x18\x01 \x03(\x0b\x32\x18.payment.PaymentResponse\"\"\n\x0f\x46indUserRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\"/\n\x10\x46indUserResponse\x12\x1b\n\x04user\x18\x01 \x01(\x0b\x32\r.payment.User2\xcb\x03\n\x0ePaymentService\x12?\n\x08\x41\x64\x64\x46unds\x12\x18.payment.AddFundsRequest\x1a\x19.common.OperationResponse\x12\x43\n\x0eProcessPayment\x12\x17.payment.PaymentRequest\x1a\x18.payment.PaymentResponse\x12R\n\x13ProcessPaymentBatch\x12\x1c.payment.PaymentBatchRequest\x1a\x1d.payment.PaymentBatchResponse\x12?\n\x08\x46indUser\x12\x18.payment.FindUserRequest\x1a\x19.payment.FindUserResponse\x12R\n\x1aVibeCheckTransactionStatus\x12\x19.common.TransactionStatus\x1a\x19.common.TransactionStatus\x12J\n\x12ResolveTransaction\x12\x19.common.TransactionStatus\x1a\x19.common.OperationResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -40,10 +40,14 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_PAYMENTREQUEST']._serialized_end=202
   _globals['_PAYMENTRESPONSE']._serialized_start=204
   _globals['_PAYMENTRESPONSE']._serialized_end=253
-  _globals['_FINDUSERREQUEST']._serialized_start=255
-  _globals['_FINDUSERREQUEST']._serialized_end=289
-  _globals['_FINDUSERRESPONSE']._serialized_start=291
-  _globals['_FINDUSERRESPONSE']._serialized_end=338
-  _globals['_PAYMENTSERVICE']._serialized_start=341
-  _globals['_PAYMENTSERVICE']._serialized_end=640
+  _globals['_PAYMENTBATCHREQUEST']._serialized_start=255
+  _globals['_PAYMENTBATCHREQUEST']._serialized_end=319
+  _globals['_PAYMENTBATCHRESPONSE']._serialized_start=321
+  _globals['_PAYMENTBATCHRESPONSE']._serialized_end=386
+  _globals['_FINDUSERREQUEST']._serialized_start=388
+  _globals['_FINDUSERREQUEST']._serialized_end=422
+  _globals['_FINDUSERRESPONSE']._serialized_start=424
+  _globals['_FINDUSERRESPONSE']._serialized_end=471
+  _globals['_PAYMENTSERVICE']._serialized_start=474
+  _globals['_PAYMENTSERVICE']._serialized_end=933
 # @@protoc_insertion_point(module_scope)
@@ -45,6 +45,11 @@ class PaymentServiceStub(object):
                 request_serializer=proto_dot_payment__pb2.PaymentRequest.SerializeToString,
                 response_deserializer=proto_dot_payment__pb2.PaymentResponse.FromString,
                 _registered_method=True)
+        self.ProcessPaymentBatch = channel.unary_unary(
+                '/payment.PaymentService/ProcessPaymentBatch',
+                request_serializer=proto_dot_payment__pb2.PaymentBatchRequest.SerializeToString,
+                response_deserializer=proto_dot_payment__pb2.PaymentBatchResponse.FromString,
+                _registered_method=True)
         self.FindUser = channel.unary_unary(
                 '/payment.PaymentService/FindUser',
                 request_serializer=proto_dot_payment__pb2.FindUserRequest.SerializeToString,
@@ -55,6 +60,11 @@ class PaymentServiceStub(object):
                 request_serializer=proto_dot_common__pb2.TransactionStatus.SerializeToString,
                 response_deserializer=proto_dot_common__pb2.TransactionStatus.FromString,
                 _registered_method=True)
+        self.ResolveTransaction = channel.unary_unary(
+                '/payment.PaymentService/ResolveTransaction',
+                request_serializer=proto_dot_common__pb2.TransactionStatus.SerializeToString,
+                response_deserializer=proto_dot_common__pb2.OperationResponse.FromString,
+                _registered_method=True)
 
 
 class PaymentServiceServicer(object):
@@ -72,6 +82,13 @@ class PaymentServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ProcessPaymentBatch(self, request, context):
+        """Many ProcessPayments in one call; each payment is still atomic.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def FindUser(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -84,6 +101,13 @@ class PaymentServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ResolveTransaction(self, request, context):
+        """Commit (success) or abort a reservation, as decided by the order service.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_PaymentServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -97,6 +121,11 @@ def add_PaymentServiceServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_payment__pb2.PaymentRequest.FromString,
                     response_serializer=proto_dot_payment__pb2.PaymentResponse.SerializeToString,
             ),
+            'ProcessPaymentBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.ProcessPaymentBatch,
+                    request_deserializer=proto_dot_payment__pb2.PaymentBatchRequest.FromString,
+                    response_serializer=proto_dot_payment__pb2.PaymentBatchResponse.SerializeToString,
+            ),
             'FindUser': grpc.unary_unary_rpc_method_handler(
                     servicer.FindUser,
                     request_deserializer=proto_dot_payment__pb2.FindUserRequest.FromString,
@@ -107,6 +136,11 @@ def add_PaymentServiceServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_common__pb2.TransactionStatus.FromString,
                     response_serializer=proto_dot_common__pb2.TransactionStatus.SerializeToString,
             ),
+            'ResolveTransaction': grpc.unary_unary_rpc_method_handler(
+                    servicer.ResolveTransaction,
+                    request_deserializer=proto_dot_common__pb2.TransactionStatus.FromString,
+                    response_serializer=proto_dot_common__pb2.OperationResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'payment.PaymentService', rpc_method_handlers)
@@ -172,6 +206,33 @@ class PaymentService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ProcessPaymentBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/payment.PaymentService/ProcessPaymentBatch',
+            proto_dot_payment__pb2.PaymentBatchRequest.SerializeToString,
+            proto_dot_payment__pb2.PaymentBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def FindUser(request,
             target,
@@ -225,3 +286,30 @@ class PaymentService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ResolveTransaction(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/payment.PaymentService/ResolveTransaction',
+            proto_dot_common__pb2.TransactionStatus.SerializeToString,
+            proto_dot_common__pb2.OperationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -55,6 +55,11 @@ class StockServiceStub(object):
                 request_serializer=proto_dot_stock__pb2.BulkStockAdjustment.SerializeToString,
                 response_deserializer=proto_dot_stock__pb2.BulkStockAdjustmentResponse.FromString,
                 _registered_method=True)
+        self.BulkOrderBatch = channel.unary_unary(
+                '/stock.StockService/BulkOrderBatch',
+                request_serializer=proto_dot_stock__pb2.BulkOrderBatchRequest.SerializeToString,
+                response_deserializer=proto_dot_stock__pb2.BulkOrderBatchResponse.FromString,
+                _registered_method=True)
         self.BulkRefund = channel.unary_unary(
                 '/stock.StockService/BulkRefund',
                 request_serializer=proto_dot_stock__pb2.BulkStockAdjustment.SerializeToString,
@@ -65,6 +70,11 @@ class StockServiceStub(object):
                 request_serializer=proto_dot_common__pb2.TransactionStatus.SerializeToString,
                 response_deserializer=proto_dot_common__pb2.TransactionStatus.FromString,
                 _registered_method=True)
+        self.ResolveTransaction = channel.unary_unary(
+                '/stock.StockService/ResolveTransaction',
+                request_serializer=proto_dot_common__pb2.TransactionStatus.SerializeToString,
+                response_deserializer=proto_dot_common__pb2.OperationResponse.FromString,
+                _registered_method=True)
 
 
 class StockServiceServicer(object):
@@ -95,6 +105,13 @@ class StockServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def BulkOrderBatch(self, request, context):
+        """Many BulkOrders in one call; each order is still reserved atomically.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def BulkRefund(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -107,6 +124,13 @@ class StockServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ResolveTransaction(self, request, context):
+        """Commit (success) or abort a reservation, as decided by the order service.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_StockServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -130,6 +154,11 @@ def add_StockServiceServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_stock__pb2.BulkStockAdjustment.FromString,
                     response_serializer=proto_dot_stock__pb2.BulkStockAdjustmentResponse.SerializeToString,
             ),
+            'BulkOrderBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.BulkOrderBatch,
+                    request_deserializer=proto_dot_stock__pb2.BulkOrderBatchRequest.FromString,
+                    response_serializer=proto_dot_stock__pb2.BulkOrderBatchResponse.SerializeToString,
+            ),
             'BulkRefund': grpc.unary_unary_rpc_method_handler(
                     servicer.BulkRefund,
                     request_deserializer=proto_dot_stock__pb2.BulkStockAdjustment.FromString,
@@ -140,6 +169,11 @@ def add_StockServiceServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_common__pb2.TransactionStatus.FromString,
                     response_serializer=proto_dot_common__pb2.TransactionStatus.SerializeToString,
             ),
+            'ResolveTransaction': grpc.unary_unary_rpc_method_handler(
+                    servicer.ResolveTransaction,
+                    request_deserializer=proto_dot_common__pb2.TransactionStatus.FromString,
+                    response_serializer=proto_dot_common__pb2.OperationResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'stock.StockService', rpc_method_handlers)
@@ -259,6 +293,33 @@ class StockService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def BulkOrderBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/stock.StockService/BulkOrderBatch',
+            proto_dot_stock__pb2.BulkOrderBatchRequest.SerializeToString,
+            proto_dot_stock__pb2.BulkOrderBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def BulkRefund(request,
             target,
@@ -312,3 +373,30 @@ class StockService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ResolveTransaction(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/stock.StockService/ResolveTransaction',
+            proto_dot_common__pb2.TransactionStatus.SerializeToString,
+            proto_dot_common__pb2.OperationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
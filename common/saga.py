@@ -0,0 +1,253 @@
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from database import TransactionConfig, TransactionError
+from database.stream import AsyncDelayedRetryQueue, AsyncStreamProcessor
+from models import Transaction, TransactionStatus
+
+# Attribute of the local Transaction record holding the peer's outcome
+PEER_STATUS = "peer_status"
+
+
+def resolution(
+    transaction: Transaction, attribute: str, commit: bool
+) -> Tuple[Dict[str, int], str]:
+    """
+    The changes and attribute that db.resolve applies to settle a
+    reservation: a commit takes the reserved amounts off
+    committed_{attribute}, a rollback gives them back to attribute. Only a
+    SUCCESS reservation took anything.
+    """
+    if transaction.status != TransactionStatus.SUCCESS:
+        return {}, attribute
+    if commit:
+        changes = {k: -v for k, v in transaction.details.items()}
+        return changes, f"committed_{attribute}"
+    return dict(transaction.details), attribute
+
+
+class OutcomeResolver:
+    """
+    Event-driven resolution of the stock/payment saga. Each participant's
+    reserve script publishes its final status for a tid to its own outcome
+    stream; the other participant consumes that stream and resolves the tid
+    as soon as it holds both outcomes, without asking the peer.
+
+    The peer outcome is written to the local record before the local status
+    is read, and the local status is final before the local stream entry is
+    visible, so whichever of the two events is handled last sees both.
+    Both may, and the `locked` flag lets only one of them resolve.
+
+    If the local reservation never shows up (the order never reached this
+    participant) the tid is marked STALE after `stale_after` delayed retries,
+    so the late request is refused, and STALE is published so the peer rolls
+    back. The marker expires after transaction_ttl_ms, if one is given.
+    """
+
+    def __init__(
+        self,
+        db,
+        outcome_stream: str,
+        attribute: str,
+        on_commit: Optional[Callable[[str], Awaitable]] = None,
+        stale_after: int = 7,
+        transaction_ttl_ms: Optional[int] = None,
+    ):
+        self.db = db
+        self.attribute = attribute
+        self.on_commit = on_commit
+        self.stale_after = stale_after
+        self.transaction_ttl_ms = transaction_ttl_ms
+        self._outcomes = db.get_stream_producer(outcome_stream)
+
+    async def local_outcome(self, tid: str):
+        """Our reservation of tid finished; resolve if the peer's is already in"""
+        peer_status = await self.db.get_attr(tid, PEER_STATUS, Transaction)
+        if peer_status is None:
+            return
+
+        transaction = await self.db.get(tid, Transaction)
+        if transaction is None or transaction.status == TransactionStatus.STALE:
+            return
+        await self._resolve(transaction, peer_status)
+
+    async def peer_outcome(
+        self,
+        tid: str,
+        status: str,
+        retry_queue: AsyncDelayedRetryQueue,
+        retried: bool = False,
+    ):
+        """The peer published its outcome of tid; resolve if ours is in"""
+        if not retried:
+            await self.db.set_attr(tid, PEER_STATUS, status, Transaction)
+        elif await self.db.get_attr(tid, PEER_STATUS, Transaction) is None:
+            # Resolved by our own outcome event while this retry was waiting
+            return
+
+        transaction = await self.db.get(tid, Transaction)
+
+        if transaction is not None and transaction.status != TransactionStatus.STALE:
+            await self._resolve(transaction, status)
+            return
+
+        if (
+            transaction is not None
+            # A bare STALE marker does not decode as a Transaction in every layout
+            or await self.db.get_attr(tid, "status", Transaction)
+            == TransactionStatus.STALE
+            # The peer gave up waiting for an outcome we never published
+            or TransactionStatus(int(status)) == TransactionStatus.STALE
+        ):
+            await self.db.delete_attr(tid, PEER_STATUS)
+            return
+
+        attempt = await retry_queue.schedule(tid=tid, status=status)
+        if attempt <= self.stale_after:
+            logging.info("Transaction %s not reserved here yet, waiting", tid)
+            return
+
+        stale = TransactionStatus.STALE
+        if await self.db.set_attr_if_absent(tid, "status", stale, Transaction):
+            logging.warning("Transaction %s marked stale", tid)
+            if self.transaction_ttl_ms is not None:
+                await self.db.expire(tid, self.transaction_ttl_ms, Transaction)
+            await self._outcomes.push(tid=tid, status=stale.value)
+
+    async def _resolve(self, transaction: Transaction, peer_status: str):
+        tid = transaction.id
+        if not await self.db.compare_and_set(tid, "locked", False, True):
+            logging.info("Transaction %s is being resolved elsewhere", tid)
+            return
+
+        commit = TransactionStatus(int(peer_status)) == TransactionStatus.SUCCESS
+        resolved = await self.db.resolve(
+            transaction, *resolution(transaction, self.attribute, commit)
+        )
+        if not resolved or transaction.status != TransactionStatus.SUCCESS:
+            return
+
+        if commit:
+            logging.info("Transaction %s committed", tid)
+            if self.on_commit is not None:
+                await self.on_commit(tid)
+        else:
+            logging.info("Rolled %s back!", tid)
+
+
+def unlock_orphan(db, tid: str, status: str) -> bool:
+    """
+    Unlock the reservation tid if it still has the raw status the sweeper
+    saw, under WATCH of its status and lock, so a resolver that took it or
+    resolved it since is left alone.
+
+    Returns:
+        bool: Whether tid is now unlocked with that status, and can be
+        handed to a resolver.
+    """
+    watch = [(tid, "status"), (tid, "locked")]
+    try:
+        with db.transaction(TransactionConfig(begin={"watch": watch})) as tx:
+            transaction = tx.get(tid, Transaction)
+            if transaction is None or transaction.status != TransactionStatus(
+                int(status)
+            ):
+                return False
+            if transaction.locked:
+                tx.set_attr(tid, "locked", False, Transaction)
+    except TransactionError:
+        logging.info("Orphaned transaction %s changed while unlocking it", tid)
+        return False
+    return True
+
+
+def requeue_orphans(db, stream_key: str) -> Callable[[Dict[str, str]], None]:
+    """
+    RetentionPolicy.unresolved for reservations: unlocks each orphaned tid,
+    whose resolver died long ago if it holds the lock, and pushes it to the
+    transactions stream again (see unlock_orphan). Its processor resolves
+    it like any other, the VibeChecker by asking the peer,
+    LocalOutcomeProcessor once the peer's outcome is in. A tid that changed
+    since the sweeper saw it is not pushed; the next sweep looks at it again.
+    """
+
+    def requeue(orphans: Dict[str, str]):
+        producer = db.get_stream_producer(stream_key)
+        for tid, status in orphans.items():
+            if unlock_orphan(db, tid, status):
+                producer.push(tid=tid)
+
+    return requeue
+
+
+async def resolve_decision(
+    db,
+    tid: str,
+    commit: bool,
+    attribute: str,
+    transaction_ttl_ms: Optional[int] = None,
+) -> bool:
+    """
+    Apply the order service's decision on tid to our reservation, in
+    SAGA_MODE=coordinated. An abort that overtakes the reservation marks the
+    tid STALE, for transaction_ttl_ms if given, so the reservation is refused
+    when it arrives; a decision on a tid that is already resolved is a no-op.
+
+    Returns:
+        bool: False if the transaction is locked and the decision has to be
+        sent again.
+    """
+    transaction = await db.get(tid, Transaction)
+    if transaction is None:
+        stale = TransactionStatus.STALE
+        if not commit and await db.set_attr_if_absent(
+            tid, "status", stale, Transaction
+        ):
+            logging.warning("Transaction %s aborted before it was reserved", tid)
+            if transaction_ttl_ms is not None:
+                await db.expire(tid, transaction_ttl_ms, Transaction)
+        return True
+
+    if transaction.status == TransactionStatus.STALE:
+        return True
+
+    if not await db.compare_and_set(tid, "locked", False, True):
+        logging.info("Transaction %s is being resolved elsewhere", tid)
+        return False
+
+    if not await db.resolve(transaction, *resolution(transaction, attribute, commit)):
+        logging.info("Transaction %s was resolved elsewhere", tid)
+    elif transaction.status == TransactionStatus.SUCCESS:
+        logging.info("Transaction %s %s", tid, "committed" if commit else "rolled back")
+    return True
+
+
+class LocalOutcomeProcessor(AsyncStreamProcessor):
+    """Consumes our own transactions stream in the event-driven saga"""
+
+    def __init__(self, redis_client, resolver: OutcomeResolver):
+        super().__init__(redis_client)
+        self.resolver = resolver
+
+    async def callback(self, id, tid=""):
+        await self.resolver.local_outcome(tid)
+
+
+class PeerOutcomeProcessor(AsyncStreamProcessor):
+    """
+    Consumes the peer's outcome stream, on the peer's Redis, in the
+    event-driven saga. Outcomes that arrive before the local reservation wait
+    in a retry queue on the local database.
+    """
+
+    def __init__(self, redis_client, local_redis_client, resolver: OutcomeResolver):
+        super().__init__(redis_client)
+        self.resolver = resolver
+        self.retry_queue = self.retry_queue_class(
+            local_redis_client, f"peer_{self.stream_key}", lease_ms=self.claim_idle_ms
+        )
+
+    async def callback(self, id, tid="", status=""):
+        await self.resolver.peer_outcome(
+            tid, status, self.retry_queue, retried=id is None
+        )
@@ -5,7 +5,16 @@ import logging
 import atexit
 
 from quart import Quart, request
-from config import db, PROFILING
+from config import (
+    db,
+    async_db,
+    payment_channels,
+    stock_channels,
+    coordinator,
+    item_prices,
+    transaction_sweeper,
+    PROFILING,
+)
 from service import order_blueprint
 
 from prometheus_flask_exporter import (
@@ -47,6 +56,27 @@ if PROFILING:
 #     return response
 
 
+@app.before_serving
+async def open_channels():
+    await stock_channels.start()
+    await payment_channels.start()
+    await item_prices.start()
+    if coordinator is not None:
+        coordinator.start()
+    if transaction_sweeper is not None:
+        transaction_sweeper.start()
+
+
+@app.after_serving
+async def close_async_db():
+    if coordinator is not None:
+        await coordinator.close()
+    await item_prices.close()
+    await stock_channels.close()
+    await payment_channels.close()
+    await async_db.close()
+
+
 @atexit.register
 def cleanup():
     db.close()
@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, List, Optional, Tuple
+
+from metrics import CHECKOUT_BATCH_REQUESTS
+from proto.payment_pb2 import PaymentBatchRequest, PaymentRequest
+from proto.stock_pb2 import BulkOrderBatchRequest, BulkStockAdjustment
+
+
+class Coalescer:
+    """
+    Collects the requests submitted within `window` seconds of each other, or
+    until `max_batch` are waiting, and sends them downstream in one call.
+    Every caller gets its own response from the batch.
+    """
+
+    service = ""
+
+    def __init__(self, channels, max_batch: int = 64, window: float = 0.001):
+        self.channels = channels
+        self.max_batch = max_batch
+        self.window = window
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending = set()
+
+    async def send(self, requests: List[Any]) -> List[Any]:
+        """Send a batch of requests, returning one response per request"""
+        raise NotImplementedError
+
+    def submit(self, request) -> asyncio.Future:
+        """Queue a request; the future resolves to its response"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        return future
+
+    def _flush(self):
+        self._timer.cancel()
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]):
+        CHECKOUT_BATCH_REQUESTS.labels(service=self.service).observe(len(batch))
+        try:
+            responses = await self.send([request for request, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+
+class BulkOrderCoalescer(Coalescer):
+    """BulkOrder requests sent as one StockService.BulkOrderBatch"""
+
+    service = "stock"
+
+    async def send(self, requests: List[BulkStockAdjustment]):
+        async with self.channels.lease() as stock_client:
+            response = await stock_client.BulkOrderBatch(
+                BulkOrderBatchRequest(orders=requests)
+            )
+        return response.results
+
+
+class PaymentCoalescer(Coalescer):
+    """ProcessPayment requests sent as one PaymentService.ProcessPaymentBatch"""
+
+    service = "payment"
+
+    async def send(self, requests: List[PaymentRequest]):
+        async with self.channels.lease() as payment_client:
+            response = await payment_client.ProcessPaymentBatch(
+                PaymentBatchRequest(payments=requests)
+            )
+        return response.results
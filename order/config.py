@@ -8,20 +8,34 @@ if not os.path.isdir("common"):
     sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
 
 
-import grpc.aio
-import grpc
+from channels import ChannelPool
+from coordinator import CheckoutCoordinator, requeue_checkouts
+from batching import BulkOrderCoalescer, PaymentCoalescer
+from item_cache import ItemPriceCache
 from proto.payment_pb2_grpc import PaymentServiceStub
 from proto.stock_pb2_grpc import StockServiceStub
 
-from database import RedisClient, IgniteClient
+from database import (
+    RedisClient,
+    AsyncRedisClient,
+    RedisHashClient,
+    AsyncRedisHashClient,
+    IgniteClient,
+    AsyncClientAdapter,
+)
+from database.retention import RetentionPolicy, RetentionSweeper
 from utils import hosttotup, wait_for_ignite
 
-from models import Order
+from models import Order, Transaction
 
 load_dotenv()
 
 if os.environ.get("DB_TYPE", "redis") == "redis":
-    db = RedisClient(
+    # Reads marked replica-eligible go to a Sentinel replica that applied every
+    # write of its master up to this many seconds ago; unset, every read goes to
+    # the master
+    replica_max_lag = os.environ.get("REDIS_REPLICA_MAX_LAG")
+    redis_config = dict(
         sentinel_hosts=os.environ.get(
             "SENTINEL_HOSTS", None
         ),  # e.g., "sentinel1:26379,sentinel2:26379,sentinel3:26379"
@@ -31,12 +45,22 @@ if os.environ.get("DB_TYPE", "redis") == "redis":
         port=int(os.environ.get("REDIS_PORT", None)),
         password=os.environ["REDIS_PASSWORD"],
         db=int(os.environ["REDIS_DB"]),
+        replica_max_lag=float(replica_max_lag) if replica_max_lag else None,
     )
+    # "keys" stores one string key per attribute, "hash" one hash per model
+    if os.environ.get("REDIS_LAYOUT", "keys") == "hash":
+        db = RedisHashClient(**redis_config)
+        # Used by the Quart handlers and grpc.aio servicers
+        async_db = AsyncRedisHashClient(**redis_config)
+    else:
+        db = RedisClient(**redis_config)
+        async_db = AsyncRedisClient(**redis_config)
 else:
     wait_for_ignite()
     db = IgniteClient(
         list(map(hosttotup, os.environ["IGNITE_HOSTS"].split(","))), model_class=Order
     )
+    async_db = AsyncClientAdapter(db)
 
 
 PROFILING = os.environ.get("PROFILING", "false") == "true"
@@ -49,39 +73,101 @@ cache = RedisClient(
 )
 
 
-class AsyncPaymentClient:
-    def __init__(self):
-        self._payment_channel = None
-        self._payment_client = None
+# Long-lived channels shared by all handlers of this worker, opened in
+# app.before_serving rather than once per request
+GRPC_CHANNELS_PER_TARGET = int(os.environ.get("GRPC_CHANNELS_PER_TARGET", "4"))
 
-    async def __aenter__(self):
-        # Create the gRPC channel and client asynchronously
-        self._payment_channel = grpc.aio.insecure_channel(
-            os.environ["PAYMENT_SERVICE_ADDR"],
-            options=(("grpc.lb_policy_name", "round_robin"),),
-        )
-        self._payment_client = PaymentServiceStub(self._payment_channel)
-        return self._payment_client
+payment_channels = ChannelPool(
+    os.environ["PAYMENT_SERVICE_ADDR"],
+    PaymentServiceStub,
+    size=GRPC_CHANNELS_PER_TARGET,
+)
+stock_channels = ChannelPool(
+    os.environ["STOCK_SERVICE_ADDR"],
+    StockServiceStub,
+    size=GRPC_CHANNELS_PER_TARGET,
+)
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        # Close the channel asynchronously
-        await self._payment_channel.close()
+# Prices of up to ITEM_PRICE_CACHE_SIZE items are kept for add_item, for at most
+# ITEM_PRICE_CACHE_TTL_S, and dropped when the stock service publishes a write
+# of the item on its database. Without Redis there are no such invalidations,
+# so nothing is cached.
+ITEM_PRICE_CACHE_SIZE = int(os.environ.get("ITEM_PRICE_CACHE_SIZE", "100000"))
+ITEM_PRICE_CACHE_TTL_S = float(os.environ.get("ITEM_PRICE_CACHE_TTL_S", "60"))
+if os.environ.get("DB_TYPE", "redis") == "redis":
+    stock_async_db = AsyncRedisClient(
+        **dict(
+            redis_config,
+            master_name=os.environ["STOCK_REDIS_MASTER_NAME"],
+            host=os.environ["STOCK_REDIS_HOST"],
+        )
+    )
+    item_prices = ItemPriceCache(
+        stock_channels,
+        ITEM_PRICE_CACHE_SIZE,
+        ITEM_PRICE_CACHE_TTL_S,
+        invalidations=stock_async_db.redis,
+    )
+else:
+    item_prices = ItemPriceCache(stock_channels, max_size=0)
+
+# Opt-in: checkouts arriving within CHECKOUT_BATCH_WINDOW_MS of each other (up
+# to CHECKOUT_BATCH_SIZE of them) share one BulkOrderBatch and one
+# ProcessPaymentBatch RPC instead of sending their own
+CHECKOUT_BATCHING = os.environ.get("CHECKOUT_BATCHING", "false") == "true"
+CHECKOUT_BATCH_SIZE = int(os.environ.get("CHECKOUT_BATCH_SIZE", "64"))
+CHECKOUT_BATCH_WINDOW_MS = float(os.environ.get("CHECKOUT_BATCH_WINDOW_MS", "1"))
+
+stock_orders = payment_orders = None
+if CHECKOUT_BATCHING:
+    stock_orders = BulkOrderCoalescer(
+        stock_channels, CHECKOUT_BATCH_SIZE, CHECKOUT_BATCH_WINDOW_MS / 1000
+    )
+    payment_orders = PaymentCoalescer(
+        payment_channels, CHECKOUT_BATCH_SIZE, CHECKOUT_BATCH_WINDOW_MS / 1000
+    )
 
+# "coordinated": checkout sends its commit/abort decision to stock and payment
+# itself (see coordinator.py); the other modes leave it to their streams
+SAGA_MODE = os.environ.get("SAGA_MODE", "poll")
+# Checkouts without an acknowledged decision by then are recovered, and
+# aborted if they were never decided
+CHECKOUT_DECISION_TIMEOUT_MS = int(
+    os.environ.get("CHECKOUT_DECISION_TIMEOUT_MS", "10000")
+)
 
-class AsyncStockClient:
-    def __init__(self):
-        self._stock_channel = None
-        self._stock_client = None
+# Checkout transactions are deleted by the database TRANSACTION_TTL_S after
+# their outcome is known. Those that never learn it (their handler died) are
+# found once TRANSACTION_ORPHAN_AGE_S old, by a sweep of the Redis master
+# every TRANSACTION_SWEEP_INTERVAL_S, 0 to turn it off. They are deleted, as
+# stock and payment resolve their reservations themselves, except in
+# SAGA_MODE=coordinated, where they are handed to the coordinator's recovery
+# so the participants still learn the decision.
+TRANSACTION_RETENTION = RetentionPolicy(
+    Transaction,
+    "status",
+    ttl_ms=int(float(os.environ.get("TRANSACTION_TTL_S", "3600")) * 1000),
+    orphan_age_s=float(os.environ.get("TRANSACTION_ORPHAN_AGE_S", "86400")),
+    final=() if SAGA_MODE == "coordinated" else None,
+    unresolved=requeue_checkouts(db) if SAGA_MODE == "coordinated" else None,
+)
+TRANSACTION_TTL_MS = TRANSACTION_RETENTION.ttl_ms
+TRANSACTION_SWEEP_INTERVAL_S = float(
+    os.environ.get("TRANSACTION_SWEEP_INTERVAL_S", "300")
+)
 
-    async def __aenter__(self):
-        # Create the gRPC channel and client asynchronously
-        self._stock_channel = grpc.aio.insecure_channel(
-            os.environ["STOCK_SERVICE_ADDR"],
-            options=(("grpc.lb_policy_name", "round_robin"),),
-        )
-        self._stock_client = StockServiceStub(self._stock_channel)
-        return self._stock_client
+transaction_sweeper = None
+if os.environ.get("DB_TYPE", "redis") == "redis" and TRANSACTION_SWEEP_INTERVAL_S > 0:
+    transaction_sweeper = RetentionSweeper(
+        db, [TRANSACTION_RETENTION], TRANSACTION_SWEEP_INTERVAL_S
+    )
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        # Close the channel asynchronously
-        await self._stock_channel.close()
+coordinator = None
+if SAGA_MODE == "coordinated":
+    coordinator = CheckoutCoordinator(
+        async_db,
+        stock_channels,
+        payment_channels,
+        timeout_ms=CHECKOUT_DECISION_TIMEOUT_MS,
+        transaction_ttl_ms=TRANSACTION_TTL_MS,
+    )
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+import grpc
+from database import TransactionConfig, TransactionError
+from database.stream import AsyncDelayedRetryQueue, DelayedRetryQueue
+from models import Order, Transaction, TransactionStatus
+from proto import common_pb2
+
+DECISIONS_KEY = "decisions"
+
+
+async def mark_paid(db, order_id: str, order: Optional[Order]):
+    """
+    Mark an order paid and add it to the revenue and sold aggregates read by
+    RevenueAndSoldStockCollector. Meant for a MULTI block, so they never
+    disagree.
+    """
+    await db.increment(order_id, "paid", 1)
+    if order is None:
+        return
+    await db.increment_aggregate("revenue", order.total_cost)
+    await db.increment_aggregate(
+        "sold", sum(int(item.split(":")[1]) for item in order.items)
+    )
+
+
+async def commit_checkouts(
+    db,
+    tids: List[str],
+    transaction_ttl_ms: Optional[int] = None,
+    attempts: int = 10,
+) -> int:
+    """
+    Mark the orders of committed checkouts paid, with one pipelined read of
+    their transactions and one MULTI/EXEC write for the whole batch. The
+    statuses are read under WATCH, and the batch read again if any of them
+    changed before the EXEC, so a checkout is only counted once however often
+    or concurrently its commit is reported within transaction_ttl_ms, after
+    which its transaction expires.
+
+    Returns:
+        int: The number of orders marked paid.
+
+    Raises:
+        TransactionError: If the statuses kept changing for `attempts` reads.
+    """
+    watch = [(tid, "status") for tid in tids]
+    for attempt in range(attempts):
+        try:
+            async with db.transaction(TransactionConfig(begin={"watch": watch})) as tx:
+                transactions = await tx.get_all(tids, Transaction)
+                pending = [
+                    t
+                    for t in transactions
+                    if t is not None and t.status == TransactionStatus.PENDING
+                ]
+                order_ids = [t.details["order_id"] for t in pending]
+                orders = await tx.get_all(order_ids, Order)
+                for t, order_id, order in zip(pending, order_ids, orders):
+                    await tx.set_attr(
+                        t.id, "status", TransactionStatus.SUCCESS, Transaction
+                    )
+                    await mark_paid(tx, order_id, order)
+                    if transaction_ttl_ms is not None:
+                        await tx.expire(t.id, transaction_ttl_ms, Transaction)
+            return len(pending)
+        except TransactionError:
+            if attempt == attempts - 1:
+                raise
+            logging.info("Checkouts %s changed while committing, retrying", tids)
+    return 0
+
+
+def requeue_checkouts(db) -> Callable[[Dict[str, str]], None]:
+    """
+    RetentionPolicy.unresolved in SAGA_MODE=coordinated: schedules orphaned
+    checkouts for recovery by CheckoutCoordinator.run, which aborts those
+    never decided, gives them their TTL and sends the decision again. A
+    decision is only forgotten after it reached stock and payment.
+    """
+
+    def requeue(orphans: Dict[str, str]):
+        decisions = DelayedRetryQueue(db.redis, DECISIONS_KEY)
+        for tid in orphans:
+            decisions.schedule(tid=tid)
+
+    return requeue
+
+
+class CheckoutCoordinator:
+    """
+    Commit/abort broadcast for SAGA_MODE=coordinated. The checkout handler
+    holds both reservation outcomes, so it decides on the transaction itself
+    and sends the decision to stock and payment through ResolveTransaction,
+    instead of the two reconciling through their streams.
+
+    Every checkout is scheduled in a delayed retry queue before its
+    reservations are sent, and dropped from it once both participants have
+    acknowledged the decision. Whatever is still there after timeout_ms is
+    recovered by run(): a checkout that never got a decision (its handler
+    died or hung) is aborted, and the decision is sent again with backoff.
+
+    A decided transaction expires transaction_ttl_ms later, which every
+    recovery pushes back, so it outlives the delivery of its decision.
+    """
+
+    def __init__(
+        self,
+        db,
+        stock_channels,
+        payment_channels,
+        timeout_ms: int = 10000,
+        batch_size: int = 100,
+        transaction_ttl_ms: Optional[int] = None,
+    ):
+        self.db = db
+        self.stock_channels = stock_channels
+        self.payment_channels = payment_channels
+        self.batch_size = batch_size
+        self.transaction_ttl_ms = transaction_ttl_ms
+        # Due timeout_ms to 2 * timeout_ms after begin(), then backing off
+        self.decisions = AsyncDelayedRetryQueue(
+            db.redis, DECISIONS_KEY, base_ms=2 * timeout_ms, max_ms=12 * timeout_ms
+        )
+        self._deliveries = set()
+        self._recovery: Optional[asyncio.Task] = None
+
+    async def _retain(self, tid: str):
+        if self.transaction_ttl_ms is not None:
+            await self.db.expire(tid, self.transaction_ttl_ms, Transaction)
+
+    async def begin(self, tid: str):
+        """Register a checkout before any of its reservations is sent"""
+        await self.decisions.schedule(tid=tid)
+
+    async def decide(
+        self, transaction: Transaction, order: Order, commit: bool
+    ) -> bool:
+        """
+        Record the decision on a checkout and mark its order paid on commit.
+
+        Returns:
+            bool: Whether the checkout committed; it cannot once recovery
+            has aborted it.
+        """
+        tid = transaction.id
+        status = TransactionStatus.SUCCESS if commit else TransactionStatus.FAILURE
+        try:
+            # The decision, the order marked paid and the TTL in one MULTI,
+            # against recovery aborting the checkout since the read
+            async with self.db.transaction(
+                TransactionConfig(begin={"watch": [(tid, "status")]})
+            ) as decision:
+                current = await decision.get_attr(tid, "status", Transaction)
+                if current == TransactionStatus.PENDING:
+                    await decision.set_attr(tid, "status", status, Transaction)
+                    if commit:
+                        await mark_paid(decision, order.id, order)
+                    if self.transaction_ttl_ms is not None:
+                        await decision.expire(tid, self.transaction_ttl_ms, Transaction)
+        except TransactionError:
+            logging.warning("Decision on transaction %s was interrupted", tid)
+
+        # Whatever was recorded, by this call or by recovery, is the decision
+        decided = await self.db.get_attr(tid, "status", Transaction)
+        if decided != status:
+            logging.warning("Transaction %s was aborted before its decision", tid)
+        return decided == TransactionStatus.SUCCESS
+
+    def broadcast(self, tid: str, commit: bool):
+        """Send the decision on tid in the background"""
+        task = asyncio.create_task(self._deliver(tid, commit))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, tid: str, commit: bool) -> bool:
+        decision = common_pb2.TransactionStatus(tid=tid, success=commit)
+        try:
+            async with (
+                self.stock_channels.lease() as stock_client,
+                self.payment_channels.lease() as payment_client,
+            ):
+                responses = await asyncio.gather(
+                    stock_client.ResolveTransaction(decision),
+                    payment_client.ResolveTransaction(decision),
+                )
+        except grpc.RpcError:
+            logging.exception("Error in ResolveTransaction for %s", tid)
+            return False
+
+        if not all(response.success for response in responses):
+            logging.info("Transaction %s not resolved yet, retrying later", tid)
+            return False
+
+        await self.decisions.discard(tid=tid)
+        return True
+
+    async def _recover(self, tid: str):
+        # Scheduled again before anything else, so a failure here loses nothing
+        await self.decisions.schedule(tid=tid)
+
+        # Presumed abort: a checkout still undecided by now never will be
+        await self.db.compare_and_set(
+            tid, "status", TransactionStatus.PENDING, TransactionStatus.FAILURE
+        )
+        status = await self.db.get_attr(tid, "status", Transaction)
+        if status is None:
+            await self.decisions.discard(tid=tid)
+            return
+
+        await self._retain(tid)
+        await self._deliver(tid, status == TransactionStatus.SUCCESS)
+
+    async def run(self):
+        while True:
+            try:
+                # Each recovery schedules its tid again first, so the lease
+                # only matters if this replica dies before it does
+                entries, next_due, _ = await self.decisions.pop_due(self.batch_size)
+            except Exception:
+                logging.exception("Error reading checkout decisions")
+                entries, next_due = [], None
+
+            results = await asyncio.gather(
+                *(self._recover(entry["tid"]) for entry in entries),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logging.error("Error recovering a checkout: %s", result)
+
+            if not entries:
+                wait = 1.0 if next_due is None else next_due / 1000 - time.time()
+                await asyncio.sleep(min(1.0, max(0.001, wait)))
+
+    def start(self):
+        self._recovery = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._recovery is not None:
+            self._recovery.cancel()
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
@@ -1,5 +1,4 @@
 import logging
-from models import Order
 from prometheus_client.core import GaugeMetricFamily
 from prometheus_client.registry import Collector
 from config import db
@@ -8,9 +7,7 @@ logger = logging.getLogger(__name__)
 
 class RevenueAndSoldStockCollector(Collector):
     def collect(self):
-        order_ids = self.get_order_ids()
-
-        revenue, sold_stock = self.get_revenue_and_sold_stock(order_ids)
+        revenue, sold_stock = self.get_revenue_and_sold_stock()
 
         revenue_gauge = GaugeMetricFamily('total_revenue', 'Total money fed into the system through successful order checkouts')
         revenue_gauge.add_metric([], revenue)
@@ -21,57 +18,15 @@ class RevenueAndSoldStockCollector(Collector):
         yield revenue_gauge
         yield sold_stock_gauge
 
-    def get_revenue_and_sold_stock(self, order_ids):
+    def get_revenue_and_sold_stock(self):
+        # Added to by every checkout that commits, in the MULTI marking it paid
         try:
-            sold_stock = 0
-            revenue = 0
-            for order_id in order_ids:
-                order = db.get(order_id, Order)
-
-                revenue += self.get_order_cost(order)
-                sold_stock += self.get_order_stock(order)
-                # else:
-                #     logger.error(f"Skipping invalid or unpaid order {order_id}")
+            revenue = db.get_aggregate("revenue")
+            sold_stock = db.get_aggregate("sold")
         except Exception as e:
-            logger.error(f"Error fetching orders or  costs: {e}")
-        
+            logger.error(f"Error fetching the revenue and sold stock: {e}")
+            return 0, 0
 
         logger.info(f"Aggregate of received monetary resources ($$$): {revenue}")
         logger.info(f"Aggregate of successfully sold inventory resources ($$$): {sold_stock}")
         return revenue, sold_stock
-
-
-
-    def get_order_ids(self):
-        try:
-            order_keys = db.keys("model:*:paid")
-            
-            if not order_keys:
-                logger.info("No orders found!")
-                return []  
-
-            logger.info(f"Number of orders found: {len(order_keys)}")
-
-            order_ids = [key.split(":")[1] for key in order_keys]
-
-            return order_ids
-        except Exception as e:
-            logger.error(f"Error fetching orders: {e}")
-            return []  
-
-    def get_order_cost(self, order):
-        if order.total_cost is not None and order.paid:
-            return order.total_cost
-        else: 
-            return 0
-
-    def get_order_stock(self, order):
-        quantity = 0
-        if order.items is not None and order.paid:
-            for item in order.items:
-                quantity += (int) (item.split(":")[1])
-            return quantity
-        else: 
-            return 0
-
-    
\ No newline at end of file
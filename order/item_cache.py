@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import grpc
+import redis
+import redis.asyncio
+
+from metrics import ITEM_PRICE_CACHE_INVALIDATIONS, ITEM_PRICE_CACHE_REQUESTS
+from proto.stock_pb2 import ItemRequest
+
+# Published to by the stock service with an item id when the item is written,
+# or "*" when many are (see stock/config.py)
+ITEM_PRICES_CHANNEL = "item_prices"
+
+
+class InvalidationPubSub(redis.asyncio.client.PubSub):
+    """
+    Subscription to ITEM_PRICES_CHANNEL that drops the whole cache whenever
+    its connection is (re)established, since invalidations published while
+    it was down are lost.
+    """
+
+    def __init__(self, connection_pool, cache: "ItemPriceCache"):
+        super().__init__(connection_pool)
+        self.cache = cache
+
+    async def on_connect(self, connection):
+        self.cache.invalidate()
+        await super().on_connect(connection)
+
+
+class ItemPriceCache:
+    """
+    In-process LRU cache of item prices with a TTL, filled from
+    StockService.FindItem on a miss, so add_item does not call the stock
+    service for items it has seen recently.
+
+    Entries are dropped when the stock service announces a write of the item
+    on ITEM_PRICES_CHANNEL of its Redis. A price fetched while an
+    invalidation arrived is not stored, and the whole cache is dropped when
+    the subscription is lost or reconnects. The TTL bounds how stale a price
+    can get if an invalidation is missed all the same.
+    """
+
+    def __init__(
+        self,
+        stock_channels,
+        max_size: int = 100000,
+        ttl: float = 60.0,
+        invalidations=None,
+    ):
+        self.stock_channels = stock_channels
+        self.max_size = max_size
+        self.ttl = ttl
+        # Redis client of the stock database, None to rely on the TTL alone
+        self.invalidations = invalidations
+        self._prices: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        # Bumped by every invalidation, to spot those racing with a fetch
+        self._generation = 0
+        self._pubsub: Optional[InvalidationPubSub] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _cached(self, item_id: str) -> Optional[int]:
+        entry = self._prices.get(item_id)
+        if entry is None:
+            return None
+
+        price, expires = entry
+        if expires < time.monotonic():
+            del self._prices[item_id]
+            return None
+
+        self._prices.move_to_end(item_id)
+        return price
+
+    def _store(self, item_id: str, price: int):
+        if self.max_size <= 0:
+            return
+        self._prices[item_id] = (price, time.monotonic() + self.ttl)
+        self._prices.move_to_end(item_id)
+        while len(self._prices) > self.max_size:
+            self._prices.popitem(last=False)
+
+    async def price(self, item_id: str) -> Optional[int]:
+        """The price of an item, None if the stock service does not know it"""
+        price = self._cached(item_id)
+        if price is not None:
+            ITEM_PRICE_CACHE_REQUESTS.labels(result="hit").inc()
+            return price
+
+        ITEM_PRICE_CACHE_REQUESTS.labels(result="miss").inc()
+        generation = self._generation
+        try:
+            async with self.stock_channels.lease() as stock_client:
+                item = await stock_client.FindItem(ItemRequest(item_id=item_id))
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                return None
+            raise
+
+        if not item.id:
+            return None
+        if generation == self._generation:
+            self._store(item_id, item.price)
+        return item.price
+
+    def invalidate(self, item_id: Optional[str] = None):
+        """Drop one item, or every item when item_id is None"""
+        self._generation += 1
+        ITEM_PRICE_CACHE_INVALIDATIONS.inc()
+        if item_id is None:
+            self._prices.clear()
+        else:
+            self._prices.pop(item_id, None)
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        data = message["data"]
+                        self.invalidate(None if data == "*" else data)
+            except redis.RedisError:
+                logging.exception("Lost the item price invalidations, reconnecting")
+                self.invalidate()
+                await asyncio.sleep(1)
+
+    async def start(self):
+        """Subscribe to invalidations before the first request is served"""
+        if self.invalidations is None:
+            return
+        self._pubsub = InvalidationPubSub(self.invalidations.connection_pool, self)
+        await self._pubsub.subscribe(ITEM_PRICES_CHANNEL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await self._pubsub.aclose()
+        if self.invalidations is not None:
+            await self.invalidations.aclose()
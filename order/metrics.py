@@ -7,3 +7,18 @@ TOTAL_MONEY = Gauge(
 REQUEST_COUNT = Counter('http_request_total', 'Total HTTP Requests', ['method', 'status', 'path'])
 REQUEST_LATENCY = Histogram('http_request_latency', 'HTTP Request Latency', ['method', 'status', 'path'])
 REQUEST_IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP Requests in progress', ['method', 'path'])
+CHECKOUT_BATCH_REQUESTS = Histogram(
+    "checkout_batch_requests",
+    "Checkouts coalesced into one batched RPC",
+    ["service"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+ITEM_PRICE_CACHE_REQUESTS = Counter(
+    "item_price_cache_requests",
+    "Item price lookups of add_item, by whether the cache had the price",
+    ["result"],
+)
+ITEM_PRICE_CACHE_INVALIDATIONS = Counter(
+    "item_price_cache_invalidations",
+    "Item price cache entries dropped by the stock service, or flushed",
+)
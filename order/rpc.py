@@ -0,0 +1,48 @@
+import logging
+import asyncio
+import sys
+
+import grpc
+import grpc.aio
+
+from config import async_db as db, TRANSACTION_TTL_MS
+from coordinator import commit_checkouts
+from proto import order_pb2_grpc, common_pb2
+
+root = logging.getLogger()
+root.setLevel(logging.DEBUG)
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+root.addHandler(handler)
+
+
+class OrderServiceServicer(order_pb2_grpc.OrderServiceServicer):
+    async def CommitCheckouts(self, request, context):
+        try:
+            committed = await commit_checkouts(
+                db, list(request.tids), TRANSACTION_TTL_MS
+            )
+        except Exception as e:
+            logging.exception("Error in CommitCheckouts")
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+        logging.info("Committed %s of %s checkouts", committed, len(request.tids))
+        return common_pb2.OperationResponse(success=True)
+
+
+async def serve():
+    print("Starting gRPC Order Service")
+    server = grpc.aio.server()
+    order_pb2_grpc.add_OrderServiceServicer_to_server(OrderServiceServicer(), server)
+    server.add_insecure_port("[::]:50053")
+    await server.start()
+    logging.info("gRPC Order Service started on port 50053")
+    await server.wait_for_termination()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
+    print("Order Service exiting")
@@ -6,20 +6,28 @@ import uuid
 from time import perf_counter
 from collections import defaultdict
 from quart import Blueprint, jsonify, abort, Response, current_app
-from config import db, AsyncPaymentClient, AsyncStockClient
+from config import (
+    async_db as db,
+    payment_channels,
+    stock_channels,
+    stock_orders,
+    payment_orders,
+    coordinator,
+    item_prices,
+    TRANSACTION_TTL_MS,
+)
+from coordinator import commit_checkouts
 from models import Order, Stock, Transaction, TransactionStatus
-from redis.exceptions import WatchError
-from database import TransactionConfig
 from proto.payment_pb2 import PaymentRequest
-from proto.stock_pb2 import ItemRequest, StockAdjustment, BulkStockAdjustment
+from proto.stock_pb2 import StockAdjustment, BulkStockAdjustment
 
 order_blueprint = Blueprint("order", __name__)
 DB_ERROR_STR = "DB error"
 
 
-def get_order_from_db(order_id: str) -> Order:
+async def get_order_from_db(order_id: str, db=db) -> Order:
     try:
-        order = db.get(order_id, Order)
+        order = await db.get(order_id, Order)
         if order is None:
             current_app.logger.error("Order not found: %s", order_id)
             abort(400, f"Order: {order_id} not found!")
@@ -29,9 +37,9 @@ def get_order_from_db(order_id: str) -> Order:
         abort(400, DB_ERROR_STR)
 
 
-def get_order_field_from_db(order_id: str, field: str) -> Order:
+async def get_order_field_from_db(order_id: str, field: str) -> Order:
     try:
-        order = db.get_attr(order_id, field, Order)
+        order = await db.get_attr(order_id, field, Order)
         if order is None:
             current_app.logger.error("Order not found: %s", order_id)
             abort(400, f"Order: {order_id} not found!")
@@ -46,7 +54,7 @@ async def create_order(user_id: str):
     order_id = str(uuid.uuid4())
     order = Order(id=order_id, paid=0, items=[], user_id=user_id, total_cost=0)
     try:
-        db.save(order)
+        await db.save(order)
         current_app.logger.info("Order created: %s for user %s", order_id, user_id)
     except Exception as e:
         current_app.logger.exception("Failed to save order: %s", order_id)
@@ -56,7 +64,7 @@ async def create_order(user_id: str):
 
 @order_blueprint.get("/find_order/<order_id>")
 async def find_order(order_id: str):
-    order = get_order_from_db(order_id)
+    order = await get_order_from_db(order_id, db=await db.replica())
 
     items = defaultdict(int)
 
@@ -77,47 +85,32 @@ async def find_order(order_id: str):
 
 @order_blueprint.post("/addItem/<order_id>/<item_id>/<quantity>")
 async def add_item(order_id: str, item_id: str, quantity: int):
-    async with AsyncStockClient() as stock_client:
-        with db.transaction(
-            TransactionConfig(
-                begin={"watch": [(order_id, "items"), (order_id, "total_cost")]}
-            )
-        ) as transaction:
-            items = get_order_field_from_db(order_id, "items")
-
-            try:
-                item_response = await stock_client.FindItem(
-                    ItemRequest(item_id=item_id)
-                )
-            except Exception as e:
-                current_app.logger.exception(
-                    "Error calling StockService for item %s", item_id
-                )
-                abort(400, "Error communicating with stock service")
-            if not item_response.id:
-                current_app.logger.error("Item not found: %s", item_id)
-                abort(400, f"Item {item_id} not found")
-
-            # Append a tuple (item_id, quantity) to the order.
-            items.append(f"{item_id}:{int(quantity)}")
+    try:
+        price = await item_prices.price(item_id)
+    except Exception as e:
+        current_app.logger.exception("Error calling StockService for item %s", item_id)
+        abort(400, "Error communicating with stock service")
+    if price is None:
+        current_app.logger.error("Item not found: %s", item_id)
+        abort(400, f"Item {item_id} not found")
+
+    # Append a tuple (item_id, quantity) to the order and add its price to
+    # the total in one atomic call, so concurrent adds do not retry
+    try:
+        total_cost = await db.append_and_increment(
+            order_id, "items", f"{item_id}:{int(quantity)}", "total_cost", price, Order
+        )
+    except Exception as e:
+        current_app.logger.exception("Failed to update order: %s", order_id)
+        abort(400, DB_ERROR_STR)
+    if total_cost is None:
+        current_app.logger.error("Order not found: %s", order_id)
+        abort(400, f"Order: {order_id} not found!")
 
-            try:
-                transaction.increment(order_id, "total_cost", item_response.price)
-                transaction.set_attr(order_id, "items", items, Order)
-                current_app.logger.info(
-                    "Added item %s (qty %s) to order %s", item_id, quantity, order_id
-                )
-            except WatchError as watch_err:
-                current_app.logger.exception("Watch error 2024: %s", str(watch_err))
-                return await add_item(
-                    order_id=order_id, item_id=item_id, quantity=quantity
-                )
-            except Exception as e:
-                current_app.logger.exception("Failed to update order: %s", order_id)
-                abort(400, DB_ERROR_STR)
-            return Response(
-                f"Item {item_id} added. Total item count: {len(items)}", status=200
-            )
+    current_app.logger.info(
+        "Added item %s (qty %s) to order %s", item_id, quantity, order_id
+    )
+    return Response(f"Item {item_id} added. Total cost: {total_cost}", status=200)
 
 
 @order_blueprint.post("/batch_init/<n>/<n_items>/<n_users>/<item_price>")
@@ -165,7 +158,7 @@ async def batch_init_orders(n: str, n_items: str, n_users: str, item_price: str)
         orders.append(order)
 
     try:
-        db.save_all(orders)
+        await db.save_all(orders)
     except Exception as e:
         current_app.logger.exception("Failed to save batch orders")
         abort(400, DB_ERROR_STR)
@@ -174,19 +167,15 @@ async def batch_init_orders(n: str, n_items: str, n_users: str, item_price: str)
     return jsonify({"msg": "Batch init for orders successful"})
 
 
+# The stream processors report commits through OrderService.CommitCheckouts
 @order_blueprint.post("/commit_checkout/<tid>")
 async def commit_checkout_individual(tid: str):
-    current_app.logger.info("Commiting order for transaction {tid}.")
+    current_app.logger.info("Commiting order for transaction %s.", tid)
     try:
-        transaction = db.get(tid, Transaction)
+        await commit_checkouts(db, [tid], TRANSACTION_TTL_MS)
     except Exception as e:
-        current_app.logger.error(f"Error fetching transaction from database: {e}")
-    if transaction is None:
-        current_app.logger.error(f"No transaction: {tid}")
-    order_id = transaction.details.get("order_id")
-    db.increment(order_id, "paid", 1)
-    # db.delete(transaction)
-    current_app.logger.info("Commit successful for order %s.", order_id)
+        current_app.logger.exception("Failed to commit transaction %s", tid)
+        abort(400, DB_ERROR_STR)
     return Response("Commit successful", status=200)
 
 
@@ -211,9 +200,12 @@ async def checkout_individual(order_id: str):
             current_app.logger.info("Reverted stock for item %s: %s", item_id, qty)
 
     t1 = perf_counter()
-    async with AsyncStockClient() as stock_client, AsyncPaymentClient() as payment_client:
+    async with (
+        stock_channels.lease() as stock_client,
+        payment_channels.lease() as payment_client,
+    ):
         t2 = perf_counter()
-        order = get_order_from_db(order_id)
+        order = await get_order_from_db(order_id)
         t3 = perf_counter()
 
         items = defaultdict(int)
@@ -223,7 +215,7 @@ async def checkout_individual(order_id: str):
             TransactionStatus.PENDING,
             {"order_id": order_id},
         )
-        db.save(transaction)
+        await db.save(transaction)
 
         for item in order.items:
             item_id, qty = item.split(":")
@@ -313,9 +305,12 @@ async def checkout_bulk(order_id: str):
             current_app.logger.info("Reverted stock for item %s: %s", item_id, qty)
 
     t1 = perf_counter()
-    async with AsyncStockClient() as stock_client, AsyncPaymentClient() as payment_client:
+    async with (
+        stock_channels.lease() as stock_client,
+        payment_channels.lease() as payment_client,
+    ):
         t2 = perf_counter()
-        order = get_order_from_db(order_id)
+        order = await get_order_from_db(order_id)
         t3 = perf_counter()
 
         items = defaultdict(int)
@@ -325,7 +320,7 @@ async def checkout_bulk(order_id: str):
             TransactionStatus.PENDING,
             {"order_id": order_id},
         )
-        db.save(transaction)
+        await db.save(transaction)
 
         for item in order.items:
             item_id, qty = item.split(":")
@@ -336,26 +331,45 @@ async def checkout_bulk(order_id: str):
 
         deducted_items = [x.to_proto() for x in items.values()]
 
-        try:
-            stock_rpc = stock_client.BulkOrder(
-                BulkStockAdjustment(items=deducted_items, tid=tid)
-            )
-        except Exception as e:
-            current_app.logger.exception(
-                "Error calling RemoveStock for items %s", items
-            )
-            abort(400, "Error communicating with stock service")
+        if coordinator is not None:
+            await coordinator.begin(tid)
 
-        payment_rpc = payment_client.ProcessPayment(
-            PaymentRequest(user_id=order.user_id, amount=order.total_cost, tid=tid)
+        stock_request = BulkStockAdjustment(items=deducted_items, tid=tid)
+        payment_request = PaymentRequest(
+            user_id=order.user_id, amount=order.total_cost, tid=tid
         )
 
+        if stock_orders is not None:
+            # Sent along with concurrent checkouts in one RPC per service
+            stock_rpc = stock_orders.submit(stock_request)
+            payment_rpc = payment_orders.submit(payment_request)
+        else:
+            try:
+                stock_rpc = stock_client.BulkOrder(stock_request)
+            except Exception as e:
+                current_app.logger.exception(
+                    "Error calling RemoveStock for items %s", items
+                )
+                abort(400, "Error communicating with stock service")
+
+            payment_rpc = payment_client.ProcessPayment(payment_request)
+
         t5 = perf_counter()
         payment_response = await payment_rpc
         t6 = perf_counter()
         stock_response = await stock_rpc
         t7 = perf_counter()
 
+        if coordinator is not None:
+            commit = payment_response.success and stock_response.status.success
+            committed = await coordinator.decide(transaction, order, commit)
+            coordinator.broadcast(tid, committed)
+            if commit and not committed:
+                abort(400, "Checkout timed out")
+        elif not (payment_response.success and stock_response.status.success):
+            # Never committed, so nothing else will touch the transaction
+            await db.expire(tid, TRANSACTION_TTL_MS, Transaction)
+
         if not payment_response.success:
             err_msg = payment_response.error or "Payment failed"
             current_app.logger.error(
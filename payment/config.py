@@ -7,15 +7,31 @@ if not os.path.isdir("common"):
     sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
 
 from dotenv import load_dotenv
-from database import RedisClient, IgniteClient
+from database import (
+    RedisClient,
+    AsyncRedisClient,
+    RedisHashClient,
+    AsyncRedisHashClient,
+    IgniteClient,
+    AsyncClientAdapter,
+    ShardedRedisClient,
+    AsyncShardedRedisClient,
+)
+from database.retention import RetentionPolicy, RetentionSweeper
+from database.sharded import shard_configs
 from utils import hosttotup, wait_for_ignite
-from models import User
+from models import User, Transaction, TransactionStatus
+from saga import requeue_orphans
 
 load_dotenv()
 
 
 if os.environ.get("DB_TYPE", "redis") == "redis":
-    db = RedisClient(
+    # Reads marked replica-eligible go to a Sentinel replica that applied every
+    # write of its master up to this many seconds ago; unset, every read goes to
+    # the master
+    replica_max_lag = os.environ.get("REDIS_REPLICA_MAX_LAG")
+    redis_config = dict(
         sentinel_hosts=os.environ.get(
             "SENTINEL_HOSTS", None
         ),  # e.g., "sentinel1:26379,sentinel2:26379,sentinel3:26379"
@@ -25,17 +41,102 @@ if os.environ.get("DB_TYPE", "redis") == "redis":
         port=int(os.environ.get("REDIS_PORT", None)),
         password=os.environ["REDIS_PASSWORD"],
         db=int(os.environ["REDIS_DB"]),
+        replica_max_lag=float(replica_max_lag) if replica_max_lag else None,
     )
+    # Comma separated Sentinel master names (or host:port without Sentinel)
+    # to spread the models over, instead of REDIS_MASTER_NAME alone
+    REDIS_SHARDS = os.environ.get("REDIS_SHARDS")
+    # "keys" stores one string key per attribute, "hash" one hash per model
+    REDIS_LAYOUT = os.environ.get("REDIS_LAYOUT", "keys")
+    if REDIS_LAYOUT == "hash" and REDIS_SHARDS:
+        raise ValueError("REDIS_LAYOUT=hash keeps every model on a single master")
+    if REDIS_LAYOUT == "hash":
+        db = RedisHashClient(**redis_config)
+        # Used by the Quart handlers and grpc.aio servicers
+        async_db = AsyncRedisHashClient(**redis_config)
+    elif REDIS_SHARDS:
+        shards = shard_configs(REDIS_SHARDS, redis_config)
+        db = ShardedRedisClient(
+            {name: RedisClient(**config) for name, config in shards.items()}
+        )
+        async_db = AsyncShardedRedisClient(
+            {name: AsyncRedisClient(**config) for name, config in shards.items()}
+        )
+    else:
+        db = RedisClient(**redis_config)
+        async_db = AsyncRedisClient(**redis_config)
 else:
     print(list(map(hosttotup, os.environ["IGNITE_HOSTS"].split(","))))
     wait_for_ignite()
     db = IgniteClient(
         list(map(hosttotup, os.environ["IGNITE_HOSTS"].split(","))), model_class=User
     )
+    async_db = AsyncClientAdapter(db)
 
 PROFILING = os.environ.get("PROFILING", "false") == "true"
 
 STREAM_KEY = "transactions"
 CONSUMER_GROUP = "pula"
 NUM_STREAM_CONSUMERS = int(os.environ.get("NUM_STREAM_CONSUMERS", "1"))
+# Entries a stream consumer reads (and acks) per round trip, and how long it
+# blocks on an empty stream
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "100"))
+STREAM_BLOCK_MS = int(os.environ.get("STREAM_BLOCK_MS", "1000"))
+# Run the asyncio processor with up to STREAM_CONCURRENCY transactions in flight
+# per consumer, instead of one blocking callback at a time
+STREAM_ASYNC = os.environ.get("STREAM_ASYNC", "false") == "true"
+STREAM_CONCURRENCY = int(os.environ.get("STREAM_CONCURRENCY", "64"))
+# Entries left pending this long by a crashed replica are reclaimed by the others
+STREAM_CLAIM_IDLE_MS = int(os.environ.get("STREAM_CLAIM_IDLE_MS", "60000"))
+STREAM_METRICS_PORT = int(os.environ.get("STREAM_METRICS_PORT", "9100"))
+
+# "poll": each stream processor asks the peer for every tid through
+# VibeCheckTransactionStatus. "events": each side publishes its outcome to its
+# OUTCOME_STREAM_KEY and consumes the peer's, resolving once it holds both.
+# "coordinated": the order service sends its commit/abort decision through
+# ResolveTransaction, so reservations are not pushed to any stream.
+SAGA_MODE = os.environ.get("SAGA_MODE", "poll")
+RESERVE_STREAM_KEY = None if SAGA_MODE == "coordinated" else STREAM_KEY
+OUTCOME_STREAM_KEY = "outcomes" if SAGA_MODE == "events" else None
+if SAGA_MODE == "events" and os.environ.get("REDIS_SHARDS"):
+    raise ValueError("SAGA_MODE=events reads the peer's streams on a single master")
+if SAGA_MODE == "events":
+    peer_async_db = AsyncRedisClient(
+        **dict(
+            redis_config,
+            master_name=os.environ["PEER_REDIS_MASTER_NAME"],
+            host=os.environ["PEER_REDIS_HOST"],
+        )
+    )
 STOCK_SERVICE_ADDR = os.environ["STOCK_SERVICE_ADDR"]
+ORDER_SERVICE_ADDR = os.environ["ORDER_SERVICE_ADDR"]
+# Committed checkouts are reported to the order service in batches of up to
+# ORDER_COMMIT_BATCH_SIZE, sent at most ORDER_COMMIT_DELAY_MS after the first
+ORDER_COMMIT_BATCH_SIZE = int(os.environ.get("ORDER_COMMIT_BATCH_SIZE", "100"))
+ORDER_COMMIT_DELAY_MS = float(os.environ.get("ORDER_COMMIT_DELAY_MS", "2"))
+
+# Resolved reservations are deleted right away. The STALE markers refusing late
+# reservations are deleted by the database TRANSACTION_TTL_S after they are
+# written. A sweep of the Redis masters every TRANSACTION_SWEEP_INTERVAL_S from
+# the stream processors, 0 to turn it off, finds reservations that were never
+# resolved once they are TRANSACTION_ORPHAN_AGE_S old: failed ones are deleted,
+# the others pushed to the transactions stream again to be resolved (kept in
+# SAGA_MODE=coordinated, where nothing here resolves them).
+TRANSACTION_RETENTION = RetentionPolicy(
+    Transaction,
+    "status",
+    ttl_ms=int(float(os.environ.get("TRANSACTION_TTL_S", "3600")) * 1000),
+    orphan_age_s=float(os.environ.get("TRANSACTION_ORPHAN_AGE_S", "86400")),
+    final=(str(TransactionStatus.FAILURE), str(TransactionStatus.STALE)),
+    unresolved=None if SAGA_MODE == "coordinated" else requeue_orphans(db, STREAM_KEY),
+)
+TRANSACTION_TTL_MS = TRANSACTION_RETENTION.ttl_ms
+TRANSACTION_SWEEP_INTERVAL_S = float(
+    os.environ.get("TRANSACTION_SWEEP_INTERVAL_S", "300")
+)
+
+transaction_sweeper = None
+if os.environ.get("DB_TYPE", "redis") == "redis" and TRANSACTION_SWEEP_INTERVAL_S > 0:
+    transaction_sweeper = RetentionSweeper(
+        db, [TRANSACTION_RETENTION], TRANSACTION_SWEEP_INTERVAL_S
+    )
@@ -1,5 +1,4 @@
 import logging
-from models import User
 from prometheus_client.core import GaugeMetricFamily
 from prometheus_client.registry import Collector
 from config import db
@@ -18,34 +17,12 @@ class PaymentCollector(Collector):
 
 
     def get_total_credit(self):
+        # Kept up to date by every write to a credit counter, see AGGREGATED_ATTRIBUTES
         try:
-            user_keys = db.keys("model:*:credit")
-
-            if not user_keys:
-                return 0 
-
-            logger.info(f"Number of users found: {len(user_keys)}")
-
-            user_ids = [key.split(":")[1] for key in user_keys]
-
-            credit_values = db.m_get_attr(user_ids, "credit", User)
-
-            total_credit = 0
-
-            for user_id, value in credit_values.items():
-                
-                if value is not None:
-                    try:
-                        credit_value_int = int(value)  
-                        total_credit += credit_value_int
-                    except ValueError:
-                        continue
-                # else:
-                #     logger.error(f"No credit value found for {user_id}, skipping.")
-
+            total_credit = db.get_aggregate("credit")
         except Exception as e:
-            logger.error(f"Error fetching all user keys: {e}")
+            logger.error(f"Error fetching the total credit: {e}")
             return 0
 
         logger.info(f"Total credit across all users: {total_credit}")
-        return total_credit
\ No newline at end of file
+        return total_credit
@@ -2,8 +2,15 @@ import logging
 from concurrent import futures
 import grpc
 import grpc.aio
-from config import STREAM_KEY, db
+from config import (
+    RESERVE_STREAM_KEY,
+    OUTCOME_STREAM_KEY,
+    TRANSACTION_TTL_MS,
+    async_db as db,
+)
 from models import User, Transaction, TransactionStatus
+from database import ReserveResult
+from saga import resolution, resolve_decision
 from proto import payment_pb2, payment_pb2_grpc, common_pb2
 import asyncio
 import sys
@@ -20,19 +27,31 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 root.addHandler(handler)
 
-stream_producer = db.get_stream_producer(STREAM_KEY)
+
+def payment_response(result: ReserveResult, user_id: str):
+    if result == ReserveResult.STALE:
+        logging.error("Payment failed: transaction is stale")
+        return payment_pb2.PaymentResponse(success=False, error="Transaction is stale")
+
+    if result == ReserveResult.INSUFFICIENT:
+        logging.error("Payment failed for user %s: insufficient credit", user_id)
+        return payment_pb2.PaymentResponse(success=False, error="Insufficient funds")
+
+    return payment_pb2.PaymentResponse(success=True)
 
 
 class PaymentServiceServicer(payment_pb2_grpc.PaymentServiceServicer):
     async def AddFunds(self, request, context):
-        user_model = db.get(request.user_id, User)
+        user_model = await db.get(request.user_id, User)
         if user_model is None:
             # Instead of aborting, return an error response.
             return common_pb2.OperationResponse(
                 success=False, error=f"User: {request.user_id} not found!"
             )
 
-        user_model.credit = db.increment(request.user_id, "credit", request.amount)
+        user_model.credit = await db.increment(
+            request.user_id, "credit", request.amount
+        )
         logging.info(
             "Added funds: %s to user %s; new credit: %s",
             request.amount,
@@ -42,37 +61,48 @@ class PaymentServiceServicer(payment_pb2_grpc.PaymentServiceServicer):
         return common_pb2.OperationResponse(success=True)
 
     async def ProcessPayment(self, request, context):
-        status = db.get_attr(request.tid, "status", Transaction)
-
-        if status == TransactionStatus.STALE:
-            logging.error("Payment failed: transaction is stale")
-            return payment_pb2.PaymentResponse(
-                success=False, error="Transaction is stale"
-            )
-
-        user_id = request.user_id
-
         transaction = Transaction(
             request.tid,
             TransactionStatus.PENDING,
             {request.user_id: request.amount},
         )
-        db.save(transaction)
-        stream_producer.push(tid=request.tid)
-
-        if not db.lte_decrement(user_id, "credit", request.amount, request.tid):
-            logging.error(
-                "Payment failed for user %s: insufficient credit",
-                request.user_id,
-            )
-            return payment_pb2.PaymentResponse(
-                success=False, error="Insufficient funds"
+        # Stale check, transaction record, stream push and charge in a single
+        # round trip
+        result = await db.reserve(
+            transaction,
+            transaction.details,
+            "credit",
+            RESERVE_STREAM_KEY,
+            OUTCOME_STREAM_KEY,
+        )
+        return payment_response(result, request.user_id)
+
+    async def ProcessPaymentBatch(self, request, context):
+        transactions = [
+            Transaction(
+                payment.tid,
+                TransactionStatus.PENDING,
+                {payment.user_id: payment.amount},
             )
-
-        return payment_pb2.PaymentResponse(success=True)
+            for payment in request.payments
+        ]
+        # Every payment charged atomically, all in one pipelined round trip
+        results = await db.reserve_all(
+            [(transaction, transaction.details) for transaction in transactions],
+            "credit",
+            RESERVE_STREAM_KEY,
+            OUTCOME_STREAM_KEY,
+        )
+        return payment_pb2.PaymentBatchResponse(
+            results=[
+                payment_response(result, payment.user_id)
+                for result, payment in zip(results, request.payments)
+            ]
+        )
 
     async def FindUser(self, request, context):
-        user_model = db.get(request.user_id, User)
+        replica = await db.replica()
+        user_model = await replica.get(request.user_id, User)
         if user_model is None:
             await context.abort(
                 grpc.StatusCode.NOT_FOUND, f"User: {request.user_id} not found!"
@@ -88,7 +118,7 @@ class PaymentServiceServicer(payment_pb2_grpc.PaymentServiceServicer):
                 f"Transaction: {request.tid} not found, retry!",
             )
 
-            transaction = db.get(request.tid, Transaction)
+            transaction = await db.get(request.tid, Transaction)
             count_retries += 1
             await asyncio.sleep(0.5)
 
@@ -97,13 +127,14 @@ class PaymentServiceServicer(payment_pb2_grpc.PaymentServiceServicer):
                 request.tid,
                 TransactionStatus.STALE,
             )
-            db.save(stale_transaction)
+            await db.save(stale_transaction)
+            await db.expire(request.tid, TRANSACTION_TTL_MS, Transaction)
             logging.warning(
                 "Transaction %s marked stale, count: %s", request.tid, count_retries
             )
             return stale_transaction.to_proto()
 
-        unlocked = db.compare_and_set(request.tid, "locked", False, True)
+        unlocked = await db.compare_and_set(request.tid, "locked", False, True)
 
         if not unlocked:
             logging.error("Payment failed: transaction is locked")
@@ -112,21 +143,17 @@ class PaymentServiceServicer(payment_pb2_grpc.PaymentServiceServicer):
                 f"Transaction: {request.tid} is locked!",
             )
 
-        db.delete(transaction)
-
         try:
+            changes, attribute = resolution(transaction, "credit", request.success)
+            await db.resolve(transaction, changes, attribute)
             if not request.success and transaction.status == TransactionStatus.SUCCESS:
                 logging.info(
-                    "Transaction %s rolling back due to VibeCheck", request.tid
+                    "Transaction %s rolled back due to VibeCheck", request.tid
                 )
-                for k, v in transaction.details.items():
-                    db.increment(k, "credit", v)
             elif transaction.status == TransactionStatus.SUCCESS:
                 logging.info(
-                    "Transaction %s committing thanks to VibeCheck", request.tid
+                    "Transaction %s committed thanks to VibeCheck", request.tid
                 )
-                for k, v in transaction.details.items():
-                    db.decrement(k, "committed_credit", v)
         except Exception as e:
             logging.exception("Error in reverting payment")
             await context.abort(grpc.StatusCode.INTERNAL, str(e))
@@ -134,6 +161,21 @@ class PaymentServiceServicer(payment_pb2_grpc.PaymentServiceServicer):
 
         return transaction.to_proto()
 
+    async def ResolveTransaction(self, request, context):
+        try:
+            resolved = await resolve_decision(
+                db, request.tid, request.success, "credit", TRANSACTION_TTL_MS
+            )
+        except Exception as e:
+            logging.exception("Error in ResolveTransaction")
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+        if not resolved:
+            return common_pb2.OperationResponse(
+                success=False, error=f"Transaction: {request.tid} is locked!"
+            )
+        return common_pb2.OperationResponse(success=True)
+
 
 async def serve():
     print("Starting gRPC Payment Service")
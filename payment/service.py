@@ -69,7 +69,7 @@ def batch_init_users(n: int, starting_money: int):
 
 @payment_blueprint.get("/find_user/<user_id>")
 def find_user(user_id: str):
-    user_entry = get_user_from_db(user_id)
+    user_entry = get_user_from_db(user_id, db=db.replica())
     return jsonify({"user_id": user_entry.id, "credit": user_entry.committed_credit})
 
 
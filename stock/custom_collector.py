@@ -1,5 +1,4 @@
 import logging
-from models import Stock
 from prometheus_client.core import GaugeMetricFamily
 from prometheus_client.registry import Collector
 from config import db
@@ -17,33 +16,11 @@ class AvailableStockCollector(Collector):
 
 
     def get_remaining_stock(self):
+        # Kept up to date by every write to a stock counter, see AGGREGATED_ATTRIBUTES
         try:
-            stock_keys = db.keys("model:*:stock")
-
-            if not stock_keys:
-                return 0 
-
-            logger.info(f"Number of individual stock categories: {len(stock_keys)}")
-
-            stock_ids = [key.split(":")[1] for key in stock_keys]
-
-            stock_quantities = db.m_get_attr(stock_ids, "stock", Stock)
-
-            total_stock = 0
-
-            for stock_id, value in stock_quantities.items():
-                
-                if value is not None:
-                    try:
-                        item_stock = int(value)  
-                        total_stock += item_stock
-                    except ValueError:
-                        continue
-                # else:
-                #     logger.error(f"No credit value found for {user_id}, skipping.")
-
+            total_stock = db.get_aggregate("stock")
         except Exception as e:
-            logger.error(f"Error fetching all stock keys: {e}")
+            logger.error(f"Error fetching the total stock: {e}")
             return 0
 
         logger.info(f"Total stock remaining: {total_stock}")
@@ -4,8 +4,15 @@ import grpc
 import grpc.aio
 import asyncio
 
-from config import STREAM_KEY, db
+from config import (
+    RESERVE_STREAM_KEY,
+    OUTCOME_STREAM_KEY,
+    TRANSACTION_TTL_MS,
+    async_db as db,
+)
 from models import Stock, Transaction, TransactionStatus
+from database import ReserveResult
+from saga import resolution, resolve_decision
 from proto import stock_pb2, stock_pb2_grpc, common_pb2
 
 import sys
@@ -22,12 +29,35 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 root.addHandler(handler)
 
-stream_producer = db.get_stream_producer(STREAM_KEY)
+
+def bulk_order_response(result: ReserveResult):
+    if result == ReserveResult.STALE:
+        logging.error("Bulk order failed: transaction is stale")
+        return stock_pb2.BulkStockAdjustmentResponse(
+            status=common_pb2.OperationResponse(
+                success=False, error="Transaction is stale!"
+            ),
+            total_cost=-1,
+        )
+
+    if result == ReserveResult.INSUFFICIENT:
+        logging.error("Insufficient stock for items")
+        return stock_pb2.BulkStockAdjustmentResponse(
+            status=common_pb2.OperationResponse(
+                success=False, error="Insufficient stock for some items"
+            ),
+            total_cost=-1,
+        )
+
+    return stock_pb2.BulkStockAdjustmentResponse(
+        status=common_pb2.OperationResponse(success=True), total_cost=0
+    )
 
 
 class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
     async def FindItem(self, request, context):
-        stock_model = db.get(request.item_id, Stock)
+        replica = await db.replica()
+        stock_model = await replica.get(request.item_id, Stock)
         if stock_model is None:
             await context.abort(
                 grpc.StatusCode.NOT_FOUND, f"Item: {request.item_id} not found!"
@@ -36,7 +66,7 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
 
     async def AddStock(self, request, context):
         try:
-            stock_model = db.get(request.item_id, Stock)
+            stock_model = await db.get(request.item_id, Stock)
             if stock_model is None:
                 return stock_pb2.StockAdjustmentResponse(
                     status=common_pb2.OperationResponse(
@@ -44,7 +74,7 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
                     ),
                     price=-1,
                 )
-            db.increment(request.item_id, "stock", request.quantity)
+            await db.increment(request.item_id, "stock", request.quantity)
             logging.info(
                 "Added %s to item %s; new stock: %s",
                 request.quantity,
@@ -63,10 +93,21 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
         try:
             item_id = request.item_id
 
-            status = db.get_attr(request.tid, "status", Transaction)
+            transaction = Transaction(
+                request.tid,
+                TransactionStatus.PENDING,
+                {item_id: request.quantity},
+            )
+            result = await db.reserve(
+                transaction,
+                transaction.details,
+                "stock",
+                RESERVE_STREAM_KEY,
+                OUTCOME_STREAM_KEY,
+            )
 
-            if status == TransactionStatus.STALE:
-                logging.error("Payment failed: transaction is stale")
+            if result == ReserveResult.STALE:
+                logging.error("Stock removal failed: transaction is stale")
                 return stock_pb2.StockAdjustmentResponse(
                     status=common_pb2.OperationResponse(
                         success=False, error="Transaction is stale!"
@@ -74,15 +115,7 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
                     price=-1,
                 )
 
-            transaction = Transaction(
-                request.tid,
-                TransactionStatus.PENDING,
-                {item_id: request.quantity},
-            )
-            db.save(transaction)
-            stream_producer.push(tid=request.tid)
-
-            if not db.lte_decrement(item_id, "stock", request.quantity, request.tid):
+            if result == ReserveResult.INSUFFICIENT:
                 logging.error("Insufficient stock for item: %s", request.item_id)
                 return stock_pb2.StockAdjustmentResponse(
                     status=common_pb2.OperationResponse(
@@ -97,7 +130,7 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
                 request.item_id,
             )
 
-            price = db.get_attr(item_id, "price", Stock)
+            price = await db.get_attr(item_id, "price", Stock)
 
             return stock_pb2.StockAdjustmentResponse(
                 status=common_pb2.OperationResponse(success=True),
@@ -109,43 +142,47 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
 
     async def BulkOrder(self, request, context):
         try:
-            items = request.items
-
-            status = db.get_attr(request.tid, "status", Transaction)
-
-            if status == TransactionStatus.STALE:
-                logging.error("Payment failed: transaction is stale")
-                return stock_pb2.StockAdjustmentResponse(
-                    status=common_pb2.OperationResponse(
-                        success=False, error="Transaction is stale!"
-                    ),
-                    price=-1,
-                )
-
             transaction = Transaction(
                 request.tid,
                 TransactionStatus.PENDING,
-                {item.id: item.stock for item in items},
+                {item.id: item.stock for item in request.items},
+            )
+            # Stale check, transaction record, stream push and decrement in
+            # a single round trip
+            result = await db.reserve(
+                transaction,
+                transaction.details,
+                "stock",
+                RESERVE_STREAM_KEY,
+                OUTCOME_STREAM_KEY,
             )
-            db.save(transaction)
-            stream_producer.push(tid=request.tid)
+            return bulk_order_response(result)
+        except Exception as e:
+            logging.exception("Error in BulkOrder")
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
 
-            if not db.m_gte_decrement(
-                {item.id: item.stock for item in items}, "stock", request.tid
-            ):
-                logging.error("Insufficient stock for items")
-                return stock_pb2.BulkStockAdjustmentResponse(
-                    status=common_pb2.OperationResponse(
-                        success=False, error="Insufficient stock for some items"
-                    ),
-                    total_cost=-1,
+    async def BulkOrderBatch(self, request, context):
+        try:
+            transactions = [
+                Transaction(
+                    order.tid,
+                    TransactionStatus.PENDING,
+                    {item.id: item.stock for item in order.items},
                 )
-
-            return stock_pb2.BulkStockAdjustmentResponse(
-                status=common_pb2.OperationResponse(success=True), total_cost=0
+                for order in request.orders
+            ]
+            # Every order reserved atomically, all in one pipelined round trip
+            results = await db.reserve_all(
+                [(transaction, transaction.details) for transaction in transactions],
+                "stock",
+                RESERVE_STREAM_KEY,
+                OUTCOME_STREAM_KEY,
+            )
+            return stock_pb2.BulkOrderBatchResponse(
+                results=[bulk_order_response(result) for result in results]
             )
         except Exception as e:
-            logging.exception("Error in RemoveStock")
+            logging.exception("Error in BulkOrderBatch")
             await context.abort(grpc.StatusCode.INTERNAL, str(e))
 
     async def BulkRefund(self, request, context):
@@ -153,7 +190,7 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
             items = request.items
 
             for item in items:
-                stock_model = db.get(item.id, Stock)
+                stock_model = await db.get(item.id, Stock)
                 if stock_model is None:
                     return stock_pb2.BulkStockAdjustmentResponse(
                         status=common_pb2.OperationResponse(
@@ -162,7 +199,7 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
                         total_cost=-1,
                     )
 
-                stock_model.stock = db.increment(item.id, "stock", item.stock)
+                stock_model.stock = await db.increment(item.id, "stock", item.stock)
 
                 logging.info(
                     "Added %s to item %s; new stock: %s",
@@ -186,7 +223,7 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
                 f"Transaction: {request.tid} not found, retry!",
             )
 
-            transaction = db.get(request.tid, Transaction)
+            transaction = await db.get(request.tid, Transaction)
             count_retries += 1
             await asyncio.sleep(0.1)
 
@@ -195,13 +232,14 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
                 request.tid,
                 TransactionStatus.STALE,
             )
-            db.save(stale_transaction)
+            await db.save(stale_transaction)
+            await db.expire(request.tid, TRANSACTION_TTL_MS, Transaction)
             logging.warning(
                 "Transaction %s marked stale, count: %s", request.tid, count_retries
             )
             return stale_transaction.to_proto()
 
-        unlocked = db.compare_and_set(request.tid, "locked", False, True)
+        unlocked = await db.compare_and_set(request.tid, "locked", False, True)
 
         if not unlocked:
             logging.error("VibeCheck %s failed, transaction is locked", request.tid)
@@ -210,21 +248,18 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
                 f"Transaction: {request.tid} is locked!",
             )
 
-        db.delete(transaction)
         # Revert here
         try:
+            changes, attribute = resolution(transaction, "stock", request.success)
+            await db.resolve(transaction, changes, attribute)
             if not request.success and transaction.status == TransactionStatus.SUCCESS:
                 logging.info(
-                    "Transaction %s rolling back due to VibeCheck", request.tid
+                    "Transaction %s rolled back due to VibeCheck", request.tid
                 )
-                for k, v in transaction.details.items():
-                    db.increment(k, "stock", v)
             elif transaction.status == TransactionStatus.SUCCESS:
                 logging.info(
-                    "Transaction %s committing thanks to VibeCheck", request.tid
+                    "Transaction %s committed thanks to VibeCheck", request.tid
                 )
-                for k, v in transaction.details.items():
-                    db.decrement(k, "committed_stock", v)
         except Exception as e:
             logging.exception("Error in reverting stock")
             await context.abort(grpc.StatusCode.INTERNAL, str(e))
@@ -233,6 +268,21 @@ class StockServiceServicer(stock_pb2_grpc.StockServiceServicer):
         # Successful
         return transaction.to_proto()
 
+    async def ResolveTransaction(self, request, context):
+        try:
+            resolved = await resolve_decision(
+                db, request.tid, request.success, "stock", TRANSACTION_TTL_MS
+            )
+        except Exception as e:
+            logging.exception("Error in ResolveTransaction")
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+        if not resolved:
+            return common_pb2.OperationResponse(
+                success=False, error=f"Transaction: {request.tid} is locked!"
+            )
+        return common_pb2.OperationResponse(success=True)
+
 
 async def serve():
     print("Starting gRPC Stock Service")
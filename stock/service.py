@@ -1,6 +1,6 @@
 import uuid
 from flask import Blueprint, jsonify, abort, Response, current_app
-from config import db, STREAM_KEY
+from config import db, STREAM_KEY, ITEM_PRICES_CHANNEL
 from models import Stock
 from database import TransactionConfig
 
@@ -41,6 +41,7 @@ def create_item(price: int):
 
     try:
         db.save(stock_item)
+        db.publish(ITEM_PRICES_CHANNEL, key)
         current_app.logger.info("Item created: %s", key)
     except Exception as e:
         current_app.logger.exception("Failed to save new item: %s", key)
@@ -65,6 +66,7 @@ def batch_init_items(n: int, starting_stock: int, item_price: int):
             items.append(stock_item)
 
         db.save_all(items)
+        db.publish(ITEM_PRICES_CHANNEL, "*")
         current_app.logger.info("Batch init for stock successful with %s items", n)
     except Exception as e:
         current_app.logger.exception("Batch initialization failed for stock")
@@ -74,7 +76,7 @@ def batch_init_items(n: int, starting_stock: int, item_price: int):
 
 @stock_blueprint.get("/find/<id>")
 def find_item(id: str):
-    item_entry = get_item_from_db(id)
+    item_entry = get_item_from_db(id, db=db.replica())
     return jsonify({"stock": item_entry.committed_stock, "price": item_entry.price})
 
 
@@ -99,6 +101,24 @@ def add_stock(id: str, amount: int):
     return Response(f"Item: {id} stock updated to: {item_entry.stock}", status=200)
 
 
+@stock_blueprint.post("/shard/<id>/<int:shards>")
+def shard_stock(id: str, shards: int):
+    """Spread the stock of a hot item over `shards` sub-counters on as many masters"""
+    try:
+        stock = db.shard_counter(id, "stock", shards)
+    except (NotImplementedError, ValueError) as e:
+        abort(400, str(e))
+    except Exception as e:
+        current_app.logger.exception("Failed to shard stock for item: %s", id)
+        abort(400, DB_ERROR_STR)
+
+    if stock is None:
+        current_app.logger.error("Item not found: %s", id)
+        abort(400, f"Item: {id} not found!")
+    current_app.logger.info("Item %s stock of %s split in %s", id, stock, shards)
+    return jsonify({"stock": stock, "shards": shards})
+
+
 @stock_blueprint.post("/subtract/<id>/<int:amount>")
 def remove_stock(id: str, amount: int):
     with db.transaction(
@@ -1,20 +1,47 @@
-from database.stream import StreamProcessor
+import asyncio
+
+from database.stream import (
+    AsyncStreamProcessor,
+    StreamProcessor,
+    consumer_identity,
+)
+from channels import ChannelPool
+from checkouts import AsyncCheckoutCommitter, CheckoutCommitter
+from saga import (
+    LocalOutcomeProcessor,
+    OutcomeResolver,
+    PeerOutcomeProcessor,
+    resolution,
+)
 from config import (
     db,
+    async_db,
     STREAM_KEY,
     CONSUMER_GROUP,
     NUM_STREAM_CONSUMERS,
+    STREAM_BATCH_SIZE,
+    STREAM_BLOCK_MS,
+    STREAM_ASYNC,
+    STREAM_CONCURRENCY,
+    STREAM_CLAIM_IDLE_MS,
+    STREAM_METRICS_PORT,
+    ORDER_SERVICE_ADDR,
+    ORDER_COMMIT_BATCH_SIZE,
+    ORDER_COMMIT_DELAY_MS,
+    SAGA_MODE,
+    OUTCOME_STREAM_KEY,
+    TRANSACTION_TTL_MS,
+    transaction_sweeper,
     PAYMENT_SERVICE_ADDR,
 )
 import logging
+from prometheus_client import start_http_server
 import json
 
 import grpc
-from utils import randsleep
 from proto.payment_pb2_grpc import PaymentServiceStub
 from models import Transaction, TransactionStatus
 
-import requests
 import sys
 
 root = logging.getLogger()
@@ -26,22 +53,12 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 root.addHandler(handler)
 
-ORDER_URL = "http://gateway:8000/orders"
-
-
-def commit_order(tid: str):
-    url = f"{ORDER_URL}/commit_checkout/{tid}"
-    try:
-        response = requests.post(url)
-        response.raise_for_status()
-        logging.info(f"Sent request to commit order for transaction {tid}, url {url}.")
-        return response.text
-    except Exception as e:
-        logging.info(f"Failed to commit order for transaction {tid}: {e}.")
-
 
 class VibeCheckerTransactionStatus(StreamProcessor):
     stream_key = STREAM_KEY
+    batch_size = STREAM_BATCH_SIZE
+    block_ms = STREAM_BLOCK_MS
+    claim_idle_ms = STREAM_CLAIM_IDLE_MS
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -50,7 +67,9 @@ class VibeCheckerTransactionStatus(StreamProcessor):
             options=(("grpc.lb_policy_name", "round_robin"),),
         )
         self._payment_client = PaymentServiceStub(self._payment_channel)
-        self._stream_producer = db.get_stream_producer(STREAM_KEY)
+        self._committer = CheckoutCommitter(
+            ORDER_SERVICE_ADDR, ORDER_COMMIT_BATCH_SIZE, ORDER_COMMIT_DELAY_MS / 1000
+        )
 
     def callback(self, id, tid=""):
         transaction = db.get(tid, Transaction)
@@ -61,9 +80,8 @@ class VibeCheckerTransactionStatus(StreamProcessor):
 
         unlocked = db.compare_and_set(tid, "locked", False, True)
         if not unlocked:
-            logging.info("Transaction %s is locked, pushing back", tid)
-            randsleep()
-            self._stream_producer.push(tid=tid)
+            logging.info("Transaction %s is locked, retrying later", tid)
+            self.retry_queue.schedule(tid=tid)
             return
 
         if transaction.status == TransactionStatus.PENDING:
@@ -75,9 +93,7 @@ class VibeCheckerTransactionStatus(StreamProcessor):
             #
             db.increment(tid, "pending_count", 1)
             db.set_attr(tid, "locked", False, Transaction)
-            randsleep()
-            self._stream_producer.push(tid=tid)
-
+            self.retry_queue.schedule(tid=tid)
             return
 
         try:
@@ -90,33 +106,149 @@ class VibeCheckerTransactionStatus(StreamProcessor):
             else:
                 logging.exception("Error in VibeCheckTransactionStatus")
             db.set_attr(tid, "locked", False, Transaction)
-            randsleep()
-            self._stream_producer.push(tid=tid)
+            self.retry_queue.schedule(tid=tid)
             return
         except Exception:
             logging.exception("Error in VibeCheckTransactionStatus")
             db.set_attr(tid, "locked", False, Transaction)
-            randsleep()
-            self._stream_producer.push(tid=tid)
+            self.retry_queue.schedule(tid=tid)
+            return
+
+        t_payment = Transaction.from_proto(response)
+        commit = t_payment.status == TransactionStatus.SUCCESS
+        changes, attribute = resolution(transaction, "stock", commit)
+        if not db.resolve(transaction, changes, attribute):
+            logging.info("Transaction %s was resolved elsewhere", tid)
+        elif transaction.status == TransactionStatus.SUCCESS and commit:
+            logging.info("Transaction %s committed", tid)
+            self._committer.commit(transaction.id)
+        elif transaction.status == TransactionStatus.SUCCESS:
+            # Remote failed and we were successful, so we rolled back
+            logging.info("Rolled %s back!", tid)
+
+
+class AsyncVibeCheckerTransactionStatus(AsyncStreamProcessor):
+    """VibeCheckerTransactionStatus on async_db and a grpc.aio channel"""
+
+    stream_key = STREAM_KEY
+    batch_size = STREAM_BATCH_SIZE
+    block_ms = STREAM_BLOCK_MS
+    claim_idle_ms = STREAM_CLAIM_IDLE_MS
+    concurrency = STREAM_CONCURRENCY
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._payment_channels = ChannelPool(
+            PAYMENT_SERVICE_ADDR, PaymentServiceStub, size=1
+        )
+        self._committer = AsyncCheckoutCommitter(
+            ORDER_SERVICE_ADDR, ORDER_COMMIT_BATCH_SIZE, ORDER_COMMIT_DELAY_MS / 1000
+        )
+
+    async def _retry(self, tid):
+        await async_db.set_attr(tid, "locked", False, Transaction)
+        await self.retry_queue.schedule(tid=tid)
+
+    async def callback(self, id, tid=""):
+        transaction = await async_db.get(tid, Transaction)
+
+        if transaction is None or transaction.status == TransactionStatus.STALE:
+            logging.info("Transaction %s is None | STALE", tid)
+            return
+
+        unlocked = await async_db.compare_and_set(tid, "locked", False, True)
+        if not unlocked:
+            logging.info("Transaction %s is locked, retrying later", tid)
+            await self.retry_queue.schedule(tid=tid)
+            return
+
+        if transaction.status == TransactionStatus.PENDING:
+            logging.info("Transaction %s is still pending", tid)
+            await async_db.increment(tid, "pending_count", 1)
+            await self._retry(tid)
+            return
+
+        try:
+            async with self._payment_channels.lease() as payment_client:
+                response = await payment_client.VibeCheckTransactionStatus(
+                    transaction.to_proto()
+                )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.FAILED_PRECONDITION:
+                logging.warning("Transaction %s locked remotely", tid)
+            else:
+                logging.exception("Error in VibeCheckTransactionStatus")
+            await self._retry(tid)
+            return
+        except Exception:
+            logging.exception("Error in VibeCheckTransactionStatus")
+            await self._retry(tid)
             return
 
         t_payment = Transaction.from_proto(response)
-        db.delete(transaction)
-
-        if (
-            transaction.status == TransactionStatus.SUCCESS
-            and t_payment.status == TransactionStatus.FAILURE
-        ):  # If remote is failed, and we are successful, we need to roll back
-            logging.info("Rolling %s back!", tid)
-            for k, v in transaction.details.items():
-                db.increment(k, "stock", v)
+        commit = t_payment.status == TransactionStatus.SUCCESS
+        changes, attribute = resolution(transaction, "stock", commit)
+        if not await async_db.resolve(transaction, changes, attribute):
+            logging.info("Transaction %s was resolved elsewhere", tid)
+        elif transaction.status == TransactionStatus.SUCCESS and commit:
+            logging.info("Transaction %s committed", tid)
+            await self._committer.commit(transaction.id)
         elif transaction.status == TransactionStatus.SUCCESS:
-            logging.info("Transaction %s committing", tid)
-            for k, v in transaction.details.items():
-                db.decrement(k, "committed_stock", v)
-            commit_order(transaction.id)
+            # Remote failed and we were successful, so we rolled back
+            logging.info("Rolled %s back!", tid)
+
+
+class LocalOutcomes(LocalOutcomeProcessor):
+    stream_key = STREAM_KEY
+    batch_size = STREAM_BATCH_SIZE
+    block_ms = STREAM_BLOCK_MS
+    concurrency = STREAM_CONCURRENCY
+    claim_idle_ms = STREAM_CLAIM_IDLE_MS
+
+
+class PeerOutcomes(PeerOutcomeProcessor):
+    stream_key = "outcomes"
+    batch_size = STREAM_BATCH_SIZE
+    block_ms = STREAM_BLOCK_MS
+    concurrency = STREAM_CONCURRENCY
+    claim_idle_ms = STREAM_CLAIM_IDLE_MS
+
+
+async def resolve_outcomes(consumer_name: str):
+    from config import peer_async_db
+
+    # Only one side reports the commit to the order service
+    committer = AsyncCheckoutCommitter(
+        ORDER_SERVICE_ADDR, ORDER_COMMIT_BATCH_SIZE, ORDER_COMMIT_DELAY_MS / 1000
+    )
+    resolver = OutcomeResolver(
+        async_db,
+        OUTCOME_STREAM_KEY,
+        "stock",
+        on_commit=committer.commit,
+        transaction_ttl_ms=TRANSACTION_TTL_MS,
+    )
+    local = LocalOutcomes(async_db.redis, resolver)
+    peer = PeerOutcomes(peer_async_db.redis, async_db.redis, resolver)
+    await asyncio.gather(
+        local.start_worker(CONSUMER_GROUP, consumer_name),
+        peer.start_worker(CONSUMER_GROUP, consumer_name),
+    )
 
 
 if __name__ == "__main__":
-    consumer = db.initialize_stream_processor(VibeCheckerTransactionStatus)
-    consumer.start_worker(CONSUMER_GROUP, f"vibe_checker_{STREAM_KEY}_consumer")
+    start_http_server(STREAM_METRICS_PORT)
+    if transaction_sweeper is not None:
+        transaction_sweeper.start()
+    # Every replica needs its own name, or they would share one pending list
+    consumer_name = consumer_identity(f"vibe_checker_{STREAM_KEY}_consumer")
+    if SAGA_MODE == "events":
+        asyncio.run(resolve_outcomes(consumer_name))
+    elif STREAM_ASYNC:
+        consumer = async_db.initialize_stream_processor(
+            AsyncVibeCheckerTransactionStatus
+        )
+        asyncio.run(consumer.start_worker(CONSUMER_GROUP, consumer_name))
+    else:
+        consumer = db.initialize_stream_processor(VibeCheckerTransactionStatus)
+        consumer.start_worker(CONSUMER_GROUP, consumer_name)
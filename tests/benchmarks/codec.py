@@ -0,0 +1,92 @@
+"""
+Per-call CPU cost of (de)serializing models: the reflection based path the
+Redis clients used before (dataclasses.fields/asdict/__annotations__ and the
+_deserialize_value if-chain on every call) against the precompiled codecs
+from database.codec. No Redis needed.
+
+    python tests/benchmarks/codec.py
+"""
+
+import os
+import sys
+import timeit
+from dataclasses import MISSING, asdict, fields
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "common"))
+
+from database import RedisClient  # noqa: E402
+from database.codec import codec_for  # noqa: E402
+from models import Order, Stock, Transaction, TransactionStatus, User  # noqa: E402
+
+client = RedisClient.__new__(RedisClient)
+
+SAMPLES = [
+    Order(id="o", paid=0, items=["1:1", "2:3"], user_id="u", total_cost=12),
+    Stock(id="s", stock=100, price=3, committed_stock=100),
+    User(id="u", credit=100, committed_credit=100),
+    Transaction(id="t", status=TransactionStatus.PENDING, details={"1": 2}),
+]
+
+
+def reflect_encode(model):
+    model_class = type(model)
+    return {
+        f"model:{model.id}:{attr}": client._serialize_value(
+            value, model_class.__annotations__[attr]
+        )
+        for attr, value in asdict(model).items()
+        if attr != "id"
+    }
+
+
+def reflect_decode(id, values, model_class):
+    attributes = dict(zip([f.name for f in fields(model_class)][1:], values))
+    converted_data = {"id": id}
+    for field in fields(model_class):
+        if field.name == "id":
+            continue
+        value = attributes.get(field.name)
+        if value is None:
+            if field.default is not MISSING:
+                converted_data[field.name] = field.default
+            elif field.default_factory is not MISSING:
+                converted_data[field.name] = field.default_factory()
+            continue
+        converted_data[field.name] = client._deserialize_value(
+            value, model_class.__annotations__[field.name]
+        )
+    return model_class(**converted_data)
+
+
+def codec_encode(model):
+    codec = codec_for(type(model))
+    return dict(zip(client._get_model_keys(model.id, codec), codec.encode(model)))
+
+
+def codec_decode(id, values, model_class):
+    return codec_for(model_class).decode(id, values)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    print(f"{'model':12s} {'op':7s} {'reflection':>12s} {'codec':>12s} {'speedup':>8s}")
+    for model in SAMPLES:
+        model_class = type(model)
+        values = list(reflect_encode(model).values())
+        assert codec_decode(model.id, values, model_class) == model
+
+        for op, old, new in (
+            ("encode", lambda: reflect_encode(model), lambda: codec_encode(model)),
+            (
+                "decode",
+                lambda: reflect_decode(model.id, values, model_class),
+                lambda: codec_decode(model.id, values, model_class),
+            ),
+        ):
+            t_old = min(timeit.repeat(old, number=n, repeat=3)) / n * 1e6
+            t_new = min(timeit.repeat(new, number=n, repeat=3)) / n * 1e6
+            print(
+                f"{model_class.__name__:12s} {op:7s} {t_old:9.2f} us {t_new:9.2f} us"
+                f" {t_old / t_new:7.1f}x"
+            )
@@ -0,0 +1,139 @@
+"""
+Stock reservations on a Zipf-skewed item popularity, sharded over the Redis
+masters of --hosts (ShardedRedisClient), with every counter in one key
+against the hottest items' stock split over sub-counters on several masters
+(ShardedRedisClient.shard_counter). After each run the benchmark checks that
+no sub-counter went below zero, that exactly the reserved stock was taken
+and that no hold was left behind.
+
+Every host has to be its own redis-server for the numbers to mean anything:
+
+    for port in 6380 6381 6382 6383; do redis-server --port $port --daemonize yes; done
+    python tests/benchmarks/hot_items.py \
+        --hosts localhost:6380,localhost:6381,localhost:6382,localhost:6383
+
+The target databases are FLUSHED, point it at scratch dbs.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "common"))
+
+from database import AsyncRedisClient, ReserveResult  # noqa: E402
+from database.sharded import AsyncShardedRedisClient, shard_configs  # noqa: E402
+from models import Stock, Transaction, TransactionStatus  # noqa: E402
+
+STREAM_KEY = "transactions"
+
+
+def zipf_weights(n, s):
+    return [1 / rank**s for rank in range(1, n + 1)]
+
+
+def connect(args):
+    redis_config = dict(password=args.password, port=6379, db=args.db)
+    shards = shard_configs(args.hosts, redis_config)
+    return AsyncShardedRedisClient(
+        {name: AsyncRedisClient(**config) for name, config in shards.items()}
+    )
+
+
+async def reset(db, args, shards):
+    for shard in db.shards:
+        await shard.redis.flushdb()
+    await db.save_all(
+        [
+            Stock(id=str(i), stock=args.stock, committed_stock=args.stock, price=1)
+            for i in range(args.items)
+        ]
+    )
+    # Item 0 is the most popular under the Zipf weights
+    for i in range(args.hot if shards > 1 else 0):
+        await db.shard_counter(str(i), "stock", shards)
+
+
+async def check(db, args, shards, reserved):
+    totals = [await db.get_counter(str(i), "stock") for i in range(args.items)]
+    assert sum(totals) == args.items * args.stock - reserved, "stock leaked"
+
+    for i in range(args.hot if shards > 1 else 0):
+        for index, key in db._sub_counters(str(i), "stock", shards):
+            value = await db.shards[index].redis.get(key)
+            assert int(value or 0) >= 0, f"item {i} went below zero"
+    for shard in db.shards:
+        assert await shard.redis.zcard("holds") == 0, "holds left behind"
+
+
+async def run(db, args, shards):
+    await reset(db, args, shards)
+    weights = zipf_weights(args.items, args.skew)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    reserved = 0
+
+    async def one():
+        nonlocal reserved
+        items = set(random.choices(range(args.items), weights, k=args.per_checkout))
+        changes = {str(i): 1 for i in items}
+        transaction = Transaction(str(uuid.uuid4()), TransactionStatus.PENDING, changes)
+        async with semaphore:
+            t0 = time.perf_counter()
+            result = await db.reserve(transaction, changes, "stock", STREAM_KEY)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        if result == ReserveResult.OK:
+            reserved += len(changes)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - t0
+
+    await check(db, args, shards, reserved)
+    latencies.sort()
+    print(
+        f"{shards:3d} shards p50 {latencies[len(latencies) // 2]:7.3f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)]:7.3f} ms"
+        f"  {args.requests / elapsed:9.0f} req/s  {reserved} units reserved"
+    )
+
+
+async def main(args):
+    db = connect(args)
+
+    print(
+        f"{args.requests} checkouts of {args.per_checkout} items, Zipf s={args.skew}"
+        f" over {args.items} items on {len(db.shards)} masters,"
+        f" top {args.hot} sharded, concurrency {args.concurrency}"
+    )
+    for shards in args.shards:
+        await run(db, args, shards)
+
+    for shard in db.shards:
+        await shard.redis.flushdb()
+    await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", default="localhost:6379")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--skew", type=float, default=1.2)
+    parser.add_argument("--hot", type=int, default=10)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--per-checkout", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    # Each sub-counter of an item lives on its own master
+    hosts = len(args.hosts.split(","))
+    if max(args.shards) > hosts:
+        parser.error(f"--shards can be at most the {hosts} --hosts")
+    asyncio.run(main(args))
@@ -0,0 +1,96 @@
+"""
+Latency of the payment-rpc hot path under concurrency: the previous four
+round trip sequence (stale check, transaction MSET, XADD, lte_decrement)
+against the single fused reserve script.
+
+    docker compose -f docker-compose.dev.yml up -d
+    python tests/benchmarks/payment_path.py --host 172.172.69.10 --password redis
+
+The target database is FLUSHED, point it at a scratch db.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "common"))
+
+from database import AsyncRedisClient  # noqa: E402
+from models import Transaction, TransactionStatus, User  # noqa: E402
+
+STREAM_KEY = "transactions"
+
+
+async def old_path(db, stream, user_id, amount):
+    tid = str(uuid.uuid4())
+    status = await db.get_attr(tid, "status", Transaction)
+    if status == TransactionStatus.STALE:
+        return False
+
+    transaction = Transaction(tid, TransactionStatus.PENDING, {user_id: amount})
+    await db.save(transaction)
+    await stream.push(tid=tid)
+    return await db.lte_decrement(user_id, "credit", amount, tid)
+
+
+async def new_path(db, stream, user_id, amount):
+    transaction = Transaction(
+        str(uuid.uuid4()), TransactionStatus.PENDING, {user_id: amount}
+    )
+    return await db.reserve(transaction, transaction.details, "credit", STREAM_KEY)
+
+
+async def run(db, path, users, requests, concurrency):
+    stream = db.get_stream_producer(STREAM_KEY)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            t0 = time.perf_counter()
+            await path(db, stream, str(random.randrange(users)), 1)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    print(
+        f"{path.__name__:9s} p50 {latencies[len(latencies) // 2]:7.3f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)]:7.3f} ms"
+        f"  {requests / elapsed:9.0f} req/s"
+    )
+
+
+async def main(args):
+    db = AsyncRedisClient(
+        host=args.host, port=args.port, password=args.password, db=args.db
+    )
+    await db.redis.flushdb()
+    await db.save_all(
+        [User(id=str(i), credit=10**9, committed_credit=0) for i in range(args.users)]
+    )
+
+    print(f"{args.requests} payments, concurrency {args.concurrency}")
+    for path in (old_path, new_path):
+        await run(db, path, args.users, args.requests, args.concurrency)
+
+    await db.redis.flushdb()
+    await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
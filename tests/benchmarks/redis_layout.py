@@ -0,0 +1,97 @@
+"""
+Memory and latency comparison of the two RedisClient storage layouts.
+
+Loads N users (default 1M) with the per-attribute key layout (RedisClient)
+and with the hash-per-model layout (RedisHashClient) into a scratch database,
+then reports used memory, key count and get/lte_decrement latencies.
+
+    docker compose -f docker-compose.dev.yml up -d
+    python tests/benchmarks/redis_layout.py --host 172.172.69.10 --password redis
+
+The target database is FLUSHED before each run, point it at a scratch db.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "common"))
+
+from database import RedisClient, RedisHashClient  # noqa: E402
+from models import User  # noqa: E402
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run(client, records, chunk, samples):
+    client.redis.flushdb()
+    base_memory = client.redis.info("memory")["used_memory"]
+
+    t0 = time.perf_counter()
+    for start in range(0, records, chunk):
+        client.save_all(
+            [
+                User(id=str(i), credit=100, committed_credit=100)
+                for i in range(start, min(start + chunk, records))
+            ]
+        )
+    load_time = time.perf_counter() - t0
+
+    memory = client.redis.info("memory")["used_memory"] - base_memory
+    keys = client.redis.dbsize()
+
+    get = timed(lambda: client.get(str(random.randrange(records)), User), samples)
+    decrement = timed(
+        lambda: client.lte_decrement(
+            str(random.randrange(records)), "credit", 1, f"bench-{random.random()}"
+        ),
+        samples,
+    )
+
+    print(f"== {type(client).__name__}")
+    print(f"   load          {load_time:8.2f} s")
+    print(f"   keys          {keys:8d}")
+    print(
+        f"   memory        {memory / 2**20:8.2f} MiB"
+        f" ({memory / records:.1f} B/record)"
+    )
+    for name, lat in (("get", get), ("lte_decrement", decrement)):
+        print(
+            f"   {name:13s} p50 {percentile(lat, 50):.3f} ms"
+            f"  p99 {percentile(lat, 99):.3f} ms"
+        )
+
+    client.redis.flushdb()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--chunk", type=int, default=10_000)
+    parser.add_argument("--samples", type=int, default=10_000)
+    args = parser.parse_args()
+
+    for client_class in (RedisClient, RedisHashClient):
+        client = client_class(
+            host=args.host, port=args.port, password=args.password, db=args.db
+        )
+        run(client, args.records, args.chunk, args.samples)
+        client.close()
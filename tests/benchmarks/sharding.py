@@ -0,0 +1,133 @@
+"""
+Reservation throughput against the number of Redis masters the models are
+sharded over (ShardedRedisClient). For every shard count from 1 to the
+number of --hosts the items are spread over the first n hosts and reserved
+from several client processes, so the client is not the bottleneck, and the
+stock left afterwards is checked against what was reserved.
+
+Every host has to be its own redis-server for the numbers to mean anything:
+
+    for port in 6380 6381 6382 6383; do redis-server --port $port --daemonize yes; done
+    python tests/benchmarks/sharding.py \
+        --hosts localhost:6380,localhost:6381,localhost:6382,localhost:6383
+
+The target databases are FLUSHED, point it at scratch dbs.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "common"))
+
+from database import AsyncRedisClient, ReserveResult  # noqa: E402
+from database.sharded import AsyncShardedRedisClient, shard_configs  # noqa: E402
+from models import Stock, Transaction, TransactionStatus  # noqa: E402
+
+STREAM_KEY = "transactions"
+
+
+def connect(args, n):
+    redis_config = dict(password=args.password, port=6379, db=args.db)
+    shards = shard_configs(",".join(args.hosts.split(",")[:n]), redis_config)
+    return AsyncShardedRedisClient(
+        {name: AsyncRedisClient(**config) for name, config in shards.items()}
+    )
+
+
+async def reset(args, n):
+    db = connect(args, n)
+    for shard in db.shards:
+        await shard.redis.flushdb()
+    await db.save_all(
+        [
+            Stock(id=str(i), stock=args.stock, committed_stock=args.stock, price=1)
+            for i in range(args.items)
+        ]
+    )
+    await db.close()
+
+
+async def reserve(args, n, requests):
+    db = connect(args, n)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    reserved = 0
+
+    async def one():
+        nonlocal reserved
+        items = random.sample(range(args.items), args.per_checkout)
+        changes = {str(i): 1 for i in items}
+        transaction = Transaction(str(uuid.uuid4()), TransactionStatus.PENDING, changes)
+        async with semaphore:
+            t0 = time.perf_counter()
+            result = await db.reserve(transaction, changes, "stock", STREAM_KEY)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        if result == ReserveResult.OK:
+            reserved += len(changes)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - t0
+    await db.close()
+    return elapsed, latencies, reserved
+
+
+def worker(args, n, requests):
+    return asyncio.run(reserve(args, n, requests))
+
+
+async def check(args, n, reserved):
+    db = connect(args, n)
+    totals = [await db.get_attr(str(i), "stock", Stock) for i in range(args.items)]
+    assert sum(totals) == args.items * args.stock - reserved, "stock leaked"
+    for shard in db.shards:
+        assert await shard.redis.zcard("holds") == 0, "holds left behind"
+    await db.close()
+
+
+def run(args, n):
+    asyncio.run(reset(args, n))
+
+    requests = args.requests // args.processes
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.starmap(worker, [(args, n, requests)] * args.processes)
+
+    elapsed = max(e for e, _, _ in results)
+    latencies = sorted(latency for _, ls, _ in results for latency in ls)
+    reserved = sum(r for _, _, r in results)
+    asyncio.run(check(args, n, reserved))
+
+    print(
+        f"{n:3d} shards p50 {latencies[len(latencies) // 2]:7.3f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)]:7.3f} ms"
+        f"  {len(latencies) / elapsed:9.0f} req/s"
+    )
+
+
+def main(args):
+    print(
+        f"{args.requests} reservations of {args.per_checkout} items from"
+        f" {args.processes} processes, concurrency {args.concurrency} each"
+    )
+    for n in range(1, len(args.hosts.split(",")) + 1):
+        run(args, n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", default="localhost:6379")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--per-checkout", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=200)
+    main(parser.parse_args())
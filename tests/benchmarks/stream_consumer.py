@@ -0,0 +1,165 @@
+"""
+Throughput of the stock and payment stream processors' consumer loop: one
+entry per XREADGROUP with its own XACK and XDEL (batch 1, the old behaviour)
+against batched reads acknowledged with one pipelined XACK+XDEL, and the
+asyncio consumer with many callbacks in flight.
+
+The callback does the Redis work of the VibeCheck processors for a
+successful transaction (load, lock, delete, release committed amount); the
+peer RPC is replaced by a sleep of --peer-latency-ms.
+
+    docker compose -f docker-compose.dev.yml up -d
+    python tests/benchmarks/stream_consumer.py --host 172.172.69.10 --password redis
+
+The target database is FLUSHED, point it at a scratch db.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "common"))
+
+from database import AsyncRedisClient, RedisClient  # noqa: E402
+from database.stream import AsyncRedisStreamConsumer, RedisStreamConsumer  # noqa: E402
+from models import Stock, Transaction, TransactionStatus, User  # noqa: E402
+
+STREAM_KEY = "transactions"
+CONSUMER_GROUP = "pula"
+
+PROCESSORS = {
+    "stock": ("committed_stock", Stock(id="0", stock=0, price=1, committed_stock=0)),
+    "payment": ("committed_credit", User(id="0", credit=0, committed_credit=0)),
+}
+
+
+def make_callback(db, attribute, peer_latency):
+    def callback(id, tid=""):
+        transaction = db.get(tid, Transaction)
+        if transaction is None:
+            return
+        db.compare_and_set(tid, "locked", False, True)
+        time.sleep(peer_latency)
+        db.delete(transaction)
+        for k, v in transaction.details.items():
+            db.decrement(k, attribute, v)
+
+    return callback
+
+
+def make_async_callback(db, attribute, peer_latency):
+    async def callback(id, tid=""):
+        transaction = await db.get(tid, Transaction)
+        if transaction is None:
+            return
+        await db.compare_and_set(tid, "locked", False, True)
+        await asyncio.sleep(peer_latency)
+        await db.delete(transaction)
+        for k, v in transaction.details.items():
+            await db.decrement(k, attribute, v)
+
+    return callback
+
+
+def fill(db, processor, messages):
+    attribute, model = PROCESSORS[processor]
+    db.redis.flushdb()
+    setattr(model, attribute, messages)
+    db.save(model)
+
+    transactions = [
+        Transaction(str(uuid.uuid4()), TransactionStatus.SUCCESS, {model.id: 1})
+        for _ in range(messages)
+    ]
+    db.save_all(transactions)
+
+    pipe = db.redis.pipeline(transaction=False)
+    for transaction in transactions:
+        pipe.xadd(STREAM_KEY, {"tid": transaction.id})
+    pipe.execute()
+    return attribute
+
+
+def run(db, processor, batch_size, messages, peer_latency):
+    attribute = fill(db, processor, messages)
+    consumer = RedisStreamConsumer(
+        db.redis, STREAM_KEY, CONSUMER_GROUP, "bench", batch_size=batch_size
+    )
+
+    callback = make_callback(db, attribute, peer_latency)
+    t0 = time.perf_counter()
+    while consumer.consume_batch(callback):
+        pass
+    elapsed = time.perf_counter() - t0
+
+    assert db.redis.xlen(STREAM_KEY) == 0
+    print(f"{processor:8s} batch {batch_size:4d} {messages / elapsed:9.0f} msg/s")
+
+
+async def run_async(db, processor, batch_size, concurrency, args):
+    attribute = fill(db, processor, args.messages)
+    # redis.asyncio connections belong to one event loop, so one client per run
+    async_db = AsyncRedisClient(**db_config(args))
+    consumer = AsyncRedisStreamConsumer(
+        async_db.redis,
+        STREAM_KEY,
+        CONSUMER_GROUP,
+        "bench",
+        batch_size=batch_size,
+        concurrency=concurrency,
+    )
+    await consumer._ensure_consumer_group_exists()
+
+    callback = make_async_callback(async_db, attribute, args.peer_latency_ms / 1000)
+    t0 = time.perf_counter()
+    while await consumer.consume_batch(callback):
+        pass
+    await consumer.drain()
+    elapsed = time.perf_counter() - t0
+    await async_db.close()
+
+    assert db.redis.xlen(STREAM_KEY) == 0
+    print(
+        f"{processor:8s} batch {batch_size:4d} async x{concurrency:<4d}"
+        f" {args.messages / elapsed:9.0f} msg/s"
+    )
+
+
+def db_config(args):
+    return dict(host=args.host, port=args.port, password=args.password, db=args.db)
+
+
+def main(args):
+    db = RedisClient(**db_config(args))
+
+    print(
+        f"{args.messages} entries per run, peer latency {args.peer_latency_ms} ms"
+    )
+    for processor in PROCESSORS:
+        for batch_size in args.batch_sizes:
+            run(db, processor, batch_size, args.messages, args.peer_latency_ms / 1000)
+        for concurrency in args.concurrency:
+            asyncio.run(
+                run_async(db, processor, max(args.batch_sizes), concurrency, args)
+            )
+
+    db.redis.flushdb()
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 500]
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--peer-latency-ms", type=float, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,124 @@
+"""
+ModelCodec, on its own and through both Redis layouts, against the
+DatabaseClient serialization it replaces.
+
+The round trips need a scratch Redis master, which is FLUSHED:
+
+    redis-server --port 6380 --daemonize yes
+    REDIS_TEST=localhost:6380 python -m unittest test_codec
+"""
+
+import os
+import sys
+import unittest
+import uuid
+from dataclasses import fields
+
+import redis
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+
+from database import RedisClient, RedisHashClient  # noqa: E402
+from database.codec import ModelCodec, codec_for  # noqa: E402
+from models import Order, Stock, Transaction, TransactionStatus, User  # noqa: E402
+
+REDIS_TEST = os.environ.get("REDIS_TEST", "localhost:6380")
+
+MODELS = [
+    Order(id="o", paid=2, items=["i1:3", "i2:1"], user_id="u", total_cost=40),
+    Stock(id="s", stock=7, price=3, committed_stock=5),
+    User(id="u", credit=100),
+    Transaction(
+        id="t",
+        status=TransactionStatus.STALE,
+        details={"i1": 3},
+        created_at=1700000000,
+        locked=True,
+    ),
+]
+
+
+class TestModelCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        for model in MODELS:
+            codec = codec_for(type(model))
+            self.assertEqual(codec.decode(model.id, codec.encode(model)), model)
+
+    def test_matches_database_client(self):
+        # The serialization every client used before the codec
+        client = RedisClient.__new__(RedisClient)
+        for model in MODELS:
+            codec = codec_for(type(model))
+            model_fields = [f for f in fields(model) if f.name != "id"]
+            values = codec.encode(model)
+            for f, value in zip(model_fields, values):
+                field_type = type(model).__annotations__[f.name]
+                expected = client._serialize_value(getattr(model, f.name), field_type)
+                self.assertEqual(value, expected)
+                self.assertEqual(
+                    codec.decode_attr(f.name, value),
+                    client._deserialize_value(value, field_type),
+                )
+
+    def test_defaults(self):
+        codec = codec_for(Transaction)
+        values = [None] * len(codec.names)
+        values[codec.index["status"]] = "0"
+
+        transaction = codec.decode("t", values)
+        self.assertEqual(transaction.status, TransactionStatus.PENDING)
+        self.assertEqual(transaction.details, {})
+        self.assertFalse(transaction.locked)
+        self.assertIsNone(codec.decode_attr("status", None))
+        self.assertFalse(codec.decode_attr("locked", None))
+
+    def test_missing_required_field(self):
+        codec = codec_for(Stock)
+        self.assertIsNone(codec.decode("s", [None, "3", "0"]))
+
+    def test_attributes(self):
+        codec = codec_for(Transaction)
+        self.assertEqual(codec.names, ["status", "details", "created_at", "locked"])
+        self.assertEqual(codec.extras, ["pending_count", "peer_status"])
+        self.assertEqual(codec.encode_attr("status", TransactionStatus.SUCCESS), "2")
+        self.assertEqual(codec.encode_attr("details", {"a": 1}), '{"a": 1}')
+        # Attributes that are not fields are passed through as they are
+        self.assertEqual(codec.encode_attr("pending_count", 3), "3")
+        self.assertEqual(codec.decode_attr("pending_count", "3"), "3")
+
+    def test_compiled_once(self):
+        self.assertIs(codec_for(Stock), codec_for(Stock))
+        self.assertIsNot(ModelCodec(Stock), codec_for(Stock))
+
+
+class TestCodecRoundTrip(unittest.TestCase):
+
+    def _client(self, client_class):
+        host, _, port = REDIS_TEST.partition(":")
+        db = client_class(
+            host=host,
+            port=int(port or 6379),
+            password=os.environ.get("REDIS_PASSWORD", ""),
+        )
+        self.addCleanup(db.close)
+        try:
+            db.redis.flushdb()
+        except redis.ConnectionError:
+            self.skipTest(f"No Redis master at {REDIS_TEST}")
+        return db
+
+    def test_layouts(self):
+        for client_class in (RedisClient, RedisHashClient):
+            db = self._client(client_class)
+            for model in MODELS:
+                model = type(model)(**dict(vars(model), id=str(uuid.uuid4())))
+                db.save(model)
+                self.assertEqual(db.get(model.id, type(model)), model)
+                self.assertEqual(
+                    db.get_all([model.id, "missing"], type(model)), [model, None]
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,275 @@
+"""
+Recovery of CheckoutCoordinator (SAGA_MODE=coordinated) and the invalidations
+of ItemPriceCache, with the stock and payment services replaced by stubs.
+
+Needs a scratch Redis master, which is FLUSHED:
+
+    redis-server --port 6380 --daemonize yes
+    REDIS_TEST=localhost:6380 python -m unittest test_order
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import unittest
+import uuid
+from types import SimpleNamespace
+
+import redis
+import redis.asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "order"))
+
+from coordinator import DECISIONS_KEY, CheckoutCoordinator  # noqa: E402
+from database import AsyncRedisClient  # noqa: E402
+from item_cache import ITEM_PRICES_CHANNEL, ItemPriceCache  # noqa: E402
+from models import Order, Transaction, TransactionStatus  # noqa: E402
+from proto.stock_pb2 import Item  # noqa: E402
+
+REDIS_TEST = os.environ.get("REDIS_TEST", "localhost:6380")
+TTL_MS = 60000
+
+
+class Channels:
+    """A ChannelPool that always leases the same stub"""
+
+    def __init__(self, stub):
+        self.stub = stub
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        yield self.stub
+
+
+class Participant:
+    """Stock or payment, recording the decisions sent to it"""
+
+    def __init__(self):
+        self.decisions = []
+        self.resolved = True
+
+    async def ResolveTransaction(self, decision):
+        self.decisions.append((decision.tid, decision.success))
+        return SimpleNamespace(success=self.resolved)
+
+
+class StockService:
+    """FindItem of items that all cost PRICE, held up by `gate` if set"""
+
+    PRICE = 7
+
+    def __init__(self):
+        self.requests = 0
+        self.gate = None
+
+    async def FindItem(self, request):
+        self.requests += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return Item(id=request.item_id, stock=1, price=self.PRICE)
+
+
+async def until(condition, timeout: float = 5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+async def until_empty(coordinator: CheckoutCoordinator, timeout: float = 5.0):
+    for _ in range(int(timeout / 0.01)):
+        if await coordinator.decisions.size() == 0:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Checkout still queued for recovery")
+
+
+class TestCheckoutCoordinator(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        host, _, port = REDIS_TEST.partition(":")
+        self.db = AsyncRedisClient(
+            host=host,
+            port=int(port or 6379),
+            password=os.environ.get("REDIS_PASSWORD", ""),
+        )
+        try:
+            await self.db.redis.flushdb()
+        except redis.ConnectionError:
+            await self.db.close()
+            self.skipTest(f"No Redis master at {REDIS_TEST}")
+
+        self.stock, self.payment = Participant(), Participant()
+        # Every checkout is due for recovery as soon as it begins
+        self.coordinator = CheckoutCoordinator(
+            self.db,
+            Channels(self.stock),
+            Channels(self.payment),
+            timeout_ms=0,
+            transaction_ttl_ms=TTL_MS,
+        )
+        self.order = Order(id=str(uuid.uuid4()), paid=0, items=["i:2"], total_cost=10)
+        self.transaction = Transaction(
+            str(uuid.uuid4()), TransactionStatus.PENDING, {"order_id": self.order.id}
+        )
+        await self.db.save(self.order)
+
+    async def asyncTearDown(self):
+        await self.coordinator.close()
+        await self.db.close()
+
+    async def _begin(self):
+        await self.db.save(self.transaction)
+        await self.coordinator.begin(self.transaction.id)
+
+    async def _recover(self):
+        """Run recovery until the checkout is out of the decisions queue"""
+        self.coordinator.start()
+        await until(lambda: self.stock.decisions and self.payment.decisions)
+        await until_empty(self.coordinator)
+
+    async def _status(self):
+        return await self.db.get_attr(self.transaction.id, "status", Transaction)
+
+    async def test_presumed_abort(self):
+        # The checkout handler dies before deciding
+        await self._begin()
+
+        await self._recover()
+
+        tid = self.transaction.id
+        self.assertEqual(await self._status(), TransactionStatus.FAILURE)
+        self.assertEqual(self.stock.decisions[0], (tid, False))
+        self.assertEqual(self.payment.decisions[0], (tid, False))
+        status_key = self.db._get_key(tid, "status")
+        self.assertTrue(0 < await self.db.redis.pttl(status_key) <= TTL_MS)
+
+        # Its decision arrives too late to commit
+        committed = await self.coordinator.decide(self.transaction, self.order, True)
+        self.assertFalse(committed)
+        self.assertEqual(await self.db.get_attr(self.order.id, "paid", Order), 0)
+        self.assertEqual(await self.db.get_aggregate("revenue"), 0)
+
+    async def test_decided_then_crash(self):
+        await self._begin()
+        committed = await self.coordinator.decide(self.transaction, self.order, True)
+        self.assertTrue(committed)
+
+        # The handler died before broadcasting: recovery sends the commit
+        await self._recover()
+
+        self.assertEqual(await self._status(), TransactionStatus.SUCCESS)
+        self.assertEqual(self.stock.decisions[0], (self.transaction.id, True))
+        self.assertEqual(await self.db.get_attr(self.order.id, "paid", Order), 1)
+        self.assertEqual(await self.db.get_aggregate("revenue"), 10)
+
+    async def test_redelivered_until_resolved(self):
+        self.payment.resolved = False
+        await self._begin()
+
+        self.coordinator.start()
+        await until(lambda: len(self.payment.decisions) >= 2)
+        self.assertEqual(await self.coordinator.decisions.size(), 1)
+
+        self.payment.resolved = True
+        await until_empty(self.coordinator)
+        self.assertEqual(await self._status(), TransactionStatus.FAILURE)
+        self.assertEqual(set(self.payment.decisions), {(self.transaction.id, False)})
+
+    async def test_forgotten_checkout(self):
+        # Registered, but its transaction expired or was never written
+        await self.coordinator.begin(self.transaction.id)
+
+        self.coordinator.start()
+        await until_empty(self.coordinator)
+
+        self.assertEqual(self.stock.decisions, [])
+        self.assertIsNone(await self._status())
+        self.assertEqual(await self.db.redis.keys(f"{DECISIONS_KEY}*"), [])
+
+
+class TestItemPriceCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.stock = StockService()
+        self.cache = ItemPriceCache(Channels(self.stock), max_size=2, ttl=60)
+
+    async def test_cached(self):
+        self.assertEqual(await self.cache.price("a"), StockService.PRICE)
+        self.assertEqual(await self.cache.price("a"), StockService.PRICE)
+        self.assertEqual(self.stock.requests, 1)
+
+    async def test_invalidated_during_fetch(self):
+        self.stock.gate = asyncio.Event()
+        fetch = asyncio.create_task(self.cache.price("a"))
+        await until(lambda: self.stock.requests == 1)
+
+        # The price changed while it was being fetched
+        self.cache.invalidate("a")
+        self.stock.gate.set()
+        self.assertEqual(await fetch, StockService.PRICE)
+
+        # The fetched price was not stored, so it is fetched again
+        await self.cache.price("a")
+        self.assertEqual(self.stock.requests, 2)
+        await self.cache.price("a")
+        self.assertEqual(self.stock.requests, 2)
+
+    async def test_invalidate(self):
+        for item_id in ("a", "b"):
+            await self.cache.price(item_id)
+
+        self.cache.invalidate("a")
+        await self.cache.price("b")
+        self.assertEqual(self.stock.requests, 2)
+        await self.cache.price("a")
+        self.assertEqual(self.stock.requests, 3)
+
+        self.cache.invalidate()
+        await self.cache.price("b")
+        self.assertEqual(self.stock.requests, 4)
+
+    async def test_ttl_and_size(self):
+        for item_id in ("a", "b", "c"):
+            await self.cache.price(item_id)
+        # "a" was the least recently used
+        await self.cache.price("a")
+        self.assertEqual(self.stock.requests, 4)
+
+        self.cache.ttl = 0
+        self.cache.invalidate()
+        await self.cache.price("a")
+        await self.cache.price("a")
+        self.assertEqual(self.stock.requests, 6)
+
+    async def test_published_invalidations(self):
+        host, _, port = REDIS_TEST.partition(":")
+        self.cache.invalidations = redis.asyncio.Redis(
+            host=host,
+            port=int(port or 6379),
+            password=os.environ.get("REDIS_PASSWORD", ""),
+            decode_responses=True,
+        )
+        try:
+            await self.cache.start()
+        except redis.ConnectionError:
+            await self.cache.invalidations.aclose()
+            self.skipTest(f"No Redis master at {REDIS_TEST}")
+        self.addAsyncCleanup(self.cache.close)
+        publisher = self.cache.invalidations
+
+        await self.cache.price("a")
+        await self.cache.price("b")
+        await publisher.publish(ITEM_PRICES_CHANNEL, "a")
+        await until(lambda: "a" not in self.cache._prices)
+        self.assertIn("b", self.cache._prices)
+
+        await publisher.publish(ITEM_PRICES_CHANNEL, "*")
+        await until(lambda: not self.cache._prices)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Transaction retention: the TTL given to a record once it is final
+(DatabaseClient.expire), and what RetentionSweeper does with the records
+left without one.
+
+Needs a scratch Redis master, which is FLUSHED:
+
+    redis-server --port 6380 --daemonize yes
+    REDIS_TEST=localhost:6380 python -m unittest test_retention
+"""
+
+import os
+import sys
+import time
+import unittest
+import uuid
+
+import redis
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+
+from database import RedisClient, RedisHashClient  # noqa: E402
+from database.retention import RetentionPolicy, RetentionSweeper  # noqa: E402
+from models import Transaction, TransactionStatus  # noqa: E402
+
+REDIS_TEST = os.environ.get("REDIS_TEST", "localhost:6380")
+TTL_MS = 60000
+ORPHAN_AGE_S = 3600
+
+
+def connect(testcase: unittest.TestCase, client_class=RedisClient) -> RedisClient:
+    """The flushed test master, skipping testcase when it is not up"""
+    host, _, port = REDIS_TEST.partition(":")
+    db = client_class(
+        host=host,
+        port=int(port or 6379),
+        password=os.environ.get("REDIS_PASSWORD", ""),
+    )
+    try:
+        db.redis.flushdb()
+    except redis.ConnectionError:
+        testcase.skipTest(f"No Redis master at {REDIS_TEST}")
+    return db
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.db = connect(self)
+        self.unresolved = {}
+        self.policy = RetentionPolicy(
+            Transaction,
+            "status",
+            ttl_ms=TTL_MS,
+            orphan_age_s=ORPHAN_AGE_S,
+            final=(str(TransactionStatus.FAILURE), str(TransactionStatus.STALE)),
+            unresolved=self.unresolved.update,
+        )
+        self.sweeper = RetentionSweeper(self.db, [self.policy], batch_size=2)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _transaction(self, status: TransactionStatus, age_s: float = 0) -> str:
+        tid = str(uuid.uuid4())
+        created_at = int(time.time() - age_s)
+        self.db.save(Transaction(tid, status, {"i": 1}, created_at=created_at))
+        self.db.increment(tid, "pending_count", 1)
+        return tid
+
+    def _ttls(self, tid: str):
+        """TTLs of the keys of the record that exist, -1 for those without"""
+        keys = self.db._record_keys(tid, Transaction)
+        return [ttl for ttl in map(self.db.redis.pttl, keys) if ttl != -2]
+
+    def test_expire_covers_the_whole_record(self):
+        tid = self._transaction(TransactionStatus.SUCCESS)
+        self.assertEqual(set(self._ttls(tid)), {-1})
+
+        self.db.expire(tid, TTL_MS, Transaction)
+
+        for ttl in self._ttls(tid):
+            self.assertTrue(0 < ttl <= TTL_MS)
+
+    def test_expire_hash_layout(self):
+        db = connect(self, RedisHashClient)
+        self.addCleanup(db.close)
+        tid = str(uuid.uuid4())
+        db.save(Transaction(tid, TransactionStatus.SUCCESS, {}))
+
+        db.expire(tid, TTL_MS, Transaction)
+
+        for key in db._record_keys(tid, Transaction):
+            self.assertTrue(0 < db.redis.pttl(key) <= TTL_MS)
+
+    def test_sweep(self):
+        expiring = self._transaction(TransactionStatus.SUCCESS, ORPHAN_AGE_S * 2)
+        self.db.expire(expiring, TTL_MS, Transaction)
+        recent = self._transaction(TransactionStatus.FAILURE)
+        final = self._transaction(TransactionStatus.FAILURE, ORPHAN_AGE_S * 2)
+        pending = self._transaction(TransactionStatus.PENDING, ORPHAN_AGE_S * 2)
+        undated = self._transaction(TransactionStatus.STALE)
+        self.db.redis.delete(self.db._get_key(undated, "created_at"))
+
+        self.sweeper.sweep()
+
+        # Final orphans are deleted with every key of their record
+        self.assertEqual(self._ttls(final), [])
+        # Those that still hold a reservation are handed over and kept
+        self.assertEqual(self.unresolved, {pending: str(TransactionStatus.PENDING)})
+        self.assertEqual(
+            self.db.get_attr(pending, "status", Transaction), TransactionStatus.PENDING
+        )
+        # Records without a creation time get the TTL instead
+        self.assertEqual(
+            self.db.get_attr(undated, "status", Transaction), TransactionStatus.STALE
+        )
+        self.assertTrue(all(ttl > 0 for ttl in self._ttls(undated)))
+        # Records with a TTL, and recent ones, are left alone
+        self.assertTrue(all(ttl > 0 for ttl in self._ttls(expiring)))
+        self.assertEqual(set(self._ttls(recent)), {-1})
+
+    def test_sweep_any_status_without_final(self):
+        self.policy.final = None
+        self.policy.unresolved = None
+        pending = self._transaction(TransactionStatus.PENDING, ORPHAN_AGE_S * 2)
+
+        self.sweeper.sweep()
+
+        self.assertIsNone(self.db.get_attr(pending, "status", Transaction))
+        self.assertEqual(self.db.redis.dbsize(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
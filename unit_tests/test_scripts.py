@@ -0,0 +1,208 @@
+"""
+The Lua scripts behind a reservation (RedisClient.reserve and resolve) and
+the leases of DelayedRetryQueue.
+
+Needs a scratch Redis master, which is FLUSHED:
+
+    redis-server --port 6380 --daemonize yes
+    REDIS_TEST=localhost:6380 python -m unittest test_scripts
+"""
+
+import os
+import sys
+import time
+import unittest
+import uuid
+
+import redis
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+
+from database import RedisClient, ReserveResult  # noqa: E402
+from database.stream import DelayedRetryQueue  # noqa: E402
+from models import Stock, Transaction, TransactionStatus  # noqa: E402
+from saga import resolution  # noqa: E402
+
+REDIS_TEST = os.environ.get("REDIS_TEST", "localhost:6380")
+STREAM_KEY = "transactions"
+STOCK = 10
+
+
+def connect(testcase: unittest.TestCase) -> RedisClient:
+    """The flushed test master, skipping testcase when it is not up"""
+    host, _, port = REDIS_TEST.partition(":")
+    db = RedisClient(
+        host=host,
+        port=int(port or 6379),
+        password=os.environ.get("REDIS_PASSWORD", ""),
+    )
+    try:
+        db.redis.flushdb()
+    except redis.ConnectionError:
+        testcase.skipTest(f"No Redis master at {REDIS_TEST}")
+    return db
+
+
+class TestReserveScripts(unittest.TestCase):
+
+    def setUp(self):
+        self.db = connect(self)
+        self.item = str(uuid.uuid4())
+        self.db.save(Stock(id=self.item, stock=STOCK, committed_stock=STOCK, price=1))
+        self.transaction = Transaction(
+            str(uuid.uuid4()), TransactionStatus.PENDING, {self.item: 3}
+        )
+
+    def tearDown(self):
+        self.db.close()
+
+    def _reserve(self, amount: int = 3) -> ReserveResult:
+        return self.db.reserve(
+            self.transaction, {self.item: amount}, "stock", STREAM_KEY
+        )
+
+    def _status(self):
+        return self.db.get_attr(self.transaction.id, "status", Transaction)
+
+    def _stock(self):
+        return [
+            self.db.get_attr(self.item, attribute, Stock)
+            for attribute in ("stock", "committed_stock")
+        ]
+
+    def _resolve(self, commit: bool) -> bool:
+        transaction = self.db.get(self.transaction.id, Transaction)
+        self.assertTrue(
+            self.db.compare_and_set(transaction.id, "locked", False, True)
+        )
+        return self.db.resolve(transaction, *resolution(transaction, "stock", commit))
+
+    def test_reserve(self):
+        self.assertEqual(self._reserve(), ReserveResult.OK)
+
+        self.assertEqual(self._stock(), [STOCK - 3, STOCK])
+        self.assertEqual(self._status(), TransactionStatus.SUCCESS)
+        self.assertEqual(self.db.get_aggregate("stock"), STOCK - 3)
+        entries = self.db.redis.xrange(STREAM_KEY)
+        self.assertEqual([data for _, data in entries], [{"tid": self.transaction.id}])
+
+    def test_reserve_insufficient(self):
+        self.assertEqual(self._reserve(STOCK + 1), ReserveResult.INSUFFICIENT)
+
+        self.assertEqual(self._stock(), [STOCK, STOCK])
+        self.assertEqual(self._status(), TransactionStatus.FAILURE)
+        self.assertEqual(self.db.get_aggregate("stock"), STOCK)
+
+    def test_reserve_stale(self):
+        # An abort overtook the reservation (see saga.resolve_decision)
+        self.db.set_attr_if_absent(
+            self.transaction.id, "status", TransactionStatus.STALE, Transaction
+        )
+
+        self.assertEqual(self._reserve(), ReserveResult.STALE)
+        self.assertEqual(ReserveResult.STALE.value, -2)
+
+        self.assertEqual(self._stock(), [STOCK, STOCK])
+        self.assertEqual(self._status(), TransactionStatus.STALE)
+        self.assertEqual(self.db.redis.xlen(STREAM_KEY), 0)
+
+    def test_resolve_commit(self):
+        self._reserve()
+
+        self.assertTrue(self._resolve(commit=True))
+
+        self.assertEqual(self._stock(), [STOCK - 3, STOCK - 3])
+        self.assertIsNone(self._status())
+
+    def test_resolve_rollback(self):
+        self._reserve()
+
+        self.assertTrue(self._resolve(commit=False))
+
+        self.assertEqual(self._stock(), [STOCK, STOCK])
+        self.assertEqual(self.db.get_aggregate("stock"), STOCK)
+        self.assertIsNone(self._status())
+
+    def test_resolve_needs_lock_and_status(self):
+        self._reserve()
+        transaction = self.db.get(self.transaction.id, Transaction)
+        changes, attribute = resolution(transaction, "stock", False)
+
+        # Not locked by the caller
+        self.assertFalse(self.db.resolve(transaction, changes, attribute))
+
+        # Locked, but the status changed since it was read
+        self.db.compare_and_set(transaction.id, "locked", False, True)
+        transaction.status = TransactionStatus.FAILURE
+        self.assertFalse(self.db.resolve(transaction, changes, attribute))
+        self.assertEqual(self._stock(), [STOCK - 3, STOCK])
+
+        # Resolving twice gives the stock back once
+        transaction.status = TransactionStatus.SUCCESS
+        self.assertTrue(self.db.resolve(transaction, changes, attribute))
+        self.assertFalse(self.db.resolve(transaction, changes, attribute))
+        self.assertEqual(self._stock(), [STOCK, STOCK])
+
+
+class TestDelayedRetryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.db = connect(self)
+        # Every entry is due as soon as it is scheduled
+        self.queue = DelayedRetryQueue(
+            self.db.redis, STREAM_KEY, base_ms=0, max_ms=1000
+        )
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_schedule_counts_attempts(self):
+        self.assertEqual(self.queue.schedule(tid="t1"), 1)
+        self.assertEqual(self.queue.schedule(tid="t1"), 2)
+        self.assertEqual(self.queue.size(), 1)
+
+    def test_leased_entry_is_not_due_again(self):
+        self.queue.schedule(tid="t1")
+
+        entries, next_due, lease = self.queue.pop_due(10)
+        self.assertEqual(entries, [{"tid": "t1"}])
+        self.assertEqual(next_due, lease)
+
+        # Still in the queue until it is acked, but not due before the lease ends
+        self.assertEqual(self.queue.pop_due(10)[0], [])
+        self.assertEqual(self.queue.size(), 1)
+
+        self.queue.ack([(lease, {"tid": "t1"})])
+        self.assertEqual(self.queue.size(), 0)
+        self.assertEqual(self.queue.schedule(tid="t1"), 1)
+
+    def test_expired_lease_is_due_again(self):
+        self.queue.lease_ms = 0
+        self.queue.schedule(tid="t1")
+
+        _, _, lease = self.queue.pop_due(10)
+        time.sleep(0.01)
+        # The consumer died without acking
+        entries, _, second_lease = self.queue.pop_due(10)
+        self.assertEqual(entries, [{"tid": "t1"}])
+
+        # The first consumer's ack comes too late to drop the new lease
+        self.queue.ack([(lease, {"tid": "t1"})])
+        self.assertEqual(self.queue.size(), 1)
+        self.queue.ack([(second_lease, {"tid": "t1"})])
+        self.assertEqual(self.queue.size(), 0)
+
+    def test_ack_skips_rescheduled_entry(self):
+        self.queue.schedule(tid="t1")
+        _, _, lease = self.queue.pop_due(10)
+
+        # Processing failed and the entry was scheduled again
+        self.assertEqual(self.queue.schedule(tid="t1"), 2)
+        self.queue.ack([(lease, {"tid": "t1"})])
+
+        self.assertEqual(self.queue.size(), 1)
+        self.assertEqual(self.queue.pop_due(10)[0], [{"tid": "t1"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+"""
+Crash cases of the multi-shard reservation protocol of ShardedRedisClient:
+the items of a tid are held on their shards, the transaction is finished on
+its own shard, then the holds are settled, and release_orphaned_holds
+settles what a crashed caller left behind. Also covers counters split over
+both masters with shard_counter.
+
+Needs two scratch Redis masters, which are FLUSHED:
+
+    redis-server --port 6380 --daemonize yes
+    redis-server --port 6381 --daemonize yes
+    REDIS_TEST_SHARDS=localhost:6380,localhost:6381 python -m unittest test_sharding
+"""
+
+import os
+import sys
+import unittest
+import uuid
+
+import redis
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+
+from database import RedisClient, ReserveResult  # noqa: E402
+from database.sharded import (  # noqa: E402
+    COMMITTED,
+    DECISION_KEY,
+    HOLDS_KEY,
+    ShardedRedisClient,
+    shard_configs,
+)
+from models import Stock, Transaction, TransactionStatus  # noqa: E402
+
+REDIS_TEST_SHARDS = os.environ.get(
+    "REDIS_TEST_SHARDS", "localhost:6380,localhost:6381"
+)
+STOCK = 10
+
+
+def connect(testcase: unittest.TestCase) -> ShardedRedisClient:
+    """The flushed test masters, skipping testcase when they are not up"""
+    password = os.environ.get("REDIS_PASSWORD", "")
+    redis_config = dict(password=password, port=6379, db=0)
+    shards = shard_configs(REDIS_TEST_SHARDS, redis_config)
+    # Every hold is orphaned as soon as it is placed
+    db = ShardedRedisClient(
+        {name: RedisClient(**config) for name, config in shards.items()},
+        hold_timeout_ms=0,
+    )
+    try:
+        for shard in db.shards:
+            shard.redis.flushdb()
+    except redis.ConnectionError:
+        testcase.skipTest(f"No Redis masters at {REDIS_TEST_SHARDS}")
+    return db
+
+
+class TestShardedHolds(unittest.TestCase):
+
+    def setUp(self):
+        self.db = connect(self)
+
+        self.tid = str(uuid.uuid4())
+        self.home = self.db.shard_index(self.tid)
+        # One item on the shard of the transaction, one on another shard
+        self.local = self._item_on(self.home)
+        self.away = (self.home + 1) % len(self.db.shards)
+        self.remote = self._item_on(self.away)
+        self.db.save_all(
+            [Stock(id=id, stock=STOCK, price=1) for id in (self.local, self.remote)]
+        )
+
+    def tearDown(self):
+        self.db.close()
+
+    def _item_on(self, index: int) -> str:
+        return next(
+            id
+            for id in (str(uuid.uuid4()) for _ in range(1000))
+            if self.db.shard_index(id) == index
+        )
+
+    def _hold(self, amount: int = 3):
+        """Hold amount of both items for the tid, as reserve does first"""
+        changes = {self.local: amount, self.remote: amount}
+        self.groups = self.db._place(changes, "stock", {})
+        held = self.db._hold_all(self.tid, self.groups, "stock")
+        self.assertEqual(sorted(held), sorted([self.home, self.away]))
+
+    def _finish(self, status: str) -> ReserveResult:
+        transaction = Transaction(self.tid, TransactionStatus.PENDING, {})
+        keys, values = self.db._transaction_keys(transaction)
+        return ReserveResult(self.db._finish(self.tid, keys, values, status))
+
+    def _stock(self):
+        return [self.db.get_attr(id, "stock", Stock) for id in (self.local, self.remote)]
+
+    def _holds_left(self) -> int:
+        return sum(shard.redis.zcard(HOLDS_KEY) for shard in self.db.shards)
+
+    def test_reserve_across_shards(self):
+        transaction = Transaction(self.tid, TransactionStatus.PENDING, {})
+        result = self.db.reserve(
+            transaction, {self.local: 3, self.remote: 4}, "stock", None
+        )
+
+        self.assertEqual(result, ReserveResult.OK)
+        self.assertEqual(self._stock(), [STOCK - 3, STOCK - 4])
+        self.assertEqual(self._holds_left(), 0)
+        self.assertEqual(self.db.get_aggregate("stock"), 2 * STOCK - 7)
+
+    def test_crash_before_finish(self):
+        self._hold()
+        self.assertEqual(self._stock(), [STOCK - 3, STOCK - 3])
+
+        # The caller died before writing the transaction: the sweeper gives
+        # the held stock back and records the abort
+        self.assertEqual(self.db.release_orphaned_holds(), 2)
+
+        self.assertEqual(self._stock(), [STOCK, STOCK])
+        self.assertEqual(self._holds_left(), 0)
+        self.assertEqual(self.db.get_aggregate("stock"), 2 * STOCK)
+        self.assertIsNone(self.db.get_attr(self.tid, "status", Transaction))
+
+    def test_finish_committed_then_crash(self):
+        self._hold()
+        self.assertEqual(self._finish(COMMITTED), ReserveResult.OK)
+
+        # The caller died before settling: the holds are dropped, the stock
+        # stays taken
+        self.assertEqual(self.db.release_orphaned_holds(), 2)
+
+        self.assertEqual(self._stock(), [STOCK - 3, STOCK - 3])
+        self.assertEqual(self._holds_left(), 0)
+        self.assertEqual(self.db.get_aggregate("stock"), 2 * STOCK - 6)
+        self.assertEqual(
+            self.db.get_attr(self.tid, "status", Transaction),
+            TransactionStatus.SUCCESS,
+        )
+        # Sweeping again finds nothing to settle
+        self.assertEqual(self.db.release_orphaned_holds(), 0)
+
+    def test_sweeper_races_late_finish(self):
+        self._hold()
+
+        # The sweeper gives up on the holds while the caller is still alive
+        self.assertEqual(self.db.release_orphaned_holds(), 2)
+        self.assertEqual(self._stock(), [STOCK, STOCK])
+
+        # Its finish arrives late and is refused, so the transaction never
+        # commits stock that was already given back
+        self.assertEqual(self._finish(COMMITTED), ReserveResult.STALE)
+        self.assertIsNone(self.db.get_attr(self.tid, "status", Transaction))
+        self.assertNotEqual(
+            self.db.shard_for(self.tid).redis.get(DECISION_KEY.format(self.tid)),
+            COMMITTED,
+        )
+
+        # The caller then releases its holds, which were already settled
+        for index in (self.home, self.away):
+            self.db._settle(index, self.tid, True, list(self.groups[index]))
+
+        self.assertEqual(self._stock(), [STOCK, STOCK])
+        self.assertEqual(self._holds_left(), 0)
+        self.assertEqual(self.db.get_aggregate("stock"), 2 * STOCK)
+
+
+class TestShardedCounters(unittest.TestCase):
+
+    def setUp(self):
+        self.db = connect(self)
+        self.id = str(uuid.uuid4())
+        self.db.save(Stock(id=self.id, stock=STOCK, price=1))
+        self.assertEqual(self.db.shard_counter(self.id, "stock", 2), STOCK)
+        self.subs = self.db._sub_counters(self.id, "stock", 2)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _values(self):
+        return [int(self.db.shards[index].redis.get(key)) for index, key in self.subs]
+
+    def _set(self, values):
+        for (index, key), value in zip(self.subs, values):
+            self.db.shards[index].redis.set(key, value)
+
+    def _reserve(self, amount: int) -> ReserveResult:
+        transaction = Transaction(str(uuid.uuid4()), TransactionStatus.PENDING, {})
+        return self.db.reserve(transaction, {self.id: amount}, "stock", None)
+
+    def test_sub_counters_on_both_masters(self):
+        self.assertEqual(sorted(index for index, _ in self.subs), [0, 1])
+        self.assertEqual(self.subs[0][0], self.db.shard_index(self.id))
+        self.assertEqual(self._values(), [STOCK // 2, STOCK // 2])
+        self.assertEqual(self.db.get_aggregate("stock"), STOCK)
+
+        with self.assertRaises(ValueError):
+            self.db.shard_counter(self.id, "stock", 1)
+        with self.assertRaises(ValueError):
+            self.db.shard_counter(self.id, "stock", 3)
+
+    def test_dry_sub_counter_falls_back(self):
+        # Whichever sub-counter is picked, one of them cannot cover 3
+        self._set([1, 4])
+        self.assertEqual(self._reserve(3), ReserveResult.OK)
+        self.assertEqual(sorted(self._values()), [1, 1])
+
+        self.assertEqual(self._reserve(3), ReserveResult.INSUFFICIENT)
+        self.assertEqual(sorted(self._values()), [1, 1])
+        self.assertEqual(self._reserve(2), ReserveResult.OK)
+        self.assertEqual(self._values(), [0, 0])
+        self.assertEqual(self.db.get_counter(self.id, "stock"), 0)
+
+    def test_rebalance_crash(self):
+        index, key = self.subs[1]
+        self.db.shards[index].redis.set(key, 0)
+        self.db.shards[index].redis.decrby("aggregate:stock", STOCK // 2)
+        moves = self.db._even_out(self.subs, self._values())
+        tid = str(uuid.uuid4())
+
+        # Crashed before deciding: the sweeper gives the taken stock back
+        self.db._hold_all(tid, moves, "stock")
+        self.assertEqual(self._values(), [STOCK // 4 + 1, 0])
+        self.assertEqual(self.db.release_orphaned_holds(), 2)
+        self.assertEqual(self._values(), [STOCK // 2, 0])
+
+        # Crashed after committing: the sweeper hands out the credits
+        tid = str(uuid.uuid4())
+        self.db._hold_all(tid, moves, "stock")
+        self.assertTrue(self.db._decide(tid, COMMITTED))
+        self.assertEqual(self.db.release_orphaned_holds(), 2)
+        self.assertEqual(self._values(), [STOCK // 4 + 1, STOCK // 4])
+        self.assertEqual(self.db.get_aggregate("stock"), STOCK // 2)
+        self.assertEqual(self.db.release_orphaned_holds(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()